@@ -1,33 +1,18 @@
 # ---------- Imports ----------
 import tkinter as tk
 from tkinter import messagebox
-import pickle
-import os
 
-from user import Fan, Admin           # Custom user classes
+from user import Fan                  # Custom user classes
 from ticket import Ticket             # Custom ticket class
-from ticket_system import TicketSystem  # Booking and admin logic
-
-# ---------- Utility Functions ----------
-def save_data(filename, data):
-    """Save data to a pickle file."""
-    with open(filename, 'wb') as f:
-        pickle.dump(data, f)
-
-def load_data(filename):
-    """Load data from a pickle file if it exists."""
-    return pickle.load(open(filename, 'rb')) if os.path.exists(filename) else []
-
-# ---------- Load Stored Data ----------
-users = load_data('users.pkl')        # List of Fan and Admin users
-tickets = load_data('tickets.pkl')    # List of available tickets
-bookings = load_data('bookings.pkl')  # List of all bookings made
+from storage import open_system       # Pickle files/SQLite, or the booking server if GRANDPRIX_SERVER is set
+import metrics                        # Latency histograms of the screens, written when GRANDPRIX_METRICS is set
+import profiling                      # Profiles of slow callbacks, with --profile or GRANDPRIX_PROFILE
+from booking_writer import BookingWriter  # Saves bookings on a background thread
+from virtual_list import VirtualList  # Scrolling list that only draws the rows on screen
 
 # ---------- Initialize Ticket System ----------
-system = TicketSystem()
-system._users = users
-system._tickets = tickets
-system._bookings = bookings
+system = open_system(lazy=True)  # Users and tickets load when first needed, bookings in the background
+writer = BookingWriter(system)   # Saves bookings in one write per burst, so the window never waits for the disk
 
 # ---------- Main GUI Application ----------
 class GrandPrixSystem(tk.Tk):
@@ -37,6 +22,13 @@ class GrandPrixSystem(tk.Tk):
         self.geometry("600x650")
         self.current_user = None  # Stores currently logged-in Fan
         self.init_main_menu()     # Launch with main menu
+        self.after(100, system.load_in_background)  # Load the bookings once the window is up
+        self.protocol("WM_DELETE_WINDOW", self.close)  # Save any bookings still queued before closing
+
+    def close(self):
+        """Save the bookings still queued, then close the window."""
+        writer.close()
+        self.destroy()
 
     def clear_widgets(self):
         """Clear all widgets from the current window/frame."""
@@ -76,19 +68,17 @@ class GrandPrixSystem(tk.Tk):
         tk.Button(self, text="Register", command=self.register_fan).pack(pady=5)
         tk.Button(self, text="Back", command=self.init_main_menu).pack()
 
+    @metrics.timed("test_system_register_fan")
     def register_fan(self):
         """Register a new fan if the ID is not taken."""
         uid, name, email = self.reg_id_entry.get(), self.reg_name_entry.get(), self.reg_email_entry.get()
 
-        # Check for duplicate ID
-        if any(u.get_user_id() == uid for u in users):
-            messagebox.showerror("Error", "User ID already exists.")
+        # Create and save new fan (the system rejects a duplicate ID)
+        try:
+            system.register_user(Fan(uid, name, email))
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
             return
-
-        # Create and save new fan
-        new_fan = Fan(uid, name, email)
-        users.append(new_fan)
-        save_data('users.pkl', users)
         messagebox.showinfo("Success", "Fan account created.")
         self.init_main_menu()
 
@@ -105,10 +95,11 @@ class GrandPrixSystem(tk.Tk):
         tk.Button(self, text="Login", command=self.login_fan).pack(pady=5)
         tk.Button(self, text="Back", command=self.init_main_menu).pack()
 
+    @metrics.timed("test_system_login_fan")
     def login_fan(self):
         """Check fan login credentials and open fan dashboard."""
         uid = self.fan_login_entry.get()
-        matched = next((u for u in users if isinstance(u, Fan) and u.get_user_id() == uid), None)
+        matched = system.get_fan(uid)
         if matched:
             self.current_user = matched
             self.init_fan_dashboard()
@@ -116,13 +107,15 @@ class GrandPrixSystem(tk.Tk):
             messagebox.showerror("Error", "Fan not found.")
 
     # ---------- Fan Dashboard ----------
+    @metrics.timed("test_system_init_fan_dashboard")
     def init_fan_dashboard(self):
         """Main menu for logged-in fan."""
         self.clear_widgets()
         tk.Label(self, text=f"Welcome, {self.current_user.get_name()}", font=("Arial", 16)).pack(pady=10)
 
-        # Show user details
-        tk.Label(self, text=self.current_user.view_account_details()).pack(pady=5)
+        # Show user details, counting the bookings with one row of the history instead of all of it
+        _, booking_count = system.get_booking_history_page(self.current_user, 0, 1)
+        tk.Label(self, text=self.current_user.account_details(booking_count)).pack(pady=5)
 
         # Fan options
         tk.Button(self, text="Book Ticket", command=self.init_ticket_booking).pack(pady=5)
@@ -130,27 +123,29 @@ class GrandPrixSystem(tk.Tk):
         tk.Button(self, text="Delete Account", fg="red", command=self.delete_account).pack(pady=5)
         tk.Button(self, text="Logout", command=self.init_main_menu).pack(pady=20)
 
+    @metrics.timed("test_system_view_bookings")
     def view_bookings(self):
-        """Display fan's past bookings."""
+        """Display fan's past bookings, newest first, fetching them a page at a time as the list scrolls."""
         self.clear_widgets()
         tk.Label(self, text="Your Booked Tickets", font=("Arial", 16)).pack(pady=10)
-        history = self.current_user.get_booking_history()
-        if history:
-            for b in history:
-                tk.Label(self, text=str(b), wraplength=500, justify="left").pack(anchor="w", padx=15, pady=5)
+        fan = self.current_user
+        history = VirtualList(self, lambda offset, limit: system.get_booking_history_page(fan, offset, limit),
+                              visible_rows=8, wraplength=500)
+        if history.get_total():
+            history.pack(fill="both", expand=True)
         else:
             tk.Label(self, text="No bookings found.").pack()
         tk.Button(self, text="Back", command=self.init_fan_dashboard).pack(pady=10)
 
     def delete_account(self):
         """Delete the fan account permanently."""
-        users.remove(self.current_user)
-        save_data('users.pkl', users)
+        system.delete_user(self.current_user.get_user_id())
         messagebox.showinfo("Deleted", "Account deleted.")
         self.current_user = None
         self.init_main_menu()
 
     # ---------- Ticket Booking ----------
+    @metrics.timed("test_system_init_ticket_booking")
     def init_ticket_booking(self):
         """Form for fan to choose ticket and book it."""
         self.clear_widgets()
@@ -158,14 +153,17 @@ class GrandPrixSystem(tk.Tk):
 
         # Display ticket options as radio buttons
         self.ticket_var = tk.StringVar()
-        for ticket in tickets:
+        for ticket in system.get_tickets():
             desc = (
                 f"{ticket.get_ticket_type()} - AED {ticket.get_price()}\n"
                 f"Validity: {'Single day' if 'Single' in ticket.get_ticket_type() else '3 days' if 'Weekend' in ticket.get_ticket_type() else 'All season'}\n"
                 f"Features: {'Access to main event' if 'Single' in ticket.get_ticket_type() else 'All races + Pit access' if 'Weekend' in ticket.get_ticket_type() else 'All-season VIP access'}"
             )
+            if ticket.get_capacity() is not None:
+                desc += "\nSOLD OUT" if ticket.is_sold_out() else f"\nTickets left: {ticket.get_remaining()}"
             tk.Radiobutton(self, text=desc, variable=self.ticket_var, value=ticket.get_ticket_id(),
-                           justify="left", anchor="w", wraplength=500).pack(anchor="w", padx=10, pady=5)
+                           justify="left", anchor="w", wraplength=500,
+                           state="disabled" if ticket.is_sold_out() else "normal").pack(anchor="w", padx=10, pady=5)
 
         # Quantity and payment input
         tk.Label(self, text="Quantity:").pack()
@@ -176,10 +174,24 @@ class GrandPrixSystem(tk.Tk):
         self.payment_var = tk.StringVar()
         tk.OptionMenu(self, self.payment_var, "Credit Card", "Debit Card", "Digital Wallet").pack()
 
+        tk.Label(self, text="Promo Code (optional):").pack()
+        self.promo_entry = tk.Entry(self)
+        self.promo_entry.pack()
+
+        # Live total, updated as the form is filled in
+        self.total_label = tk.Label(self, text="", justify="left")
+        self.total_label.pack(pady=5)
+        self.quantity_entry.bind("<KeyRelease>", lambda event: self.update_total())
+        self.promo_entry.bind("<KeyRelease>", lambda event: self.update_total())
+        self.ticket_var.trace_add("write", lambda *args: self.update_total())
+        self.payment_var.trace_add("write", lambda *args: self.update_total())
+
         # Book ticket
-        tk.Button(self, text="Confirm Booking", command=self.book_ticket).pack(pady=10)
+        self.book_button = tk.Button(self, text="Confirm Booking", command=self.book_ticket)
+        self.book_button.pack(pady=10)
         tk.Button(self, text="Back", command=self.init_fan_dashboard).pack()
 
+    @metrics.timed("test_system_book_ticket")
     def book_ticket(self):
         """Confirm and process ticket booking."""
         ticket_id = self.ticket_var.get()
@@ -189,15 +201,41 @@ class GrandPrixSystem(tk.Tk):
             if not payment:
                 messagebox.showerror("Error", "Please select a payment method.")
                 return
-            booking = system.book_ticket(self.current_user, ticket_id, quantity, payment)
-            bookings.append(booking)
-            save_data('bookings.pkl', bookings)
-            save_data('users.pkl', users)
-            messagebox.showinfo("Success", "Ticket booked successfully!")
-            self.init_fan_dashboard()
+            future = writer.submit(self.current_user, ticket_id, quantity, payment,
+                                   self.promo_entry.get())  # Saved by the writer thread
+            self.book_button.config(state="disabled")  # One booking at a time
+            self.after(50, self.wait_for_booking, future)
         except ValueError as e:
             messagebox.showerror("Error", str(e))
 
+    def wait_for_booking(self, future):
+        """Check back every 50 ms until the booking is saved, then confirm it (or show why it failed)."""
+        if not future.done():
+            self.after(50, self.wait_for_booking, future)
+            return
+        try:
+            future.result()
+        except Exception as e:  # Whatever went wrong, the form must be usable again
+            if self.book_button.winfo_exists():
+                self.book_button.config(state="normal")
+            messagebox.showerror("Error", str(e))
+            return
+        messagebox.showinfo("Success", "Ticket booked successfully!")
+        self.init_fan_dashboard()
+
+    def update_total(self):
+        """Show the price of the booking as the form is filled in."""
+        quantity = self.quantity_entry.get().strip()
+        if not self.ticket_var.get() or not quantity.isdigit():
+            self.total_label.config(text="")  # Not filled in yet
+            return
+        try:
+            quote = system.quote(self.ticket_var.get(), int(quantity), self.payment_var.get() or None,
+                                 self.promo_entry.get())
+            self.total_label.config(text=str(quote))
+        except ValueError as e:
+            self.total_label.config(text=str(e))  # e.g. an unknown or expired promo code
+
     # ---------- Admin Login ----------
     def init_admin_login(self):
         """Form for admin login."""
@@ -211,25 +249,38 @@ class GrandPrixSystem(tk.Tk):
         tk.Button(self, text="Login", command=self.login_admin).pack(pady=5)
         tk.Button(self, text="Back", command=self.init_main_menu).pack()
 
+    @metrics.timed("test_system_login_admin")
     def login_admin(self):
         """Verify admin credentials and open dashboard."""
         aid = self.admin_id_entry.get()
-        matched = next((a for a in users if isinstance(a, Admin) and a.get_user_id() == aid), None)
+        matched = system.get_admin(aid)
         if matched:
             self.init_admin_dashboard()
         else:
             messagebox.showerror("Error", "Admin not found.")
 
+    @metrics.timed("test_system_init_admin_dashboard")
     def init_admin_dashboard(self):
         """Show ticket sales breakdown to admin."""
         self.clear_widgets()
         tk.Label(self, text="Ticket Sales Overview", font=("Arial", 16)).pack(pady=10)
-        sales = system.view_ticket_sales()
-        for ticket_type, count in sales.items():
-            tk.Label(self, text=f"{ticket_type}: {count} tickets sold").pack()
+        system.refresh()  # Include sales made in other windows since this one started
+        summary = system.view_sales_summary()  # Running totals, no booking scan
+        revenue = summary.get_revenue_by_ticket_type()
+        for ticket_type, count in summary.get_quantity_by_ticket_type().items():
+            tk.Label(self, text=f"{ticket_type}: {count} tickets sold - AED {revenue[ticket_type]:.2f}").pack()
+        tk.Label(self, text=f"Total revenue: AED {summary.get_total_revenue():.2f}").pack(pady=5)
+
+        tk.Label(self, text="By Payment Method", font=("Arial", 14)).pack(pady=(10, 0))
+        for method, (count, amount) in summary.get_by_payment_method().items():
+            tk.Label(self, text=f"{method}: {count} tickets - AED {amount:.2f}").pack()
+        tk.Label(self, text="By Pricing", font=("Arial", 14)).pack(pady=(10, 0))
+        for pricing, (count, amount) in summary.get_by_pricing().items():
+            tk.Label(self, text=f"{pricing}: {count} tickets - AED {amount:.2f}").pack()
         tk.Button(self, text="Back to Main Menu", command=self.init_main_menu).pack(pady=20)
 
 # ---------- Run the Application ----------
 if __name__ == "__main__":
+    profiling.install()  # Profile slow callbacks when started with --profile (or GRANDPRIX_PROFILE set)
     app = GrandPrixSystem()
     app.mainloop()
@@ -1,30 +1,19 @@
 # Import the required modules for GUI, data storage, and file handling
 import tkinter as tk
 from tkinter import messagebox
-import pickle
-import os
 
 
 # Import the Fan and Admin classes from the user module
 from user import Fan, Admin
+from storage import open_system  # Local files/SQLite, or the booking server when GRANDPRIX_SERVER is set
+import metrics  # Latency histograms of the screens, written out when GRANDPRIX_METRICS is set
+import profiling  # Profiles of slow callbacks, with --profile or GRANDPRIX_PROFILE
+from virtual_list import VirtualList  # Scrolling list that only draws the rows on screen
 
 
-# Function to save data (e.g., user list) to a file using pickle
-def save_data(filename, data):
-  with open(filename, 'wb') as f:
-      pickle.dump(data, f)
-
-
-# Function to load data from a file using pickle, returns an empty list if file doesn't exist
-def load_data(filename):
-  if os.path.exists(filename):
-      with open(filename, 'rb') as f:
-          return pickle.load(f)
-  return []
-
-
-# Load the user data from 'users.pkl' when the program starts
-users = load_data('users.pkl')
+# Open the saved data when the program starts; users are read on the first login or ID check, and
+# bookings only if a screen needs them (the system indexes users by ID for logins and ID checks)
+system = open_system(lazy=True)
 
 
 # Define the main GUI class for account management, inheriting from Tkinter's Tk class
@@ -82,31 +71,29 @@ class AccountGUI(tk.Tk):
 
 
   # Function to register a new fan account
+  @metrics.timed("account_gui_register_fan")
   def register_fan(self):
       uid = self.reg_id_entry.get()
       name = self.reg_name_entry.get()
       email = self.reg_email_entry.get()
 
 
-      # Check if user ID already exists
-      if any(u.get_user_id() == uid for u in users):
-          messagebox.showerror("Error", "User ID already exists.")
+      # Create a new fan object; the system rejects an existing user ID and saves the new fan
+      try:
+          system.register_user(Fan(uid, name, email))
+      except ValueError as e:
+          messagebox.showerror("Error", str(e))
           return
-
-
-      # Create a new fan object and save it
-      new_fan = Fan(uid, name, email)
-      users.append(new_fan)
-      save_data('users.pkl', users)
       messagebox.showinfo("Success", "Fan account created.")
       self.init_login_screen()  # Go back to login after registration
 
 
   # Function to log in a user
+  @metrics.timed("account_gui_login_user")
   def login_user(self):
       uid = self.user_id_entry.get()
-      # Search for the user by ID
-      matched = next((u for u in users if u.get_user_id() == uid), None)
+      # Look up the user in the system's user index
+      matched = system.get_user(uid)
 
 
       if matched:
@@ -117,23 +104,24 @@ class AccountGUI(tk.Tk):
 
 
   # Function to display account dashboard after login
+  @metrics.timed("account_gui_init_account_dashboard")
   def init_account_dashboard(self):
       self.clear_widgets()
       # Welcome message
       tk.Label(self, text=f"Welcome {self.current_user.get_name()}", font=("Arial", 16)).pack(pady=10)
 
 
-      # Show user account details
-      tk.Label(self, text=self.current_user.view_account_details(), font=("Arial", 12)).pack(pady=5)
-
-
       # Show ticket booking history only for Fan users
       if isinstance(self.current_user, Fan):
-          bookings = self.current_user.get_booking_history()
-          if bookings:
+          # Newest first, fetched a page at a time as the list scrolls. The first page brings the
+          # number of bookings for the account details, so the whole history is never loaded.
+          fan = self.current_user
+          bookings = VirtualList(self, lambda offset, limit: system.get_booking_history_page(fan, offset, limit),
+                                 visible_rows=5, wraplength=450)
+          tk.Label(self, text=fan.account_details(bookings.get_total()), font=("Arial", 12)).pack(pady=5)
+          if bookings.get_total():
               tk.Label(self, text="Your Booked Tickets:", font=("Arial", 14)).pack(pady=10)
-              for booking in bookings:
-                  tk.Label(self, text=str(booking), wraplength=480, justify="left", anchor="w").pack(anchor="w", padx=15, pady=5)
+              bookings.pack(fill="x")
           else:
               tk.Label(self, text="No tickets booked yet.").pack(pady=10)
 
@@ -144,9 +132,9 @@ class AccountGUI(tk.Tk):
 
 
   # Function to delete the current user account
+  @metrics.timed("account_gui_delete_account")
   def delete_account(self):
-      users.remove(self.current_user)  # Remove user from list
-      save_data('users.pkl', users)  # Save updated list
+      system.delete_user(self.current_user.get_user_id())  # Remove and save through the system
       messagebox.showinfo("Deleted", "Your account has been deleted.")
       self.current_user = None
       self.init_login_screen()  # Return to login screen
@@ -160,5 +148,6 @@ class AccountGUI(tk.Tk):
 
 # Run the application if this file is executed directly
 if __name__ == "__main__":
+  profiling.install()  # Profile slow callbacks when started with --profile (or GRANDPRIX_PROFILE set)
   app = AccountGUI()
   app.mainloop()
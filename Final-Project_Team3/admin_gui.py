@@ -1,42 +1,23 @@
 # ---------- Imports ----------
 import tkinter as tk  # Tkinter for GUI
 from tkinter import messagebox  # For displaying error/info pop-ups
-import pickle  # For saving/loading Python objects
-import os  # For checking file existence
+from datetime import datetime, timedelta
 
 
 # Import classes needed for admin and ticket system functionality
-from user import Admin
-from ticket_system import TicketSystem
-
-
-
-
-# ---------- Utility Functions ----------
-# Function to load data from a file if it exists
-def load_data(filename):
-  if os.path.exists(filename):
-      with open(filename, 'rb') as f:
-          return pickle.load(f)
-  return []  # Return empty list if file doesn't exist
-
-
-
-
-# ---------- Load Existing Data ----------
-users = load_data('users.pkl')      # Load user data (including Admins)
-bookings = load_data('bookings.pkl')  # Load bookings
-tickets = load_data('tickets.pkl')    # Load available tickets
+from user import Admin, Fan
+from storage import open_system  # Local files/SQLite, or the booking server when GRANDPRIX_SERVER is set
+import metrics  # Latency histograms of the screens, written out when GRANDPRIX_METRICS is set
+import profiling  # Profiles of slow callbacks, with --profile or GRANDPRIX_PROFILE
+from virtual_list import VirtualList  # Scrolling list that only draws the rows on screen
 
 
 
 
 # ---------- Setup Ticket System ----------
-# Create and configure the system with loaded data
-system = TicketSystem()
-system._users = users
-system._bookings = bookings
-system._tickets = tickets
+# Create the system on the configured store (or connect to the booking server). Nothing is read yet:
+# checking an admin ID needs only the users, and the bookings for the dashboard load in the background.
+system = open_system(lazy=True)
 
 
 
@@ -46,8 +27,9 @@ class AdminGUI(tk.Tk):
   def __init__(self):
       super().__init__()  # Initialize parent class
       self.title("Admin Dashboard - Ticket Sales")  # Window title
-      self.geometry("550x400")  # Window size
+      self.geometry("550x600")  # Window size
       self.init_login_screen()  # Show login screen initially
+      self.after(100, system.load_in_background)  # Load the bookings once the window is up
 
 
   # Display login screen for admin
@@ -60,10 +42,11 @@ class AdminGUI(tk.Tk):
 
 
   # Validate entered admin ID
+  @metrics.timed("admin_gui_validate_admin")
   def validate_admin(self):
       aid = self.admin_id_entry.get()
-      # Find matching Admin object by user ID
-      matched = next((a for a in users if isinstance(a, Admin) and a.get_user_id() == aid), None)
+      # Look up the Admin object in the system's user index
+      matched = system.get_admin(aid)
       if matched:
           self.init_dashboard()  # If valid, go to dashboard
       else:
@@ -71,20 +54,161 @@ class AdminGUI(tk.Tk):
 
 
   # Display admin dashboard with ticket sales stats
+  @metrics.timed("admin_gui_init_dashboard")
   def init_dashboard(self):
       self.clear_widgets()  # Clear old screen
       tk.Label(self, text="Ticket Sales Overview", font=("Arial", 16)).pack(pady=10)
 
 
-      sales = system.view_ticket_sales()  # Get ticket sales summary from system
+      system.refresh()  # Include sales made in the other GUIs since this one started
+      summary = system.view_sales_summary()  # Running totals kept by the system (no booking scan)
+      revenue = summary.get_revenue_by_ticket_type()
 
 
       # Display sales summary by ticket type
-      for ticket_type, count in sales.items():
-          tk.Label(self, text=f"{ticket_type}: {count} tickets sold").pack()
-
-
-      tk.Button(self, text="Exit", command=self.quit).pack(pady=20)  # Exit button
+      for ticket_type, count in summary.get_quantity_by_ticket_type().items():
+          tk.Label(self, text=f"{ticket_type}: {count} tickets sold - AED {revenue[ticket_type]:.2f}").pack()
+      tk.Label(self, text=f"Total revenue: AED {summary.get_total_revenue():.2f}", font=("Arial", 12)).pack(pady=5)
+
+
+      # Display sales by payment method and bulk discount vs full price
+      tk.Label(self, text="By Payment Method", font=("Arial", 14)).pack(pady=(10, 0))
+      for method, (count, amount) in summary.get_by_payment_method().items():
+          tk.Label(self, text=f"{method}: {count} tickets - AED {amount:.2f}").pack()
+      tk.Label(self, text="By Pricing", font=("Arial", 14)).pack(pady=(10, 0))
+      for pricing, (count, amount) in summary.get_by_pricing().items():
+          tk.Label(self, text=f"{pricing}: {count} tickets - AED {amount:.2f}").pack()
+
+
+      tk.Button(self, text="Sales Analytics", command=self.init_analytics).pack(pady=(20, 5))
+      tk.Button(self, text="Find Bookings", command=self.init_find_bookings).pack(pady=5)
+      tk.Button(self, text="Search Users", command=self.init_user_search).pack(pady=5)
+      tk.Button(self, text="Exit", command=self.quit).pack(pady=5)  # Exit button
+
+
+  # Display sales over time, revenue by ticket type and payment method, and bulk discount uptake
+  @metrics.timed("admin_gui_init_analytics")
+  def init_analytics(self):
+      self.clear_widgets()
+      tk.Label(self, text="Sales Analytics", font=("Arial", 16)).pack(pady=10)
+      system.refresh()
+      analytics = system.view_sales_analytics()  # Hourly/daily rollups kept by the system
+
+
+      # Sales velocity and the busiest hour
+      tk.Label(self, text=f"Sales velocity: {analytics.get_velocity():.1f} tickets/hour (last 24 hours)").pack()
+      peak = analytics.get_peak_hour()
+      if peak:
+          tk.Label(self, text=f"Busiest hour: {peak[0]:%Y-%m-%d %H:00} - {peak[1]} tickets").pack()
+
+
+      # Tickets and revenue for the last 7 days with sales
+      tk.Label(self, text="Recent Days", font=("Arial", 14)).pack(pady=(10, 0))
+      for day, count, amount in analytics.get_sales_by_day()[-7:]:
+          tk.Label(self, text=f"{day}: {count} tickets - AED {amount:.2f}").pack()
+
+
+      # Revenue by ticket type and payment method, and how often the bulk discount is used
+      tk.Label(self, text="Revenue by Ticket Type and Payment Method", font=("Arial", 14)).pack(pady=(10, 0))
+      by_type = {}
+      for (ticket_type, method), amount in sorted(analytics.get_revenue_by_ticket_type_and_payment().items()):
+          by_type.setdefault(ticket_type, []).append(f"{method} AED {amount:.2f}")
+      for ticket_type, amounts in by_type.items():
+          tk.Label(self, text=f"{ticket_type}: {', '.join(amounts)}", wraplength=500).pack()
+      tk.Label(self, text="Bulk Discount Uptake", font=("Arial", 14)).pack(pady=(10, 0))
+      for ticket_type, share in analytics.get_bulk_uptake().items():
+          tk.Label(self, text=f"{ticket_type}: {share:.0%} of bookings").pack()
+
+
+      tk.Button(self, text="Back", command=self.init_dashboard).pack(pady=20)
+
+
+  # Display a form for finding bookings by ticket type, payment method, dates and fan
+  @metrics.timed("admin_gui_init_find_bookings")
+  def init_find_bookings(self):
+      self.clear_widgets()
+      tk.Label(self, text="Find Bookings", font=("Arial", 16)).pack(pady=10)
+      form = tk.Frame(self)
+      form.pack()
+
+
+      # Ticket type and payment method ("Any" leaves that criterion out)
+      ticket_types = sorted({ticket.get_ticket_type() for ticket in system.get_tickets()})
+      tk.Label(form, text="Ticket Type:").grid(row=0, column=0, sticky="e")
+      self.type_var = tk.StringVar(value="Any")
+      tk.OptionMenu(form, self.type_var, "Any", *ticket_types).grid(row=0, column=1, sticky="w")
+      tk.Label(form, text="Payment Method:").grid(row=1, column=0, sticky="e")
+      self.method_var = tk.StringVar(value="Any")
+      tk.OptionMenu(form, self.method_var, "Any", "Credit Card", "Debit Card", "Digital Wallet").grid(
+          row=1, column=1, sticky="w")
+
+
+      # Date range (both days included) and fan ID, each optional
+      self.from_entry, self.to_entry, self.fan_entry = tk.Entry(form), tk.Entry(form), tk.Entry(form)
+      for row, (text, entry) in enumerate([("From (YYYY-MM-DD):", self.from_entry),
+                                           ("To (YYYY-MM-DD):", self.to_entry),
+                                           ("Fan ID:", self.fan_entry)], start=2):
+          tk.Label(form, text=text).grid(row=row, column=0, sticky="e")
+          entry.grid(row=row, column=1, sticky="w")
+
+
+      tk.Button(self, text="Search", command=self.search_bookings).pack(pady=10)
+      self.results_frame = tk.Frame(self)  # Filled in by search_bookings
+      self.results_frame.pack(fill="both", expand=True)
+      tk.Button(self, text="Back", command=self.init_dashboard).pack(pady=10)
+
+
+  # Run the query from the form and list the matching bookings, newest first
+  @metrics.timed("admin_gui_search_bookings")
+  def search_bookings(self):
+      try:
+          since = datetime.strptime(self.from_entry.get(), "%Y-%m-%d") if self.from_entry.get().strip() else None
+          to = datetime.strptime(self.to_entry.get(), "%Y-%m-%d") if self.to_entry.get().strip() else None
+      except ValueError:
+          messagebox.showerror("Error", "Please enter dates as YYYY-MM-DD.")
+          return
+      system.refresh()  # Include bookings made in the other GUIs
+      bookings = system.find_bookings(
+          ticket_type=None if self.type_var.get() == "Any" else self.type_var.get(),
+          payment_method=None if self.method_var.get() == "Any" else self.method_var.get(),
+          fan_id=self.fan_entry.get().strip() or None,
+          since=since,
+          until=to + timedelta(days=1) if to else None)
+      bookings.reverse()
+
+
+      for widget in self.results_frame.winfo_children():
+          widget.destroy()
+      tickets = sum(booking.get_quantity() for booking in bookings)
+      revenue = sum(booking.get_total_price() for booking in bookings)
+      tk.Label(self.results_frame, text=f"{len(bookings)} bookings - {tickets} tickets - AED {revenue:.2f}").pack()
+      if bookings:
+          VirtualList(self.results_frame, lambda offset, limit: (bookings[offset:offset + limit], len(bookings)),
+                      visible_rows=6).pack(fill="both", expand=True)
+
+
+  # Display a search box that lists matching users by name or email as the admin types
+  @metrics.timed("admin_gui_init_user_search")
+  def init_user_search(self):
+      self.clear_widgets()
+      tk.Label(self, text="Search Users", font=("Arial", 16)).pack(pady=10)
+      tk.Label(self, text="Name or email:").pack()
+      self.search_entry = tk.Entry(self, width=40)
+      self.search_entry.pack()
+      self.search_entry.bind("<KeyRelease>", lambda event: self.update_user_results())
+      self.search_entry.focus_set()
+      self.user_results = tk.Listbox(self, width=70, height=15)
+      self.user_results.pack(pady=10)
+      tk.Button(self, text="Back", command=self.init_dashboard).pack(pady=10)
+
+
+  # List the users matching the search box (kept up to date by the system's search index)
+  @metrics.timed("admin_gui_update_user_results")
+  def update_user_results(self):
+      self.user_results.delete(0, tk.END)
+      for user in system.search_users(self.search_entry.get()):
+          role = "Fan" if isinstance(user, Fan) else "Admin" if isinstance(user, Admin) else "User"
+          self.user_results.insert(tk.END, f"{user.get_user_id()} - {user.get_name()} <{user.get_email()}> ({role})")
 
 
   # Utility function to clear the current window widgets
@@ -97,5 +221,6 @@ class AdminGUI(tk.Tk):
 
 # ---------- Run the Application ----------
 if __name__ == "__main__":
+  profiling.install()  # Profile slow callbacks when started with --profile (or GRANDPRIX_PROFILE set)
   app = AdminGUI()  # Create instance of the admin GUI
   app.mainloop()  # Start the Tkinter event loop
@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from user import Fan
+from ticket import Ticket
+from booking import Booking
+from pricing import DEFAULT_PRICING
+from ticket_system import TicketSystem
+from booking_journal import load_data, save_data
+from benchmark_ticket_system import PAYMENT_METHODS, temp_journal
+
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)  # Pass --sizes to go up to 10_000_000
+FIRST_NAMES = ["Aisha", "Omar", "Fatima", "Lewis", "Max", "Charles", "Lando", "Mariam", "Yousef", "Sara",
+               "Carlos", "George", "Noura", "Khalid", "Hessa", "Oscar", "Daniel", "Layla", "Rashid", "Emma"]
+LAST_NAMES = ["Al Mansoori", "Hamilton", "Verstappen", "Leclerc", "Norris", "Al Nuaimi", "Sainz", "Russell",
+              "Al Suwaidi", "Piastri", "Ricciardo", "Al Ketbi", "Khan", "Smith", "Haddad"]
+TICKET_WEIGHTS = [50, 30, 5, 15]  # Single race passes sell most, season memberships least
+PAYMENT_WEIGHTS = [55, 25, 20]
+QUANTITY_WEIGHTS = [40, 30, 10, 8, 7, 3, 2]  # 1..7 tickets; 5+ get the bulk discount by default
+
+
+def make_realistic_data(num_bookings, seed=42):
+    # Generate fans, the default tickets and bookings with a realistic mix: a few keen fans book
+    # many times, most book once or twice, and bookings are spread over the months before the race
+    rng = random.Random(seed)
+    tickets = [
+        Ticket("T001", "Single Race Pass", 350),
+        Ticket("T002", "Weekend Package", 900),
+        Ticket("T003", "Season Membership", 3000),
+        Ticket("T004", "Group Discount (5+)", 320),
+    ]
+    num_fans = max(num_bookings // 3, 10)
+    fans = []
+    for i in range(num_fans):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        fans.append(Fan(f"F{i}", f"{first} {last}", f"{first.lower()}.{i}@example.com"))
+
+    on_sale = datetime(2026, 3, 1)
+    ticket_choices = rng.choices(tickets, TICKET_WEIGHTS, k=num_bookings)
+    payment_choices = rng.choices(PAYMENT_METHODS, PAYMENT_WEIGHTS, k=num_bookings)
+    quantity_choices = rng.choices(range(1, 8), QUANTITY_WEIGHTS, k=num_bookings)
+    bookings = []
+    for i in range(num_bookings):
+        fan = fans[min(int(rng.paretovariate(1.2)) - 1, num_fans - 1) if i % 2 else rng.randrange(num_fans)]
+        ticket, quantity = ticket_choices[i], quantity_choices[i]
+        quote = DEFAULT_PRICING.quote(ticket, quantity)
+        date = on_sale + timedelta(seconds=rng.randrange(200 * 24 * 3600))
+        booking = Booking.from_record((f"B{i + 1}", fan.get_user_id(), ticket.get_ticket_id(), quantity,
+                                       payment_choices[i], date, quote.get_total(), quote.is_bulk_discount()),
+                                      fan, ticket)
+        fan.add_booking(booking)
+        bookings.append(booking)
+    return fans, tickets, bookings
+
+
+def summarize(latencies_ns):
+    # Return count, throughput and latency percentiles (in microseconds) for one operation's timings
+    latencies = sorted(latencies_ns)
+    count = len(latencies)
+    total_s = sum(latencies) / 1e9
+    return {
+        "count": count,
+        "throughput_per_s": round(count / total_s, 1) if total_s else None,
+        "p50_us": round(latencies[count // 2] / 1e3, 2),
+        "p99_us": round(latencies[min(int(count * 0.99), count - 1)] / 1e3, 2),
+        "max_us": round(latencies[-1] / 1e3, 2),
+    }
+
+
+def time_calls(func, args_list):
+    # Call func once per argument tuple and return each call's duration in nanoseconds
+    timings = []
+    clock = time.perf_counter_ns
+    for args in args_list:
+        start = clock()
+        func(*args)
+        timings.append(clock() - start)
+    return timings
+
+
+def peak_rss_mb():
+    # Return this process's peak resident set size in MB (None where the resource module is missing)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # Bytes on macOS, KB elsewhere
+
+
+def bench_size(size, samples=10_000, journal_samples=1_000, seed=42):
+    # Run every benchmark against a system holding the given number of bookings and return the results
+    rng = random.Random(seed + 1)
+    start = time.perf_counter()
+    fans, tickets, bookings = make_realistic_data(size, seed)
+    generate_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    system = TicketSystem()
+    system.load(fans, tickets, bookings)
+    load_s = time.perf_counter() - start
+
+    fan_ids = [fan.get_user_id() for fan in fans]
+    operations = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # A full save_data/load_data round trip of every booking, as the pickle snapshots do
+        path = os.path.join(tmp, 'bookings.pkl')
+        rounds = 3 if size <= 100_000 else 1
+        operations["save_data"] = summarize(time_calls(save_data, [(path, bookings)] * rounds))
+        snapshot_mb = round(os.path.getsize(path) / 1e6, 1)
+        operations["load_data"] = summarize(time_calls(load_data, [(path,)] * rounds))
+
+    # Logins: look up random fans by ID, with one in ten IDs unknown
+    operations["login"] = summarize(time_calls(system.get_fan, [
+        (rng.choice(fan_ids) if i % 10 else f"X{i}",) for i in range(samples)]))
+    operations["view_ticket_sales"] = summarize(time_calls(system.view_ticket_sales, [()] * samples))
+    operations["book_ticket"] = summarize(time_calls(system.book_ticket, [
+        (rng.choice(fans), rng.choice(["T001", "T002", "T003", "T004"]), rng.randint(1, 7),
+         rng.choice(PAYMENT_METHODS)) for _ in range(samples)]))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Bookings saved to a journal, synced to disk each time and compacted in the background
+        journal = temp_journal(tmp)
+        journaled = TicketSystem(journal)
+        journaled.load_saved_data()
+        journaled.load(fans, tickets, [])
+        operations["book_ticket_journal"] = summarize(time_calls(journaled.book_ticket, [
+            (rng.choice(fans), "T002", 2, "Credit Card") for _ in range(journal_samples)]))
+        journal.close()
+
+    return {
+        "bookings": size,
+        "fans": len(fans),
+        "generate_s": round(generate_s, 3),
+        "load_s": round(load_s, 3),
+        "snapshot_mb": snapshot_mb,
+        "operations": operations,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_suite(sizes=DEFAULT_SIZES, samples=10_000, journal_samples=1_000, seed=42):
+    # Run the benchmarks at each size, each in a fresh process so the peak RSS belongs to that size alone
+    results = []
+    for size in sizes:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(bench_size, size, samples, journal_samples, seed).result()
+        print_result(result)
+        results.append(result)
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "samples": samples,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def print_result(result):
+    # Print one size's results as a table
+    print(f"\n{result['bookings']:,} bookings, {result['fans']:,} fans - generated in {result['generate_s']}s, "
+          f"loaded in {result['load_s']}s, snapshot {result['snapshot_mb']} MB, peak RSS {result['peak_rss_mb']} MB")
+    print(f"  {'operation':<20} | {'ops/s':>12} | {'p50 (us)':>10} | {'p99 (us)':>10} | {'max (us)':>10}")
+    for name, stats in result["operations"].items():
+        print(f"  {name:<20} | {stats['throughput_per_s']:>12,.1f} | {stats['p50_us']:>10.1f} | "
+              f"{stats['p99_us']:>10.1f} | {stats['max_us']:>10.1f}")
+
+
+def compare(baseline, current, tolerance=0.2):
+    # Print operations whose throughput or p99 latency got worse than the baseline run by more
+    # than the tolerance, and return how many regressed
+    regressions = 0
+    old_results = {result["bookings"]: result for result in baseline["results"]}
+    for result in current["results"]:
+        old = old_results.get(result["bookings"])
+        if old is None:
+            continue
+        for name, stats in result["operations"].items():
+            old_stats = old["operations"].get(name)
+            if old_stats is None:
+                continue
+            slower = stats["throughput_per_s"] < old_stats["throughput_per_s"] * (1 - tolerance)
+            worse_p99 = stats["p99_us"] > old_stats["p99_us"] * (1 + tolerance)
+            if slower or worse_p99:
+                regressions += 1
+                print(f"REGRESSION {result['bookings']:,} bookings, {name}: "
+                      f"{old_stats['throughput_per_s']:,.0f} -> {stats['throughput_per_s']:,.0f} ops/s, "
+                      f"p99 {old_stats['p99_us']} -> {stats['p99_us']} us")
+    return regressions
+
+
+# --- Benchmark suite ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ticket system on synthetic data")
+    parser.add_argument("--sizes", type=lambda s: [int(float(n)) for n in s.split(",")], default=DEFAULT_SIZES,
+                        help="comma-separated booking counts, e.g. 1e3,1e5,1e7")
+    parser.add_argument("--samples", type=int, default=10_000, help="timed calls per operation")
+    parser.add_argument("--journal-samples", type=int, default=1_000, help="timed journaled bookings")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="earlier JSON results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    report = run_suite(args.sizes, args.samples, args.journal_samples, args.seed)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        print(f"{regressions} regression(s) against {args.baseline}")
+        sys.exit(1 if regressions else 0)
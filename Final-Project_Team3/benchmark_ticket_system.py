@@ -0,0 +1,483 @@
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from user import Fan, Admin
+from ticket import Ticket
+from booking import Booking
+from ticket_system import TicketSystem
+from booking_journal import BookingJournal, save_data
+from sqlite_store import SQLiteStore
+from user_store import UserStore
+from user_search import UserSearchIndex
+
+
+PAYMENT_METHODS = ["Credit Card", "Debit Card", "Digital Wallet"]
+
+
+def make_data(num_bookings, num_fans=1000):
+    # Generate fans, the default tickets and the given number of bookings spread across the fans
+    tickets = [
+        Ticket("T001", "Single Race Pass", 350),
+        Ticket("T002", "Weekend Package", 900),
+        Ticket("T003", "Season Membership", 3000),
+        Ticket("T004", "Group Discount (5+)", 320),
+    ]
+    fans = [Fan(f"F{i}", f"Fan {i}", f"fan{i}@example.com") for i in range(num_fans)]
+    bookings = [Booking(f"B{i + 1}", fans[i % num_fans], tickets[i % len(tickets)], 1 + i % 6,
+                        PAYMENT_METHODS[i % 3])
+                for i in range(num_bookings)]
+    return fans, tickets, bookings
+
+
+def build_system(num_bookings, num_fans=1000, store=None):
+    # Create a ticket system pre-filled with the given number of bookings
+    system = TicketSystem(store)
+    if store:
+        system.load_saved_data()
+    system.load(*make_data(num_bookings, num_fans))
+    return system
+
+
+def temp_journal(directory, **options):
+    # Create a booking journal whose files all live in the given directory
+    return BookingJournal(os.path.join(directory, 'bookings.journal'), os.path.join(directory, 'bookings.pkl'),
+                          os.path.join(directory, 'users.pkl'), os.path.join(directory, 'tickets.pkl'), **options)
+
+
+def bench_journal_writes(sizes=(1_000, 10_000, 100_000, 1_000_000), samples=3000, rewrite_max=100_000):
+    # Time each booking at each dataset size, journaled (compacting every 1000 records, as by default)
+    # vs. rewriting bookings.pkl and users.pkl
+    print(f"{'bookings':>10} | {'journal median (us)':>19} | {'p99.9 (ms)':>10} | {'max (ms)':>8} | "
+          f"{'full rewrite (us)':>18}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = temp_journal(tmp)
+            system = build_system(size, store=journal)
+            fans = system.get_users()
+            system.book_ticket(fans[0], "T002", 2, "Credit Card")  # Sets up the booking ID counter
+
+            latencies = []
+            for i in range(samples):
+                start = time.perf_counter()
+                system.book_ticket(fans[i % len(fans)], "T002", 2, "Credit Card")
+                latencies.append(time.perf_counter() - start)
+            journal.close()
+            latencies.sort()
+
+            rewrite = "skipped"
+            if size <= rewrite_max:
+                # The previous approach: re-pickle every booking and user after each purchase
+                start = time.perf_counter()
+                for _ in range(3):
+                    with open(os.path.join(tmp, 'bookings.pkl'), 'wb') as f:
+                        pickle.dump(system.view_all_bookings(), f)
+                    with open(os.path.join(tmp, 'users.pkl'), 'wb') as f:
+                        pickle.dump(fans, f)
+                rewrite = f"{(time.perf_counter() - start) / 3 * 1e6:.0f}"
+        print(f"{size:>10} | {latencies[samples // 2] * 1e6:>19.1f} | {latencies[samples * 999 // 1000] * 1e3:>10.1f} | "
+              f"{latencies[-1] * 1e3:>8.1f} | {rewrite:>18}")
+
+
+def bench_sqlite(sizes=(1_000, 10_000, 100_000, 1_000_000), samples=1000, num_fans=10_000):
+    # Time startup, one booking and cold point lookups on a SQLite store at each dataset size
+    print(f"{'bookings':>10} | {'startup (ms)':>12} | {'booking (us)':>12} | {'user lookup (us)':>16} | "
+          f"{'booking lookup (us)':>19}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'grandprix.db')
+            fans, tickets, bookings = make_data(size, num_fans)
+            store = SQLiteStore(path)
+            store.import_data(fans, tickets, (b.to_record() for b in bookings))
+            store.close()
+            del fans, bookings
+
+            start = time.perf_counter()
+            system = TicketSystem(SQLiteStore(path))
+            system.load_saved_data()
+            startup_ms = (time.perf_counter() - start) * 1e3
+
+            start = time.perf_counter()
+            for i in range(samples):
+                system.book_ticket(system.get_fan(f"F{i % num_fans}"), "T002", 2, "Credit Card")
+            booking_us = (time.perf_counter() - start) / samples * 1e6
+
+            store = SQLiteStore(path)
+            start = time.perf_counter()
+            for i in range(samples):
+                store.find_user(f"F{(i * 7919) % num_fans}")
+            user_us = (time.perf_counter() - start) / samples * 1e6
+            start = time.perf_counter()
+            for i in range(samples):
+                store.find_booking(f"B{(i * 7919) % size + 1}")
+            lookup_us = (time.perf_counter() - start) / samples * 1e6
+            store.close()
+        print(f"{size:>10} | {startup_ms:>12.1f} | {booking_us:>12.1f} | {user_us:>16.1f} | {lookup_us:>19.1f}")
+
+
+def bench_batch(batch_sizes=(10, 100, 1000), num_bookings=10_000):
+    # Bookings per second for a group order, looping over book_ticket vs. one book_many call,
+    # on a journal (fsync on every write) and on a SQLite store
+    print(f"{'store':>8} | {'batch':>6} | {'book_ticket loop (/s)':>21} | {'book_many (/s)':>14}")
+    for kind in ("journal", "sqlite"):
+        for batch in batch_sizes:
+            rates = []
+            for bulk in (False, True):
+                with tempfile.TemporaryDirectory() as tmp:
+                    if kind == "journal":
+                        store = temp_journal(tmp, compact_every=sys.maxsize)
+                        system = build_system(num_bookings, store=store)
+                    else:
+                        store = SQLiteStore(os.path.join(tmp, 'grandprix.db'))
+                        fans, tickets, bookings = make_data(num_bookings)
+                        store.import_data(fans, tickets, (b.to_record() for b in bookings))
+                        system = TicketSystem(store)
+                        system.load_saved_data()
+                    requests = [(system.get_fan(f"F{i % 1000}"), "T004", 5 + i % 3, PAYMENT_METHODS[i % 3])
+                                for i in range(batch)]
+
+                    start = time.perf_counter()
+                    if bulk:
+                        system.book_many(requests)
+                    else:
+                        for request in requests:
+                            system.book_ticket(*request)
+                    rates.append(batch / (time.perf_counter() - start))
+                    store.close()
+            print(f"{kind:>8} | {batch:>6} | {rates[0]:>21.0f} | {rates[1]:>14.0f}")
+
+
+def bench_threads(thread_counts=(1, 2, 4, 8), num_bookings=2400):
+    # Bookings per second with several threads of one process each buying a different ticket, on a
+    # journal that syncs every booking: the store's lock is released before each booking waits for
+    # the disk, so the threads' syncs overlap
+    print(f"{'threads':>7} | {'bookings/s':>10}")
+    for count in thread_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = temp_journal(tmp)
+            system = build_system(10_000, store=store)
+            fans = system.get_users()
+            system.book_ticket(fans[0], "T001", 1, "Credit Card")  # Sets up the booking ID counter
+
+            def buy(thread_id):
+                for i in range(num_bookings // count):
+                    system.book_ticket(fans[i % len(fans)], f"T00{1 + thread_id % 4}", 1, "Credit Card")
+            threads = [threading.Thread(target=buy, args=(i,)) for i in range(count)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            rate = num_bookings // count * count / (time.perf_counter() - start)
+            store.close()
+        print(f"{count:>7} | {rate:>10.0f}")
+
+
+def bench_startup(sizes=(10_000, 100_000, 1_000_000)):
+    # Time a GUI's startup on pickle files of each size: loading everything before the window opens,
+    # vs. a lazy load where the window opens at once, the first login reads only the users and
+    # tickets, and the bookings finish loading in the background
+    print(f"{'bookings':>10} | {'full load (s)':>13} | {'window (ms)':>11} | {'first login (ms)':>16} | "
+          f"{'bookings ready (s)':>18}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            fans, tickets, bookings = make_data(size, max(size // 3, 1000))
+            save_data(os.path.join(tmp, 'users.pkl'), fans + [Admin("A1", "Admin", "admin@example.com")])
+            save_data(os.path.join(tmp, 'tickets.pkl'), tickets)
+            save_data(os.path.join(tmp, 'bookings.pkl'), bookings)
+            del fans, tickets, bookings
+
+            journal = temp_journal(tmp)
+            start = time.perf_counter()
+            TicketSystem(journal).load_saved_data()
+            full_s = time.perf_counter() - start
+            journal.close()
+
+            journal = temp_journal(tmp)
+            start = time.perf_counter()
+            system = TicketSystem(journal)
+            system.load_saved_data(lazy=True)
+            window_ms = (time.perf_counter() - start) * 1e3
+            start = time.perf_counter()
+            system.get_admin("A1")
+            login_ms = (time.perf_counter() - start) * 1e3
+            start = time.perf_counter()
+            system.load_in_background().join()
+            ready_s = time.perf_counter() - start + login_ms / 1e3
+            journal.close()
+        print(f"{size:>10} | {full_s:>13.2f} | {window_ms:>11.2f} | {login_ms:>16.1f} | {ready_s:>18.2f}")
+
+
+def bench_analytics(num_bookings=1_000_000, samples=20):
+    # Time building the sales analytics rollups for a season of bookings, then each query on them
+    from benchmark_suite import make_realistic_data  # Imported here: benchmark_suite imports this module
+    system = TicketSystem()
+    system.load(*make_realistic_data(num_bookings))
+    start = time.perf_counter()
+    analytics = system.view_sales_analytics()
+    print(f"{num_bookings:,} bookings: rollups built in {time.perf_counter() - start:.2f}s")
+    queries = [("sales by hour", analytics.get_sales_by_hour), ("sales by day", analytics.get_sales_by_day),
+               ("velocity (24h)", analytics.get_velocity), ("peak hour", analytics.get_peak_hour),
+               ("revenue by type/payment", analytics.get_revenue_by_ticket_type_and_payment),
+               ("bulk uptake", analytics.get_bulk_uptake)]
+    for name, query in queries:
+        start = time.perf_counter()
+        for _ in range(samples):
+            query()
+        print(f"  {name:<24} {(time.perf_counter() - start) / samples * 1e3:8.2f} ms")
+
+
+def bench_queries(num_bookings=1_000_000, samples=20):
+    # Time admin-style booking queries through the secondary indexes against a scan of every booking
+    from benchmark_suite import make_realistic_data  # Imported here: benchmark_suite imports this module
+    system = TicketSystem()
+    system.load(*make_realistic_data(num_bookings))
+    bookings = system.view_all_bookings()
+    start = time.perf_counter()
+    system.find_bookings(ticket_type="")  # The first query builds the indexes
+    print(f"{num_bookings:,} bookings: indexes built in {time.perf_counter() - start:.2f}s")
+    day = bookings[len(bookings) // 2].get_date().replace(hour=0, minute=0, second=0, microsecond=0)
+    queries = [
+        ("type + card, one day", dict(ticket_type="Weekend Package", payment_method="Credit Card",
+                                      since=day, until=day + timedelta(days=1))),
+        ("one fan", dict(fan_id=bookings[0].get_fan_id())),
+        ("payment method, one week", dict(payment_method="Digital Wallet", since=day, until=day + timedelta(days=7))),
+    ]
+    for name, query in queries:
+        start = time.perf_counter()
+        for _ in range(samples):
+            found = system.find_bookings(**query)
+        indexed_ms = (time.perf_counter() - start) / samples * 1e3
+        start = time.perf_counter()
+        scanned = [booking for booking in bookings
+                   if all(getattr(booking, f"get_{key}")() == value for key, value in query.items()
+                          if key not in ("since", "until"))
+                   and query.get("since", booking.get_date()) <= booking.get_date() < query.get("until", datetime.max)]
+        scan_ms = (time.perf_counter() - start) * 1e3
+        assert len(scanned) == len(found)
+        print(f"  {name:<26} {len(found):>7} found  {indexed_ms:8.2f} ms indexed  {scan_ms:8.1f} ms full scan")
+
+
+def bench_user_search(num_users=1_000_000, samples=20):
+    # Time search-as-you-type over a million fans: each keystroke of a few queries, on the index built once
+    import random
+    from benchmark_suite import FIRST_NAMES, LAST_NAMES  # Imported here: benchmark_suite imports this module
+    rng = random.Random(42)
+    fans = []
+    for i in range(num_users):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        fans.append(Fan(f"F{i}", f"{first} {last}", f"{first.lower()}.{i}@example.com"))
+    start = time.perf_counter()
+    index = UserSearchIndex.rebuild(fans)
+    print(f"{num_users:,} fans: search index built in {time.perf_counter() - start:.2f}s")
+    for query in ("lewis ham", "verstappen", "fatima.12345", "@example"):
+        slowest = 0
+        for length in range(1, len(query) + 1):
+            start = time.perf_counter()
+            for _ in range(samples):
+                found = index.search(query[:length])
+            slowest = max(slowest, (time.perf_counter() - start) / samples * 1e3)
+        print(f"  {query!r:<16} {len(found):>3} shown, slowest keystroke {slowest:.2f} ms")
+
+
+def bench_user_store(sizes=(1_000, 10_000, 100_000, 1_000_000), samples=200, rewrite_max=100_000):
+    # Time saving one new account at each user base size: one user store record vs. rewriting users.pkl
+    print(f"{'users':>10} | {'open (ms)':>9} | {'record write (us)':>17} | {'users.pkl rewrite (us)':>22}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'users.records')
+            fans = [Fan(f"F{i}", f"Fan {i}", f"fan{i}@example.com") for i in range(size)]
+            store = UserStore(path)
+            for fan in fans:
+                store.put(fan)
+            store.flush()
+
+            start = time.perf_counter()
+            store = UserStore(path)
+            open_ms = (time.perf_counter() - start) * 1e3
+            start = time.perf_counter()
+            for i in range(samples):
+                store.put(Fan(f"N{i}", f"New {i}", f"new{i}@example.com"))
+                store.flush()
+            record_us = (time.perf_counter() - start) / samples * 1e6
+
+            rewrite = "skipped"
+            if size <= rewrite_max:
+                start = time.perf_counter()
+                for _ in range(3):
+                    save_data(os.path.join(tmp, 'users.pkl'), fans)
+                rewrite = f"{(time.perf_counter() - start) / 3 * 1e6:.0f}"
+        print(f"{size:>10} | {open_ms:>9.1f} | {record_us:>17.1f} | {rewrite:>22}")
+
+
+def bench_memory(num_bookings=200_000, num_fans=20_000):
+    # Bytes retained per booking and per fan when they are loaded from saved records, as a store does
+    # (each record brings its own copies of strings like the payment method)
+    tickets = make_data(0)[1]
+    start = datetime(2026, 3, 1)
+
+    def records():
+        for i in range(num_bookings):
+            payment_method = (PAYMENT_METHODS[i % 3] + " ")[:-1]  # A separate copy, as unpickling gives
+            yield (f"B{i + 1}", f"F{i % num_fans}", tickets[i % 4].get_ticket_id(), 1 + i % 6, payment_method,
+                   start + timedelta(seconds=i * 7), 350.0 * (1 + i % 6))
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    fans = [Fan.from_record((f"F{i}", f"Fan {i}", f"fan{i}@example.com")) for i in range(num_fans)]
+    after_fans = tracemalloc.get_traced_memory()[0]
+    bookings = [Booking.from_record(record, fans[i % num_fans], tickets[i % 4]) for i, record in enumerate(records())]
+    after_bookings = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{(after_bookings - after_fans) / len(bookings):.0f} bytes per booking, "
+          f"{(after_fans - before) / len(fans):.0f} bytes per fan")
+
+
+def bench_export(num_bookings=1_000_000, num_fans=10_000):
+    # Time exporting every booking from a SQLite store as CSV and as a columnar file, with the peak
+    # memory the export takes and the size of each file
+    from sales_export import export_rows, export_csv, export_columnar, read_columnar_rows
+    tickets = make_data(0)[1]
+    fans = [Fan(f"F{i}", f"Fan {i}", f"fan{i}@example.com") for i in range(num_fans)]
+    start = datetime(2026, 3, 1)
+    records = ((f"B{i + 1}", f"F{i % num_fans}", tickets[i % 4].get_ticket_id(), 1 + i % 6, PAYMENT_METHODS[i % 3],
+                start + timedelta(seconds=i * 7), 350.0 * (1 + i % 6)) for i in range(num_bookings))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'grandprix.db')
+        store = SQLiteStore(path)
+        store.import_data(fans, tickets, records)
+        store.close()
+        system = TicketSystem(SQLiteStore(path))
+        system.load_saved_data()
+        for name, export in (("csv", export_csv), ("columnar", export_columnar)):
+            output = os.path.join(tmp, f"bookings.{name}")
+            tracemalloc.start()
+            began = time.perf_counter()
+            count = export(export_rows(system), output)
+            elapsed = time.perf_counter() - began
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{count:,} bookings as {name:<8}: {elapsed:.1f}s ({count / elapsed:,.0f} rows/s), "
+                  f"{os.path.getsize(output) / 2**20:.1f} MB, peak {peak / 2**20:.1f} MB traced")
+        began = time.perf_counter()
+        count = sum(1 for _ in read_columnar_rows(os.path.join(tmp, "bookings.columnar")))
+        print(f"{count:,} bookings read back from the columnar file in {time.perf_counter() - began:.1f}s")
+
+
+def bench_reports(num_bookings=4_000_000, workers=(1, 2, 4, 8), rows_per_partition=250_000, num_fans=10_000):
+    # Time a full sales report over partitioned bookings with 1, 2, 4 and 8 worker processes
+    from sales_reports import partition_bookings, run_report
+    tickets = make_data(0)[1]
+    fans = [Fan(f"F{i}", f"Fan {i}", f"fan{i}@example.com") for i in range(num_fans)]
+    start = datetime(2026, 3, 1)
+    records = ((f"B{i + 1}", f"F{i % num_fans}", tickets[i % 4].get_ticket_id(), 1 + i % 6, PAYMENT_METHODS[i % 3],
+                start + timedelta(seconds=i * 7), 350.0 * (1 + i % 6)) for i in range(num_bookings))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'grandprix.db')
+        store = SQLiteStore(path)
+        store.import_data(fans, tickets, records)
+        store.close()
+        system = TicketSystem(SQLiteStore(path))
+        system.load_saved_data()
+        began = time.perf_counter()
+        partitions = partition_bookings(system, os.path.join(tmp, "partitions"), rows_per_partition)
+        print(f"{num_bookings:,} bookings written as {len(partitions)} partitions in "
+              f"{time.perf_counter() - began:.1f}s ({os.cpu_count()} cores)")
+        baseline = None
+        for count in workers:
+            began = time.perf_counter()
+            summary, bookings = run_report(os.path.join(tmp, "partitions"), count)
+            elapsed = time.perf_counter() - began
+            baseline = baseline or elapsed
+            print(f"  {count} worker(s): {elapsed:.2f}s, {bookings / elapsed:,.0f} bookings/s, "
+                  f"{baseline / elapsed:.2f}x, totals match: {summary.matches(system.view_sales_summary())}")
+
+
+def time_bookings(samples=100_000, num_bookings=100_000):
+    # Return the mean microseconds per in-memory book_ticket() call (used by bench_metrics)
+    system = build_system(num_bookings)
+    fan = system.get_fan("F1")
+    start = time.perf_counter()
+    for _ in range(samples):
+        system.book_ticket(fan, "T002", 1, "Credit Card")
+    return (time.perf_counter() - start) / samples * 1e6
+
+
+def bench_metrics(samples=100_000):
+    # Compare book_ticket() with metrics disabled and enabled; each runs in its own process, since
+    # metrics are switched on by GRANDPRIX_METRICS before anything is imported
+    import subprocess
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, path in (("disabled", ""), ("enabled", os.path.join(tmp, "metrics.prom"))):
+            env = dict(os.environ, GRANDPRIX_METRICS=path, GRANDPRIX_METRICS_INTERVAL="0")
+            output = subprocess.run([sys.executable, "-c", "import benchmark_ticket_system as b; "
+                                     f"print(b.time_bookings({samples}))"],
+                                    env=env, capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+            print(f"metrics {label:<8}: {float(output):.2f} us per booking")
+
+
+def bench_writer(burst=500, num_bookings=10_000):
+    # Simulate a GUI event loop making a burst of bookings, one per tick, on a journal that syncs every
+    # write: how long each tick blocks the loop when booking directly vs. through a BookingWriter
+    from booking_writer import BookingWriter
+    for mode in ("direct", "writer"):
+        with tempfile.TemporaryDirectory() as tmp:
+            system = build_system(num_bookings, store=temp_journal(tmp))
+            fans = [system.get_fan(f"F{i}") for i in range(burst)]
+            writer = BookingWriter(system) if mode == "writer" else None
+            ticks, futures = [], []
+            began = time.perf_counter()
+            for fan in fans:
+                start = time.perf_counter()
+                if writer:
+                    futures.append(writer.submit(fan, "T002", 1, "Credit Card"))
+                else:
+                    system.book_ticket(fan, "T002", 1, "Credit Card")
+                ticks.append(time.perf_counter() - start)
+            for future in futures:
+                future.result()  # Wait until every booking is on disk
+            elapsed = time.perf_counter() - began
+            if writer:
+                writer.close()
+            ticks.sort()
+            commits = writer.commits if writer else burst
+            print(f"{mode:>6}: {burst} bookings durable in {elapsed * 1e3:.0f} ms with {commits} writes; "
+                  f"event loop blocked {ticks[len(ticks) // 2] * 1e3:.3f} ms median, "
+                  f"{ticks[int(len(ticks) * 0.99)] * 1e3:.3f} ms p99, {ticks[-1] * 1e3:.3f} ms max per booking")
+
+
+# --- Benchmark code ---
+if __name__ == "__main__":
+    bench_journal_writes()
+    print()
+    bench_sqlite()
+    print()
+    bench_batch()
+    print()
+    bench_threads()
+    print()
+    bench_startup()
+    print()
+    bench_analytics()
+    print()
+    bench_queries()
+    print()
+    bench_user_search()
+    print()
+    bench_user_store()
+    print()
+    bench_export()
+    print()
+    bench_reports()
+    print()
+    bench_metrics()
+    print()
+    bench_writer()
+    print()
+    bench_memory()
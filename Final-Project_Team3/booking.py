@@ -1,27 +1,127 @@
-from datetime import datetime
+import sys
+from datetime import datetime, timedelta
+
+from pricing import DEFAULT_PRICING
+
+EPOCH = datetime(1970, 1, 1)  # Booking dates are kept as whole microseconds since this (naive) date
+
 
 class Booking:
     """Manages a ticket booking by a fan."""
 
-    def __init__(self, booking_id, fan, ticket, quantity, payment_method):
-        # Initialize booking attributes
+    # Fixed attributes instead of a per-object __dict__: there can be millions of bookings in memory
+    __slots__ = ('_booking_id', '_fan', '_fan_id', '_ticket', '_ticket_id', '_quantity',
+                 '_payment_method', '_timestamp', '_total_price', '_bulk_discount')
+
+    def __init__(self, booking_id, fan, ticket, quantity, payment_method, quote=None):
+        # Initialize booking attributes, priced by the pricing engine's quote (the default rules if there is none)
         self._booking_id = booking_id
         self._fan = fan
+        self._fan_id = fan.get_user_id()
         self._ticket = ticket
+        self._ticket_id = ticket.get_ticket_id()
         self._quantity = quantity
-        self._payment_method = payment_method
-        self._date = datetime.now()
-        self._total_price = self._calculate_total()
+        self._payment_method = sys.intern(payment_method)  # Every booking shares one copy of each method
+        self._timestamp = to_timestamp(datetime.now())
+        quote = quote or DEFAULT_PRICING.quote(ticket, quantity, payment_method)
+        self._total_price = quote.get_total()
+        self._bulk_discount = quote.is_bulk_discount()
 
         # Automatically add this booking to the fan's booking history
         fan.add_booking(self)
 
-    def _calculate_total(self):
-        # Calculate the total price, applying a discount for bulk purchases (5 or more tickets)
-        base_total = self._ticket.get_price() * self._quantity
-        if self._quantity >= 5:
-            return base_total * 0.9  # 10% discount for bulk purchases
-        return base_total
+    @classmethod
+    def from_record(cls, record, fan, ticket):
+        # Rebuild a saved booking without recalculating its date/total or touching the fan's history.
+        # A record saved without its bulk discount flag gets the one the default rules give.
+        booking = cls.__new__(cls)
+        booking_id, fan_id, ticket_id, quantity, payment_method, date, total_price = record[:7]
+        booking._booking_id = booking_id
+        booking._fan = fan
+        # Share the fan's and ticket's ID strings rather than keeping each record's own copy
+        booking._fan_id = fan.get_user_id() if fan is not None and fan.get_user_id() == fan_id else fan_id
+        booking._ticket = ticket
+        booking._ticket_id = ticket.get_ticket_id() if ticket is not None and ticket.get_ticket_id() == ticket_id \
+            else ticket_id
+        booking._quantity = quantity
+        booking._payment_method = sys.intern(payment_method)
+        booking._timestamp = to_timestamp(date)
+        booking._total_price = total_price
+        booking._bulk_discount = bool(record[7]) if len(record) > 7 else DEFAULT_PRICING.is_bulk_discount(quantity)
+        return booking
+
+    def to_record(self):
+        # Return a compact tuple describing this booking, referring to the fan and ticket by ID
+        return (self._booking_id, self.get_fan_id(), self.get_ticket_id(), self._quantity,
+                self._payment_method, self.get_date(), self._total_price, self._bulk_discount)
+
+    def __getstate__(self):
+        # Pickle the fan and ticket by ID only, so saving a booking doesn't save the whole fan
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state['_fan_id'] = self.get_fan_id()
+        state['_ticket_id'] = self.get_ticket_id()
+        del state['_fan'], state['_ticket']
+        return state
+
+    def __setstate__(self, state):
+        # Restore a pickled booking; relink() must be called to attach the fan and ticket objects
+        state = dict(state)
+        if '_date' in state:
+            # Saved before dates were kept as integers
+            state['_timestamp'] = to_timestamp(state.pop('_date'))
+        state['_payment_method'] = sys.intern(state['_payment_method'])
+        if '_bulk_discount' not in state:
+            # Saved before bookings kept the pricing tier they got
+            state['_bulk_discount'] = DEFAULT_PRICING.is_bulk_discount(state['_quantity'])
+        if '_fan_id' in state:
+            state['_fan'] = None
+            state['_ticket'] = None
+        else:
+            # Bookings saved before by-ID storage carry full copies of the fan and ticket, which may
+            # not be completely unpickled yet, so their IDs are read later by get_fan_id/get_ticket_id
+            state['_fan_id'] = None
+            state['_ticket_id'] = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def relink(self, fan, ticket):
+        # Attach the fan and ticket objects after loading from a file
+        self._fan = fan
+        self._ticket = ticket
+        self._fan_id = fan.get_user_id()
+        self._ticket_id = ticket.get_ticket_id()
+
+    def get_booking_id(self):
+        # Return the unique ID of the booking
+        return self._booking_id
+
+    def get_fan(self):
+        # Return the fan who made the booking
+        return self._fan
+
+    def get_fan_id(self):
+        # Return the user ID of the fan who made the booking
+        if self._fan_id is None:
+            self._fan_id = self._fan.get_user_id()
+        return self._fan_id
+
+    def get_ticket_id(self):
+        # Return the ID of the ticket booked
+        if self._ticket_id is None:
+            self._ticket_id = self._ticket.get_ticket_id()
+        return self._ticket_id
+
+    def get_date(self):
+        # Return the date and time the booking was made
+        return EPOCH + timedelta(microseconds=self._timestamp)
+
+    def get_timestamp(self):
+        # Return the date and time the booking was made as microseconds since EPOCH
+        return self._timestamp
+
+    def is_bulk_discount(self):
+        # Return True if the booking was priced with a quantity tier (bulk purchase) discount
+        return self._bulk_discount
 
     def get_total_price(self):
         # Return the total price of the booking
@@ -42,5 +142,10 @@ class Booking:
     def __str__(self):
         # Return a string representation of the Booking object
         return (f"Booking[{self._booking_id}] - {self._ticket.get_ticket_type()} x {self._quantity} "
-                f"on {self._date.strftime('%Y-%m-%d')} | Payment: {self._payment_method} | "
+                f"on {self.get_date().strftime('%Y-%m-%d')} | Payment: {self._payment_method} | "
                 f"Total: AED {self._total_price:.2f}")
+
+
+def to_timestamp(date):
+    # Convert a datetime to the integer kept by a booking: whole microseconds since EPOCH
+    return (date - EPOCH) // timedelta(microseconds=1)
@@ -0,0 +1,229 @@
+import json
+import socket
+import threading
+from datetime import datetime
+
+from user import Fan, CLASSES
+from ticket import Ticket
+from booking import Booking
+from sales_summary import SalesSummary
+from sales_analytics import SalesAnalytics
+from pricing import Quote
+from ticket_system import BatchBookingError
+
+
+class BookingClient:
+    """Blocking connection to a BookingServer, sending one JSON request per line."""
+
+    def __init__(self, address):
+        # Connect to a TCP host:port or a unix:/path socket
+        if address.startswith("unix:"):
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(address[len("unix:"):])
+        else:
+            host, port = address.rsplit(":", 1)
+            self._sock = socket.create_connection((host, int(port)))
+        self._file = self._sock.makefile('rb')
+        self._lock = threading.Lock()  # One request at a time (e.g. the GUI and its booking writer thread)
+
+    def request(self, op, **fields):
+        # Send a request and return its result, raising ValueError with the server's error message
+        with self._lock:
+            self._sock.sendall(json.dumps({"op": op, **fields}).encode() + b"\n")
+            line = self._file.readline()
+        if not line:
+            raise ConnectionError("The booking server closed the connection.")
+        response = json.loads(line)
+        if not response["ok"]:
+            if "errors" in response:
+                raise BatchBookingError([tuple(error) for error in response["errors"]])
+            raise ValueError(response["error"])
+        return response["result"]
+
+    def close(self):
+        # Close the connection
+        self._file.close()
+        self._sock.close()
+
+
+class RemoteTicketSystem:
+    """Stands in for TicketSystem in the GUIs, passing every call on to the booking server."""
+
+    def __init__(self, client):
+        # Initialize the system with its server connection and a cache of tickets and fan histories
+        self._client = client
+        self._tickets = {}  # ticket_id -> Ticket, as last sent by the server
+        self._histories = _RemoteHistories(self._fetch_history)  # user_id -> list shared with each Fan
+
+    def load_saved_data(self, lazy=False):
+        # Fetch the tickets (not until they are needed if lazy); everything else is asked for when needed
+        if not lazy:
+            self.get_tickets()
+
+    def load_in_background(self):
+        # The server holds the data, so there is nothing to load
+        return None
+
+    def refresh(self):
+        # The server always holds the latest state, so there is nothing to pick up
+        pass
+
+    def register_user(self, user):
+        # Register a new fan on the server, failing if the user ID is already taken
+        self._client.request("register", user_id=user.get_user_id(), name=user.get_name(), email=user.get_email())
+
+    def delete_user(self, user_id):
+        # Delete a user on the server and return it (None if no such user)
+        data = self._client.request("delete_user", user_id=user_id)
+        return self._user_from_json(data) if data else None
+
+    def get_user(self, user_id):
+        # Return the user with the given ID, or None if not found
+        return self._login(user_id)
+
+    def get_fan(self, user_id):
+        # Return the fan with the given ID, or None if not found
+        return self._login(user_id, "fan")
+
+    def get_admin(self, user_id):
+        # Return the admin with the given ID, or None if not found
+        return self._login(user_id, "admin")
+
+    def get_ticket(self, ticket_id):
+        # Return the ticket with the given ID, or None if not found
+        if ticket_id not in self._tickets:
+            self.get_tickets()
+        return self._tickets.get(ticket_id)
+
+    def get_tickets(self):
+        # Return a list of all available tickets, with the number left as the server counts them
+        for data in self._client.request("tickets"):
+            ticket = Ticket(*data["record"])
+            if data["remaining"] is not None:
+                ticket.set_sold(ticket.get_capacity() - data["remaining"])
+            self._tickets[ticket.get_ticket_id()] = ticket
+        return list(self._tickets.values())
+
+    def get_booking_history_page(self, fan, offset, limit):
+        # Fetch one page of a fan's bookings, newest first, and the fan's total number of bookings
+        data = self._client.request("history_page", fan_id=fan.get_user_id(), offset=offset, limit=limit)
+        return [self._booking_from_json(booking, fan) for booking in data["bookings"]], data["total"]
+
+    def quote(self, ticket_id, quantity, payment_method=None, promo_code=None):
+        # Return the server's price for a booking without making it
+        data = self._client.request("quote", ticket_id=ticket_id, quantity=quantity,
+                                    payment_method=payment_method, promo_code=promo_code)
+        return Quote(data["subtotal"], [tuple(adjustment) for adjustment in data["adjustments"]], data["total"],
+                     data.get("bulk_discount", False))
+
+    def book_ticket(self, fan, ticket_id, quantity, payment_method, promo_code=None):
+        # Book tickets on the server and return the booking
+        data = self._client.request("book", fan_id=fan.get_user_id(), ticket_id=ticket_id,
+                                    quantity=quantity, payment_method=payment_method, promo_code=promo_code)
+        booking = self._booking_from_json(data, fan)
+        fan.add_booking(booking)
+        return booking
+
+    def book_many(self, requests):
+        # Book a batch of (fan, ticket_id, quantity, payment_method) requests all at once on the server
+        requests = list(requests)
+        data = self._client.request("book_many", requests=[
+            [fan.get_user_id() if fan is not None else None, ticket_id, quantity, payment_method]
+            for fan, ticket_id, quantity, payment_method in requests])
+        bookings = []
+        for (fan, _, _, _), booking_data in zip(requests, data):
+            booking = self._booking_from_json(booking_data, fan)
+            fan.add_booking(booking)
+            bookings.append(booking)
+        return bookings
+
+    def book_group(self, requests):
+        # Book a group of independent (fan, ticket_id, quantity, payment_method, promo_code) requests on
+        # the server with one write; returns each request's booking or the ValueError it failed with
+        requests = list(requests)
+        data = self._client.request("book_group", requests=[
+            [fan.get_user_id() if fan is not None else None, ticket_id, quantity, payment_method, promo_code]
+            for fan, ticket_id, quantity, payment_method, promo_code in requests])
+        results = []
+        for (fan, *_), result in zip(requests, data):
+            if "error" in result:
+                results.append(ValueError(result["error"]))
+            else:
+                booking = self._booking_from_json(result["booking"], fan)
+                fan.add_booking(booking)
+                results.append(booking)
+        return results
+
+    def cancel_booking(self, booking_id):
+        # Cancel a booking on the server and return it
+        data = self._client.request("cancel", booking_id=booking_id)
+        history = self._histories.get(data[1])
+        if history is not None:
+            history[:] = [b for b in history if b.get_booking_id() != booking_id]
+        return self._booking_from_json(data, Fan(data[1], "", ""))
+
+    def view_ticket_sales(self):
+        # Return total tickets sold for each ticket type
+        return self.view_sales_summary().get_quantity_by_ticket_type()
+
+    def view_sales_summary(self):
+        # Return the server's running sales and revenue totals
+        return SalesSummary.from_dict(self._client.request("sales"))
+
+    def view_sales_analytics(self):
+        # Return the server's hourly and daily sales rollups
+        return SalesAnalytics.from_dict(self._client.request("analytics"))
+
+    def search_users(self, query, limit=50):
+        # Return the users on the server whose name or email contains the query
+        return [self._user_from_json(data) for data in self._client.request("search_users", query=query, limit=limit)]
+
+    def find_bookings(self, ticket_type=None, payment_method=None, fan_id=None, since=None, until=None):
+        # Run a booking query on the server and return the matching bookings, oldest first
+        data = self._client.request("find_bookings", ticket_type=ticket_type, payment_method=payment_method,
+                                    fan_id=fan_id, since=since.isoformat() if since else None,
+                                    until=until.isoformat() if until else None)
+        return [self._booking_from_json(booking, Fan(booking[1], "", "")) for booking in data]
+
+    def _login(self, user_id, role=None):
+        # Fetch a user (of the given role, if any) from the server
+        data = self._client.request("login", user_id=user_id, role=role)
+        return self._user_from_json(data) if data else None
+
+    def _user_from_json(self, data):
+        # Rebuild a user sent by the server; a fan's booking history is fetched when first needed
+        user = CLASSES[data["role"]].from_record(data["record"])
+        if isinstance(user, Fan):
+            self._histories.pop(user.get_user_id(), None)  # Fetch it again: other terminals may have booked
+            user.attach_history(self._histories)
+        return user
+
+    def _booking_from_json(self, data, fan):
+        # Rebuild a booking sent by the server
+        record = tuple(data[:5]) + (datetime.fromisoformat(data[5]),) + tuple(data[6:])
+        ticket = self.get_ticket(record[2]) or Ticket(record[2], "", 0)
+        return Booking.from_record(record, fan, ticket)
+
+    def _fetch_history(self, user_id):
+        # Fetch a fan's bookings from the server
+        fan = Fan(user_id, "", "")
+        return [self._booking_from_json(data, fan) for data in self._client.request("history", fan_id=user_id)]
+
+
+class _RemoteHistories(dict):
+    """Fan booking histories fetched from the server the first time they are needed."""
+
+    def __init__(self, loader):
+        # Initialize the cache with the function used to fetch a fan's bookings
+        super().__init__()
+        self._loader = loader
+
+    def __missing__(self, user_id):
+        # Fetch and keep the bookings of a fan not yet in the cache
+        bookings = self[user_id] = self._loader(user_id)
+        return bookings
+
+    def add_booking(self, user_id, booking):
+        # Add a new booking to a fan's history if it has been fetched (otherwise the server sends it later)
+        if user_id in self:
+            self[user_id].append(booking)
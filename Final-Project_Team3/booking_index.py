@@ -0,0 +1,137 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from booking import to_timestamp
+
+
+class BookingIndex:
+    """Secondary indexes over bookings: by ticket type, payment method and fan, and all bookings by date.
+
+    Each index entry keeps its bookings in date order (a _Postings), so a date range within any of
+    them is two bisects. find() counts how many bookings each index that applies holds in the date
+    range, scans only the smallest, and checks the other criteria on just those bookings.
+    """
+
+    def __init__(self):
+        # Start with empty indexes
+        self._by_date = _Postings()
+        self._by_ticket_type = {}  # ticket type -> _Postings
+        self._by_payment_method = {}  # payment method -> _Postings
+        self._by_fan = {}  # fan ID -> _Postings
+
+    @classmethod
+    def rebuild(cls, bookings):
+        # Build the indexes from scratch: sort the bookings by date once, then split them by each key
+        index = cls()
+        bookings = sorted(bookings, key=lambda booking: booking.get_timestamp())
+        index._by_date = _Postings.from_sorted(bookings)
+        for entries, getter in ((index._by_ticket_type, 'get_ticket_type'),
+                                (index._by_payment_method, 'get_payment_method'),
+                                (index._by_fan, 'get_fan_id')):
+            groups = {}
+            for booking in bookings:
+                key = getattr(booking, getter)()
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = []
+                group.append(booking)
+            for key, group in groups.items():
+                entries[key] = _Postings.from_sorted(group)
+        return index
+
+    def add(self, booking):
+        # Add a new booking to every index
+        self._by_date.add(booking)
+        for entries, key in self._keys(booking):
+            postings = entries.get(key)
+            if postings is None:
+                postings = entries[key] = _Postings()
+            postings.add(booking)
+
+    def remove(self, booking):
+        # Take a cancelled booking out of every index
+        self._by_date.remove(booking)
+        for entries, key in self._keys(booking):
+            postings = entries.get(key)
+            if postings is not None:
+                postings.remove(booking)
+                if not postings:
+                    del entries[key]
+
+    def find(self, ticket_type=None, payment_method=None, fan_id=None, since=None, until=None):
+        # Return the bookings matching every criterion given (since <= date < until), oldest first
+        low = to_timestamp(since) if since is not None else None
+        high = to_timestamp(until) if until is not None else None
+        candidates = [(self._by_date, None, None)]
+        for entries, key, getter in ((self._by_ticket_type, ticket_type, 'get_ticket_type'),
+                                     (self._by_payment_method, payment_method, 'get_payment_method'),
+                                     (self._by_fan, fan_id, 'get_fan_id')):
+            if key is not None:
+                postings = entries.get(key)
+                if postings is None:
+                    return []  # Nothing at all has this ticket type, payment method or fan
+                candidates.append((postings, key, getter))
+        # Scan the index holding the fewest bookings in the date range
+        start, end, best = min(((*postings.span(low, high), postings) for postings, _, _ in candidates),
+                               key=lambda candidate: candidate[1] - candidate[0])
+        filters = [(getter, key) for postings, key, getter in candidates if postings is not best and key is not None]
+        bookings = best.bookings[start:end]
+        for getter, key in filters:
+            bookings = [booking for booking in bookings if getattr(booking, getter)() == key]
+        return bookings
+
+    def _keys(self, booking):
+        # Return the (index, key) pairs a booking is filed under
+        return ((self._by_ticket_type, booking.get_ticket_type()),
+                (self._by_payment_method, booking.get_payment_method()),
+                (self._by_fan, booking.get_fan_id()))
+
+
+class _Postings:
+    """Bookings sorted by date, with their timestamps in a parallel array for bisecting."""
+
+    __slots__ = ('timestamps', 'bookings')
+
+    def __init__(self):
+        # Start with no bookings
+        self.timestamps = array('q')
+        self.bookings = []
+
+    @classmethod
+    def from_sorted(cls, bookings):
+        # Return postings holding a list of bookings already in date order
+        postings = cls()
+        postings.timestamps = array('q', [booking.get_timestamp() for booking in bookings])
+        postings.bookings = bookings
+        return postings
+
+    def __len__(self):
+        # Return the number of bookings
+        return len(self.bookings)
+
+    def add(self, booking):
+        # Add a booking in date order (new bookings are nearly always the latest, so this is an append)
+        timestamp = booking.get_timestamp()
+        if not self.timestamps or timestamp >= self.timestamps[-1]:
+            self.timestamps.append(timestamp)
+            self.bookings.append(booking)
+        else:
+            i = bisect_right(self.timestamps, timestamp)
+            self.timestamps.insert(i, timestamp)
+            self.bookings.insert(i, booking)
+
+    def remove(self, booking):
+        # Remove a booking, looking only at the bookings made at the same moment
+        timestamp = booking.get_timestamp()
+        i = bisect_left(self.timestamps, timestamp)
+        while i < len(self.bookings) and self.timestamps[i] == timestamp:
+            if self.bookings[i] is booking:
+                del self.timestamps[i]
+                del self.bookings[i]
+                return
+            i += 1
+
+    def span(self, low, high):
+        # Return (start, end) positions of the bookings with low <= timestamp < high (either may be None)
+        start = bisect_left(self.timestamps, low) if low is not None else 0
+        end = bisect_left(self.timestamps, high) if high is not None else len(self.timestamps)
+        return start, max(start, end)
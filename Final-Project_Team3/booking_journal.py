@@ -0,0 +1,471 @@
+import os
+import pickle
+import threading
+import traceback
+import uuid
+from contextlib import contextmanager
+
+import metrics
+from user import Fan
+from file_lock import FileLock
+from id_allocator import next_booking_number
+from user_store import UserStore
+
+
+# Tags of journal records that are not plain booking records
+GENERATION = "generation"  # First record of a journal started by compaction
+CANCEL = "cancel"  # Cancels an earlier booking
+USER = "user"  # Registers a user
+DELETE_USER = "delete_user"  # Deletes a user's account
+TICKET = "ticket"  # Adds a ticket
+
+SNAPSHOT_CHUNK = 1000  # Bookings per pickle in a snapshot: few enough that each chunk is freed while still young
+
+
+class BookingJournal:
+    """Pickle-file store: an append-only log of changes, periodically compacted into the snapshots.
+
+    Several processes (e.g. one per GUI) can share the same files. Every change is written under a
+    file lock, after replaying whatever the other processes have added to the journal since.
+    Compaction runs on a background thread and pickles the bookings without holding the lock, so
+    a booking never waits for a snapshot to be written.
+    Users are kept in a UserStore next to users_file (users.records for users.pkl), so a compaction
+    writes one record per account changed since the last one rather than every user; an old
+    users.pkl is only read to fill the user store the first time.
+    """
+
+    def __init__(self, journal_file='bookings.journal', bookings_file='bookings.pkl',
+                 users_file='users.pkl', tickets_file='tickets.pkl', compact_every=1000, fsync=True):
+        # Initialize file locations and compaction settings
+        self._journal_file = journal_file
+        self._prev_file = journal_file + '.prev'  # The journal replaced by the last compaction
+        self._ids_file = journal_file + '.ids'  # Counter of booking numbers reserved so far
+        self._bookings_file = bookings_file
+        self._users_file = users_file  # Users saved before the user store existed
+        self._user_records_file = os.path.splitext(users_file)[0] + '.records'
+        self._users = None  # UserStore, opened when the system is loaded
+        self._tickets_file = tickets_file
+        self._compact_every = compact_every  # Journal records allowed before a new snapshot is written
+        self._snapshot_size = 0  # Bookings in the last snapshot this process loaded or wrote
+        self._fsync = fsync  # Force each record to disk before the booking is confirmed
+        self._lock = FileLock(journal_file + '.lock')
+        self._generation = None  # Generation of the journal this process is reading
+        self._offset = 0  # How far into that journal this process has read
+        self._pending = 0  # Number of records in the journal since the last snapshot
+        self._syncing = False
+        self._bookings_loaded = False  # Until then the journal cannot be replayed
+        self._system = None  # The TicketSystem this store was loaded into
+        self._local = threading.local()  # Per thread: how deep in lock() it is, and a journal left to sync
+        self._compactor = None  # Background thread writing a new snapshot, if one is running
+        self._compactor_lock = threading.Lock()
+
+    @metrics.timed("journal_load")
+    def load(self, system, lazy=False):
+        # Load the pickle snapshots into the system, replaying the journal written after them.
+        # With lazy=True only users and tickets are loaded (with the registrations and tickets
+        # in the journal), and load_bookings() loads the rest later.
+        with self._lock:
+            users = self._open_users()
+            tickets = load_data(self._tickets_file)
+            self._system = system
+            self._generation = _journal_generation(self._journal_file)
+            self._bookings_loaded = False
+            if lazy:
+                users, tickets, self._offset = _replay_accounts(self._journal_file, users, tickets)
+                system.load(users, tickets, [])
+                return
+            system.load(users, tickets, self._load_bookings(users, tickets))
+            self._start_replay()
+
+    def load_bookings(self, system):
+        # Load the bookings snapshot into a system loaded with lazy=True, then replay the whole journal
+        with self._lock:
+            if self._bookings_loaded:
+                return
+            if _journal_generation(self._journal_file) != self._generation:
+                # A compaction since the users were loaded may have saved users this process has not seen
+                system.clear()
+                self.load(system)
+                return
+            system.load([], [], self._load_bookings(system.get_users(), system.get_tickets()))
+            self._start_replay()
+
+    def _open_users(self):
+        # Open the user store and return its users, filling it from users.pkl the first time
+        self._users = UserStore(self._user_records_file, self._fsync)
+        if not self._users.exists():
+            for user in load_data(self._users_file):
+                self._users.put(user)
+            self._users.flush()
+        return self._users.load_all()
+
+    def _start_replay(self):
+        # Replay the journal from its start into a system just loaded from the snapshots
+        self._bookings_loaded = True
+        self._offset = 0
+        self._pending = 0
+        self._catch_up()
+
+    def _load_bookings(self, users, tickets):
+        # Load the bookings snapshot and link it to the given users and tickets
+        fans = {u.get_user_id(): u for u in users if isinstance(u, Fan)}
+        tickets_by_id = {t.get_ticket_id(): t for t in tickets}
+        bookings = []
+        for booking in load_data(self._bookings_file):
+            ticket = tickets_by_id.get(booking.get_ticket_id())
+            if ticket is not None:
+                booking.relink(_find_fan(fans, booking.get_fan_id()), ticket)
+                bookings.append(booking)
+        self._snapshot_size = len(bookings)
+        return bookings
+
+    @contextmanager
+    def lock(self):
+        # Hold the file lock with the system brought up to date, so a change can be checked
+        # against every other process's changes and then written. The records written meanwhile
+        # are forced to disk after the lock is released, so other bookings can go ahead while this
+        # one waits for the disk; lock() only returns once they are there. Once the change is
+        # complete in memory too, a new snapshot is started in the background if it is time to.
+        local = self._local
+        local.depth = getattr(local, 'depth', 0) + 1
+        try:
+            with self._lock:
+                self._catch_up()
+                yield
+        finally:
+            local.depth -= 1
+            unsynced = getattr(local, 'unsynced', None)
+            if local.depth == 0 and unsynced is not None:
+                local.unsynced = None
+                try:
+                    os.fsync(unsynced)
+                finally:
+                    os.close(unsynced)
+        if self.needs_compaction():
+            self.compact_in_background()
+
+    def sync(self):
+        # Apply the changes other processes have written to the journal since this process last read it
+        with self._lock:
+            self._catch_up()
+
+    def _catch_up(self):
+        # Replay new journal records into the system (the caller holds the lock). Until the bookings
+        # are loaded, only registrations, deleted accounts and new tickets are replayed: the bookings
+        # are replayed from the start of the journal along with the snapshot.
+        if self._syncing or self._system is None:
+            return  # Already replaying (the system is looking something up while applying a record), or not loaded
+        self._syncing = True
+        try:
+            generation = _journal_generation(self._journal_file)
+            if generation != self._generation:
+                # Another process compacted the journal: finish the old one, then read the new one
+                if not os.path.exists(self._prev_file) or _journal_generation(self._prev_file) != self._generation:
+                    # More than one compaction happened since the last sync, so start again from the snapshots
+                    self._syncing = False
+                    self._system.clear()
+                    self.load(self._system)
+                    return
+                self._replay(self._prev_file)
+                self._users.clear_dirty()  # The process that compacted has saved these changes
+                self._generation = generation
+                self._offset = 0
+                self._pending = 0
+            self._replay(self._journal_file)
+        finally:
+            self._syncing = False
+
+    def _replay(self, filename):
+        # Apply every record after this process's offset in a journal file (only the account and
+        # ticket records if the bookings are not loaded yet)
+        for record, self._offset in _read_records(filename, self._offset):
+            tag = record[0]
+            if tag == GENERATION or (not self._bookings_loaded and tag not in (USER, DELETE_USER, TICKET)):
+                continue
+            self._pending += 1
+            if tag == CANCEL:
+                self._system.apply_cancel(record[1])
+            elif tag == USER:
+                self._system.apply_user(record[1])
+                self._users.put(record[1])
+            elif tag == DELETE_USER:
+                self._system.apply_user_deleted(record[1])
+                self._users.delete(record[1])
+            elif tag == TICKET:
+                self._system.apply_ticket(record[1])
+            else:
+                self._system.apply_booking(record)
+
+    def load_sales_analytics(self):
+        # Every booking is loaded up front, so the system builds the rollups from them
+        return None
+
+    def find_user(self, user_id):
+        # Every user is in memory once the system is up to date, so replay any new registrations
+        # (without loading the bookings, if they are not loaded yet)
+        with self._lock:
+            self._catch_up()
+        return None
+
+    def find_users(self, query, limit=50):
+        # Every user is in memory, so the system searches its own index
+        return None
+
+    def find_booking(self, booking_id):
+        # Every booking is loaded up front, so there is never one to fetch later
+        return None
+
+    def find_bookings_for_fan(self, user_id):
+        # Every booking is loaded up front, so there are never any to fetch later
+        return []
+
+    def find_bookings_for_fan_page(self, user_id, offset, limit):
+        # Every booking is loaded up front, so there are never any to fetch later
+        return [], 0
+
+    def find_bookings(self, ticket_type=None, payment_method=None, fan_id=None, since=None, until=None):
+        # Every booking is loaded up front, so the system answers queries from its own indexes
+        return []
+
+    def find_all_bookings(self):
+        # Every booking is loaded up front, so there are never any to fetch later
+        return []
+
+    def iter_bookings(self, ticket_type=None, since=None, until=None):
+        # Every booking is loaded up front, so the system streams them from memory
+        return iter(())
+
+    def save_user(self, user):
+        # Record a registration; the user store gets it at the next compaction
+        self._write((USER, user))
+        self._users.put(user)
+
+    def save_users(self, users):
+        # Record a batch of registrations with a single write
+        self._write(*[(USER, user) for user in users])
+        for user in users:
+            self._users.put(user)
+
+    def delete_user(self, user_id):
+        # Record that an account was deleted
+        self._write((DELETE_USER, user_id))
+        self._users.delete(user_id)
+
+    def save_ticket(self, ticket):
+        # Record a new ticket
+        self._write((TICKET, ticket))
+
+    def append(self, booking):
+        # Write a single booking record to the end of the journal
+        self._write(booking.to_record())
+
+    def append_many(self, bookings):
+        # Write the records of a batch of bookings with a single write and sync to disk
+        self._write(*[booking.to_record() for booking in bookings])
+
+    def append_cancel(self, booking):
+        # Record that a booking was cancelled
+        self._write((CANCEL, booking.get_booking_id()))
+
+    @metrics.timed("journal_write")
+    def _write(self, *records):
+        # Append records under the lock and make sure they reach the disk (inside lock(), once it is released)
+        with self._lock:
+            self._catch_up()
+            with open(self._journal_file, 'ab') as f:
+                f.write(b"".join(pickle.dumps(record, pickle.HIGHEST_PROTOCOL) for record in records))
+                f.flush()
+                if self._fsync:
+                    if not getattr(self._local, 'depth', 0):
+                        os.fsync(f.fileno())
+                    elif getattr(self._local, 'unsynced', None) is None:
+                        # The journal cannot be replaced while the lock is held, so every record
+                        # written inside lock() is in this file
+                        self._local.unsynced = os.dup(f.fileno())
+                self._offset = f.tell()
+            self._pending += len(records)
+
+    @metrics.timed("journal_reserve_booking_ids")
+    def reserve_booking_ids(self, count):
+        # Reserve count booking numbers and return the first. The counter file only ever grows,
+        # so no number is issued twice, even after a restart.
+        with self._lock:
+            self._catch_up()
+            try:
+                with open(self._ids_file) as f:
+                    first = int(f.read())
+            except FileNotFoundError:
+                # Data saved before the counter existed: start after the highest booking ID in use
+                first = next_booking_number(b.get_booking_id() for b in self._system.view_all_bookings())
+            tmp = self._ids_file + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write(str(first + count))
+                f.flush()
+                if self._fsync:
+                    os.fsync(f.fileno())
+            os.replace(tmp, self._ids_file)
+            return first
+
+    def needs_compaction(self):
+        # Return True once enough records have built up to be worth a new snapshot: compact_every, or
+        # a quarter of the bookings in the last snapshot if that is more, so the time spent writing
+        # snapshots stays the same per booking however many bookings there are. Never before the
+        # bookings are loaded, as a snapshot needs them all.
+        return self._bookings_loaded and self._pending >= max(self._compact_every, self._snapshot_size // 4)
+
+    def compact_in_background(self):
+        # Start compacting on a background thread, unless a compaction is already running
+        with self._compactor_lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            # Not a daemon thread, so a process that exits mid-compaction finishes the snapshot first
+            self._compactor = threading.Thread(target=self._compact_quietly, name="journal-compactor")
+            self._compactor.start()
+
+    def _compact_quietly(self):
+        # Compact on the background thread; if it fails (e.g. the disk is full), the journal still
+        # holds every change and the next booking tries again, so the error is only reported
+        try:
+            self.compact()
+        except Exception:
+            traceback.print_exc()
+            metrics.count("journal_compaction_failures_total", help_text="Background compactions that failed")
+
+    @metrics.timed("journal_compact")
+    def compact(self):
+        # Write fresh snapshots, then start a new journal; the old one is kept as the .prev file
+        # for processes that have not read to the end of it yet. The bookings are pickled without
+        # the lock held: the snapshot has the bookings as they were at one point in the journal,
+        # and the records written after that point are carried over into the new journal.
+        with self._lock:
+            self._catch_up()
+            generation, offset, pending = self._generation, self._offset, self._pending
+            bookings = self._system.view_all_bookings()  # A list of its own
+            size = len(bookings)
+        snapshot = f"{self._bookings_file}.{os.getpid()}.next"
+        try:
+            # The bookings are pickled in chunks: one pickle of them all would hold every booking's
+            # state until the end and then free it in one go, with no other thread able to run
+            save_data(snapshot, bookings, SNAPSHOT_CHUNK)
+            del bookings
+            with self._lock:
+                self._catch_up()
+                if self._generation != generation:
+                    return  # Another process compacted first; its snapshot and journal hold every change
+                tail = b""
+                if self._offset > offset:
+                    with open(self._journal_file, 'rb') as f:
+                        f.seek(offset)
+                        tail = f.read(self._offset - offset)
+                new_generation = uuid.uuid4().hex
+                new_file = self._journal_file + '.new'
+                with open(new_file, 'wb') as f:
+                    pickle.dump((GENERATION, new_generation), f, pickle.HIGHEST_PROTOCOL)
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._offset = f.tell()
+                os.replace(snapshot, self._bookings_file)
+                self._users.flush()  # Only the accounts changed since the last compaction
+                save_data(self._tickets_file, self._system.get_tickets())
+                if os.path.exists(self._journal_file):
+                    os.replace(self._journal_file, self._prev_file)
+                os.replace(new_file, self._journal_file)
+                self._generation = new_generation
+                self._pending -= pending  # The records carried over
+                self._snapshot_size = size
+        finally:
+            if os.path.exists(snapshot):
+                os.remove(snapshot)
+
+    def close(self):
+        # Wait for a background compaction to finish, then close the lock file
+        with self._compactor_lock:
+            compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        self._lock.close()
+
+
+def _read_records(filename, offset=0):
+    # Yield (record, offset after it) for every complete record after the offset,
+    # dropping a torn record left by a crash (only called with the lock held)
+    if not os.path.exists(filename):
+        return
+    with open(filename, 'rb') as f:
+        good = f.seek(offset)
+        while True:
+            try:
+                record = pickle.load(f)
+            except Exception:
+                # End of file, or a partially written record that can only be the last one
+                break
+            good = f.tell()
+            yield record, good
+        torn = f.seek(0, os.SEEK_END) > good
+    if torn:
+        with open(filename, 'r+b') as f:
+            f.truncate(good)
+
+
+def _replay_accounts(filename, users, tickets):
+    # Return the users and tickets in the snapshots with the registrations, deleted accounts
+    # and new tickets in a journal applied, skipping its bookings, and how far the journal was read
+    users = {u.get_user_id(): u for u in users}
+    tickets = {t.get_ticket_id(): t for t in tickets}
+    offset = 0
+    for record, offset in _read_records(filename):
+        if record[0] == USER:
+            users.setdefault(record[1].get_user_id(), record[1])
+        elif record[0] == DELETE_USER:
+            users.pop(record[1], None)
+        elif record[0] == TICKET:
+            tickets[record[1].get_ticket_id()] = record[1]
+    return list(users.values()), list(tickets.values()), offset
+
+
+def _journal_generation(filename):
+    # Return the generation a journal was started with (None for a journal started before compaction)
+    try:
+        with open(filename, 'rb') as f:
+            record = pickle.load(f)
+    except Exception:
+        return None
+    return record[1] if record[0] == GENERATION else None
+
+
+def _find_fan(fans, fan_id):
+    # Return the fan with the given ID, or a detached fan if the account was deleted after booking
+    fan = fans.get(fan_id)
+    if fan is None:
+        fan = fans[fan_id] = Fan(fan_id, "", "")
+    return fan
+
+
+@metrics.timed("load_data")
+def load_data(filename):
+    # Load a pickled list (or a list saved in chunks) from a file, or return an empty list if it does not exist
+    if os.path.exists(filename):
+        with open(filename, 'rb') as f:
+            data = pickle.load(f)
+            end = os.fstat(f.fileno()).st_size
+            while f.tell() < end:
+                data.extend(pickle.load(f))
+            return data
+    return []
+
+
+@metrics.timed("save_data")
+def save_data(filename, data, chunk_size=None):
+    # Write a pickle file atomically so a crash never leaves a half-written snapshot. With a
+    # chunk_size, a list is written as one pickle per chunk_size items.
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        if chunk_size is None:
+            pickle.dump(data, f)
+        else:
+            for start in range(0, max(len(data), 1), chunk_size):
+                pickle.dump(data[start:start + chunk_size], f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from user import Fan, ROLES
+from ticket_system import TicketSystem, BatchBookingError
+from storage import open_store, open_pricing
+
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"  # host:port, or unix:/path/to/socket
+
+
+class BookingServer:
+    """Local booking service that owns the one TicketSystem shared by every GUI client.
+
+    Clients send one JSON request per line, e.g. {"op": "book", "fan_id": "F1", ...}, and get one
+    JSON response per line: {"ok": true, "result": ...} or {"ok": false, "error": "..."}. Any number
+    of clients can be connected. Requests run on a pool of worker threads, so one waiting for the
+    disk holds up no other client (the store's lock keeps the system consistent); each client's
+    requests are answered in the order they were sent.
+    """
+
+    def __init__(self, system, workers=8):
+        # Initialize the server with the system it serves, its worker threads and the handler for each request
+        self._system = system
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="booking-server")
+        self._handlers = {
+            "login": self.login,
+            "register": self.register,
+            "delete_user": self.delete_user,
+            "tickets": self.tickets,
+            "quote": self.quote,
+            "book": self.book,
+            "book_many": self.book_many,
+            "book_group": self.book_group,
+            "cancel": self.cancel,
+            "history": self.history,
+            "history_page": self.history_page,
+            "sales": self.sales,
+            "analytics": self.analytics,
+            "find_bookings": self.find_bookings,
+            "search_users": self.search_users,
+        }
+
+    async def start(self, address=DEFAULT_ADDRESS):
+        # Start listening on a TCP host:port or a unix:/path socket and return the asyncio server
+        if address.startswith("unix:"):
+            return await asyncio.start_unix_server(self._serve, address[len("unix:"):])
+        host, port = address.rsplit(":", 1)
+        return await asyncio.start_server(self._serve, host, int(port))
+
+    async def _serve(self, reader, writer):
+        # Answer one client's requests until it disconnects
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await loop.run_in_executor(self._executor, self.respond, line)
+                writer.write(response)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, line):
+        # Run one JSON request and return its response as a line of JSON (encoded on the worker thread,
+        # so the event loop never reads data a booking on another thread may be changing)
+        try:
+            return json.dumps(self.handle(line)).encode() + b"\n"
+        except Exception as e:
+            traceback.print_exc()
+            return json.dumps({"ok": False, "error": f"The server could not send its response: {e}"}).encode() + b"\n"
+
+    def handle(self, line):
+        # Run one JSON request and return its response
+        try:
+            request = json.loads(line)
+            handler = self._handlers.get(request.get("op"))
+            if handler is None:
+                raise ValueError(f"Unknown request: {request.get('op')}")
+            return {"ok": True, "result": handler(request)}
+        except BatchBookingError as e:
+            return {"ok": False, "error": str(e), "errors": e.errors}
+        except KeyError as e:
+            return {"ok": False, "error": f"Missing field: {e}"}
+        except (ValueError, TypeError, AttributeError) as e:
+            return {"ok": False, "error": str(e)}
+        except Exception as e:
+            # Anything else (e.g. an OSError from the store) is the server's fault, not the request's:
+            # answer it all the same, so the client is not left waiting on a dropped connection
+            traceback.print_exc()
+            return {"ok": False, "error": f"The server could not complete the request: {e}"}
+
+    def login(self, request):
+        # Return the user with the given ID (and role, if one is given), or None if not found
+        user = self._system.get_user(request["user_id"])
+        if user is None or request.get("role") not in (None, ROLES[type(user)]):
+            return None
+        return user_json(user)
+
+    def register(self, request):
+        # Register a new fan
+        self._system.register_user(Fan(request["user_id"], request["name"], request["email"]))
+
+    def delete_user(self, request):
+        # Delete a user's account and return it, or None if not found
+        user = self._system.delete_user(request["user_id"])
+        return user_json(user) if user is not None else None
+
+    def tickets(self, request):
+        # Return every ticket on sale
+        return [ticket_json(ticket) for ticket in self._system.get_tickets()]
+
+    def quote(self, request):
+        # Return the price of a booking without making it
+        quote = self._system.quote(request["ticket_id"], request["quantity"], request.get("payment_method"),
+                                   request.get("promo_code"))
+        return {"subtotal": quote.get_subtotal(), "adjustments": quote.get_adjustments(),
+                "total": quote.get_total(), "bulk_discount": quote.is_bulk_discount()}
+
+    def book(self, request):
+        # Book tickets for a fan and return the booking
+        booking = self._system.book_ticket(self._fan(request["fan_id"]), request["ticket_id"],
+                                           request["quantity"], request["payment_method"],
+                                           request.get("promo_code"))
+        return booking_json(booking)
+
+    def book_many(self, request):
+        # Book a batch of [fan_id, ticket_id, quantity, payment_method] requests all at once
+        bookings = self._system.book_many([(self._system.get_fan(fan_id), ticket_id, quantity, payment_method)
+                                           for fan_id, ticket_id, quantity, payment_method in request["requests"]])
+        return [booking_json(booking) for booking in bookings]
+
+    def book_group(self, request):
+        # Book a group of independent [fan_id, ticket_id, quantity, payment_method, promo_code] requests
+        # with one write, returning each one's booking or error
+        requests = [(self._system.get_fan(fan_id), ticket_id, quantity, payment_method, promo_code)
+                    for fan_id, ticket_id, quantity, payment_method, promo_code in request["requests"]]
+        results = self._system.book_group(requests)
+        return [{"error": str(result)} if isinstance(result, Exception) else {"booking": booking_json(result)}
+                for result in results]
+
+    def cancel(self, request):
+        # Cancel a booking and return it
+        return booking_json(self._system.cancel_booking(request["booking_id"]))
+
+    def history(self, request):
+        # Return a fan's bookings in the order they were made (none if the account no longer exists)
+        fan = self._system.get_fan(request["fan_id"])
+        return [booking_json(booking) for booking in fan.get_booking_history()] if fan is not None else []
+
+    def history_page(self, request):
+        # Return one page of a fan's bookings, newest first, and the fan's total number of bookings
+        fan = self._system.get_fan(request["fan_id"])
+        if fan is None:
+            return {"bookings": [], "total": 0}
+        bookings, total = self._system.get_booking_history_page(fan, request["offset"], request["limit"])
+        return {"bookings": [booking_json(booking) for booking in bookings], "total": total}
+
+    def sales(self, request):
+        # Return the running sales and revenue totals
+        self._system.refresh()  # Include changes made by any process writing to the store directly
+        return self._system.export_sales_summary()
+
+    def analytics(self, request):
+        # Return the hourly and daily sales rollups
+        self._system.refresh()
+        return self._system.export_sales_analytics()
+
+    def find_bookings(self, request):
+        # Return the bookings matching a query (dates as ISO strings), oldest first
+        self._system.refresh()
+        since, until = (datetime.fromisoformat(request[key]) if request.get(key) else None
+                        for key in ("since", "until"))
+        bookings = self._system.find_bookings(request.get("ticket_type"), request.get("payment_method"),
+                                              request.get("fan_id"), since, until)
+        return [booking_json(booking) for booking in bookings]
+
+    def search_users(self, request):
+        # Return the users whose name or email contains the query
+        return [user_json(user) for user in self._system.search_users(request["query"], request.get("limit", 50))]
+
+    def _fan(self, fan_id):
+        # Return the fan with the given ID, failing if there is none
+        fan = self._system.get_fan(fan_id)
+        if fan is None:
+            raise ValueError("Fan not found.")
+        return fan
+
+
+def user_json(user):
+    # Convert a user to its JSON form
+    return {"role": ROLES[type(user)], "record": list(user.to_record())}
+
+
+def ticket_json(ticket):
+    # Convert a ticket to its JSON form
+    return {"record": list(ticket.to_record()), "remaining": ticket.get_remaining()}
+
+
+def booking_json(booking):
+    # Convert a booking to its JSON form (the record, with the date as ISO text)
+    record = booking.to_record()
+    return list(record[:5]) + [record[5].isoformat()] + list(record[6:])
+
+
+async def serve(system, address=DEFAULT_ADDRESS):
+    # Serve the system until the process is stopped
+    server = await BookingServer(system).start(address)
+    print(f"Booking server listening on {address}")
+    async with server:
+        await server.serve_forever()
+
+
+# --- Run the server ---
+if __name__ == "__main__":
+    # Usage: python booking_server.py [host:port | unix:/path/to/socket]
+    # The GUIs use it when GRANDPRIX_SERVER is set to the same address.
+    address = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('GRANDPRIX_SERVER', DEFAULT_ADDRESS)
+    system = TicketSystem(open_store(), open_pricing())
+    system.load_saved_data()
+    try:
+        asyncio.run(serve(system, address))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,94 @@
+import atexit
+import queue
+import threading
+from concurrent.futures import Future
+
+import metrics
+
+
+class BookingWriter:
+    """Books tickets on a background thread, so a GUI never waits for a booking to reach the disk.
+
+    submit() queues a booking request and returns a Future straight away. The writer thread takes
+    every request queued by the time it is free (up to max_batch) and books them together with
+    TicketSystem.book_group(), so a burst of bookings costs one durable write (one fsync or one
+    SQLite commit) rather than one each: the longer a write takes, the more requests the next one
+    carries. A request's Future is resolved with its Booking, or the ValueError it failed with, only
+    once the write is complete. close() books whatever is still queued and stops the thread; it
+    also runs at exit.
+    """
+
+    def __init__(self, system, max_batch=500):
+        # Start the writer thread for the given system (a TicketSystem or RemoteTicketSystem)
+        self._system = system
+        self._max_batch = max_batch
+        self._queue = queue.Queue()  # (request, Future), or None once closed
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self.commits = 0  # Group commits so far
+        self._thread = threading.Thread(target=self._run, name="booking-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, fan, ticket_id, quantity, payment_method, promo_code=None):
+        # Queue a booking and return a Future for it
+        future = Future()
+        with self._close_lock:
+            if self._closed:
+                raise ValueError("No more bookings can be made: the system is shutting down.")
+            self._queue.put(((fan, ticket_id, quantity, payment_method, promo_code), future))
+        return future
+
+    def pending(self):
+        # Return roughly how many requests are waiting for the writer
+        return self._queue.qsize()
+
+    def close(self, timeout=None):
+        # Book every request already queued, then stop the writer thread
+        with self._close_lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        # Book queued requests in groups until closed
+        while True:
+            batch = []
+            item = self._queue.get()  # Wait for the first request of the next group
+            while item is not None:
+                batch.append(item)
+                if len(batch) == self._max_batch:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._commit(batch)
+            if item is None:
+                return
+
+    def _commit(self, batch):
+        # Book a group of requests with one write and resolve their Futures
+        metrics.count("booking_writer_requests_total", len(batch), "Bookings queued to the background writer")
+        try:
+            results = self._system.book_group([request for request, _ in batch])
+        except Exception as e:
+            # Nothing in the group was saved (e.g. the disk is full), so every request fails with
+            # a ValueError a window can show, like any other booking that could not be made
+            if not isinstance(e, ValueError):
+                error = ValueError(f"The booking could not be saved: {e}")
+                error.__cause__ = e
+                e = error
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            self.commits += 1
+            metrics.count("booking_writer_commits_total", help_text="Group commits made by the background writer")
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
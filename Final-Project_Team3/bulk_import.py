@@ -0,0 +1,265 @@
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+
+from user import Fan
+from ticket_system import TicketSystem, BatchBookingError
+from storage import open_store, open_pricing
+
+
+# Columns (CSV header) or keys (one JSON object per line) each kind of file must have
+FAN_FIELDS = ("user_id", "name", "email")
+BOOKING_FIELDS = ("booking_id", "fan_id", "ticket_id", "quantity", "payment_method", "date")  # total_price optional
+
+
+def read_rows(path, skip=0):
+    # Yield (line number, row dict) for every row of a CSV or JSON Lines file after the first skip rows,
+    # reading one line at a time. A JSON line that cannot be parsed is yielded as (line number, None).
+    if path.lower().endswith((".jsonl", ".ndjson", ".json")):
+        with open(path, encoding="utf-8") as f:
+            for number, line in islice(((n, line) for n, line in enumerate(f, 1) if line.strip()), skip, None):
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield number, row if isinstance(row, dict) else None
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:  # utf-8-sig: spreadsheets often add a BOM
+            reader = csv.DictReader(f)
+            for row in islice(reader, skip, None):
+                yield reader.line_num, row
+
+
+def parse_fan(row):
+    # Return the Fan a row describes, or raise ValueError saying what is wrong with it
+    user_id, name, email = (str(row.get(field) or "").strip() for field in FAN_FIELDS)
+    if not user_id:
+        raise ValueError("Missing user_id")
+    if not name:
+        raise ValueError("Missing name")
+    if "@" not in email:
+        raise ValueError("Invalid email")
+    return Fan(user_id, name, email)
+
+
+def parse_booking(row, system):
+    # Return the booking record a row describes, pricing it with the system's pricing engine if it has
+    # no total_price, or raise ValueError saying what is wrong with it
+    booking_id, fan_id, ticket_id, quantity, payment_method, date = (str(row.get(field) or "").strip()
+                                                                    for field in BOOKING_FIELDS)
+    for field, value in zip(BOOKING_FIELDS, (booking_id, fan_id, ticket_id, payment_method)):
+        if not value:
+            raise ValueError(f"Missing {field}")
+    try:
+        quantity = int(quantity)
+    except ValueError:
+        raise ValueError("Invalid quantity") from None
+    try:
+        date = datetime.fromisoformat(date)
+    except ValueError:
+        raise ValueError("Invalid date") from None
+    if date.tzinfo is not None:
+        raise ValueError("Date must not have a time zone")  # Booking dates are naive local times
+    total = str(row.get("total_price") or "").strip()
+    if total:
+        try:
+            total = float(total)
+        except ValueError:
+            raise ValueError("Invalid total_price") from None
+    else:
+        quote = system.quote(ticket_id, quantity, payment_method)
+        return (booking_id, fan_id, ticket_id, quantity, payment_method, date, quote.get_total(),
+                quote.is_bulk_discount())
+    return (booking_id, fan_id, ticket_id, quantity, payment_method, date, total)
+
+
+def parse_rows(rows, parse, rejects):
+    # Yield (line number, parsed item) for every row parse() accepts, reporting the others to rejects
+    for number, row in rows:
+        if row is None:
+            rejects(number, "Not a JSON object")
+            continue
+        try:
+            yield number, parse(row)
+        except ValueError as e:
+            rejects(number, str(e))
+
+
+def chunked(items, size):
+    # Yield lists of up to size items, so only one chunk is ever held in memory
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ImportProgress:
+    """Counts of an import, saved to a checkpoint file after every committed chunk so it can resume.
+
+    The checkpoint sits next to the source file (fans.csv.progress for fans.csv) and records how many
+    rows of it are done, along with the file's size and modification time: if the file has changed
+    since, the checkpoint no longer applies and the import starts from the top. Rows already
+    imported are skipped as duplicates in any case, so starting again is safe, only slower.
+    """
+
+    def __init__(self, path, resume=True):
+        # Load the checkpoint for a source file, if there is one that still matches it (and resume is True)
+        self._checkpoint = path + ".progress"
+        self._source = _file_version(path)
+        self.rows = self.imported = self.duplicates = self.rejected = 0
+        self.resumed = False
+        if not resume:
+            return
+        try:
+            with open(self._checkpoint) as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if saved.get("source") == self._source:
+            self.rows = saved["rows"]
+            self.imported = saved["imported"]
+            self.duplicates = saved["duplicates"]
+            self.rejected = saved["rejected"]
+            self.resumed = True
+
+    def save(self):
+        # Write the checkpoint atomically, so a crash leaves either the old one or the new one
+        tmp = self._checkpoint + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"source": self._source, "rows": self.rows, "imported": self.imported,
+                       "duplicates": self.duplicates, "rejected": self.rejected}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._checkpoint)
+
+    def finish(self):
+        # Remove the checkpoint once the whole file is imported
+        if os.path.exists(self._checkpoint):
+            os.remove(self._checkpoint)
+
+    def __str__(self):
+        # Return the counts as a progress line
+        return (f"{self.rows:,} rows: {self.imported:,} imported, {self.duplicates:,} duplicates, "
+                f"{self.rejected:,} rejected")
+
+
+def import_file(system, kind, path, chunk_size=5000, restart=False, report=print):
+    # Stream a CSV or JSON Lines file of fans or bookings into the system in chunks of chunk_size
+    # rows, each added and saved with a single write, and return the ImportProgress. Rows that
+    # cannot be imported are listed with the reason in <path>.rejects. An interrupted import picks
+    # up after the last committed chunk when run again, unless restart=True.
+    if kind not in ("fans", "bookings"):
+        raise ValueError("Import either fans or bookings")
+    progress = ImportProgress(path, resume=not restart)
+    if progress.resumed:
+        report(f"Resuming after {progress}")
+
+    rejects_file = open(path + ".rejects", "a" if progress.resumed else "w", encoding="utf-8")
+    chunk_rejects = []
+
+    def reject(number, message):
+        # Hold a rejected row until the chunk it was read with is committed
+        chunk_rejects.append((number, message))
+
+    if kind == "fans":
+        parse = parse_fan
+    else:
+        parse = lambda row: parse_booking(row, system)
+    counted = _RowCounter(read_rows(path, skip=progress.rows))
+    items = parse_rows(counted, parse, reject)
+    started = time.perf_counter()
+    done_before = progress.rows
+    try:
+        for chunk in chunked(items, chunk_size):
+            numbers = [number for number, _ in chunk]
+            parsed = [item for _, item in chunk]
+            if kind == "fans":
+                added, duplicates = system.import_users(parsed)
+            else:
+                added, duplicates = _import_bookings(system, numbers, parsed, reject)
+            progress.imported += len(added)
+            progress.duplicates += len(duplicates)
+            _commit_chunk(progress, counted, chunk_rejects, rejects_file)
+            elapsed = time.perf_counter() - started
+            report(f"{progress} ({(progress.rows - done_before) / max(elapsed, 1e-9):,.0f} rows/s)")
+        _commit_chunk(progress, counted, chunk_rejects, rejects_file)  # Rejected rows after the last chunk
+    finally:
+        rejects_file.close()
+    progress.finish()
+    if not progress.rejected:
+        os.remove(path + ".rejects")
+    return progress
+
+
+def _import_bookings(system, numbers, records, reject):
+    # Import a chunk of booking records, rejecting the ones the system refuses and importing the rest
+    while records:
+        try:
+            return system.import_bookings(records)
+        except BatchBookingError as e:
+            bad = dict(e.errors)
+            for index, message in e.errors:
+                reject(numbers[index], message)
+            numbers = [number for index, number in enumerate(numbers) if index not in bad]
+            records = [record for index, record in enumerate(records) if index not in bad]
+    return [], []
+
+
+def _commit_chunk(progress, counted, chunk_rejects, rejects_file):
+    # Record that every row read so far is done: write its rejects, then the checkpoint
+    if chunk_rejects:
+        rejects_file.writelines(f"line {number}: {message}\n" for number, message in sorted(chunk_rejects))
+        rejects_file.flush()
+        os.fsync(rejects_file.fileno())
+        progress.rejected += len(chunk_rejects)
+        chunk_rejects.clear()
+    progress.rows += counted.take()
+    progress.save()
+
+
+class _RowCounter:
+    """Wraps an iterator of rows, counting how many have been read since last asked."""
+
+    def __init__(self, rows):
+        # Start counting the rows
+        self._rows = rows
+        self._count = 0
+
+    def __iter__(self):
+        # Yield the rows, counting each one
+        for row in self._rows:
+            self._count += 1
+            yield row
+
+    def take(self):
+        # Return the number of rows read since the last call
+        count, self._count = self._count, 0
+        return count
+
+
+def _file_version(path):
+    # Return the size and modification time of a file, to tell whether it changed
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+# --- Bulk import ---
+if __name__ == "__main__":
+    # Usage: python bulk_import.py fans|bookings <file.csv|file.jsonl> [chunk size] [--restart]
+    args = [arg for arg in sys.argv[1:] if arg != "--restart"]
+    if len(args) < 2:
+        print("Usage: python bulk_import.py fans|bookings <file.csv|file.jsonl> [chunk size] [--restart]")
+        sys.exit(2)
+    system = TicketSystem(open_store(), open_pricing())
+    system.load_saved_data(lazy=True)
+    result = import_file(system, args[0], args[1], int(args[2]) if len(args) > 2 else 5000,
+                         restart="--restart" in sys.argv)
+    print(f"Done: {result}")
+    if result.rejected:
+        print(f"Rejected rows are listed in {args[1]}.rejects")
@@ -0,0 +1,70 @@
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Exclusive lock shared by every process (and thread) that opens the same lock file; re-entrant."""
+
+    def __init__(self, path):
+        # Initialize the lock; the lock file is created the first time the lock is taken
+        self._path = path
+        self._thread_lock = threading.RLock()  # flock/msvcrt locks do not exclude threads of one process
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        # Wait until no other process or thread holds the lock, then take it
+        self._thread_lock.acquire()
+        self._depth += 1
+        if self._depth == 1:
+            try:
+                if self._file is None:
+                    self._file = open(self._path, 'a+b')
+                _lock_file(self._file)
+            except BaseException:
+                self._depth -= 1
+                self._thread_lock.release()
+                raise
+        return self
+
+    def __exit__(self, *exc_info):
+        # Release the lock once the outermost holder is done
+        self._depth -= 1
+        if self._depth == 0:
+            _unlock_file(self._file)
+        self._thread_lock.release()
+
+    def close(self):
+        # Close the lock file
+        with self._thread_lock:
+            if self._file is not None and self._depth == 0:
+                self._file.close()
+                self._file = None
+
+
+def _lock_file(f):
+    # Block until this process holds the exclusive lock on the file
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # Retries for about 10 seconds
+                return
+            except OSError:
+                continue
+
+
+def _unlock_file(f):
+    # Release this process's lock on the file
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,45 @@
+import threading
+
+
+class IdAllocator:
+    """Hands out unique booking IDs from blocks of numbers reserved in a persistent counter.
+
+    reserve(count) must reserve count numbers that no other allocator will ever issue (e.g. by
+    advancing a counter the store keeps) and return the first. Each process reserves a whole
+    block at once and then issues IDs from it without going back to the store, so parallel
+    workers only coordinate once per block. Numbers are never reused, even after a cancellation
+    or a restart; whatever is left of a block when a process exits is skipped.
+    """
+
+    def __init__(self, reserve, block_size=100, prefix="B"):
+        # Initialize the allocator with the function that reserves a block of numbers
+        self._reserve = reserve
+        self._block_size = block_size
+        self._prefix = prefix
+        self._next = 0  # Next number of the current block
+        self._end = 0  # End of the current block
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        # Return a new booking ID, reserving a new block first if this one is used up
+        return self.next_ids(1)[0]
+
+    def next_ids(self, count):
+        # Return count new booking IDs, in increasing order
+        ids = []
+        with self._lock:
+            while len(ids) < count:
+                if self._next == self._end:
+                    size = max(self._block_size, count - len(ids))
+                    self._next = self._reserve(size)
+                    self._end = self._next + size
+                take = min(count - len(ids), self._end - self._next)
+                ids.extend(f"{self._prefix}{number}" for number in range(self._next, self._next + take))
+                self._next += take
+        return ids
+
+
+def next_booking_number(booking_ids):
+    # Return the number after the highest "B<number>" booking ID in use (1 if there are none)
+    return max((int(booking_id[1:]) for booking_id in booking_ids
+                if booking_id[:1] == "B" and booking_id[1:].isdigit()), default=0) + 1
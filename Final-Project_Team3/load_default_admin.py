@@ -1,27 +1,18 @@
-import pickle
 from user import Admin
+from storage import open_system
 
 
 # Create a sample admin user
 admin = Admin("1234", "AdminUser", "admin@example.com")
 
 
-# Load existing users or create new list
-try:
-   with open("users.pkl", "rb") as f:
-       users = pickle.load(f)
-except:
-   users = []
+# Open the saved users (the user store, or the SQLite database if GRANDPRIX_DB is set)
+system = open_system()
 
 
-# Add admin only if not already present
-if not any(u.get_user_id() == "1234" for u in users):
-   users.append(admin)
-
-
-# Save back to file
-with open("users.pkl", "wb") as f:
-   pickle.dump(users, f)
+# Add admin only if not already present (saved as one record, without rewriting the other users)
+if system.get_user("1234") is None:
+   system.register_user(admin)
 
 
 print("Admin user '1234' added.")
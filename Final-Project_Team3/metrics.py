@@ -0,0 +1,174 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+
+# Metrics are collected only when GRANDPRIX_METRICS names the file to write them to, e.g.
+# GRANDPRIX_METRICS=metrics-{pid}.prom (Prometheus text format) or metrics.json (a JSON snapshot).
+# The file is rewritten every GRANDPRIX_METRICS_INTERVAL seconds (30 by default) and at exit.
+PATH = os.environ.get("GRANDPRIX_METRICS", "").format(pid=os.getpid())
+ENABLED = bool(PATH)
+INTERVAL = float(os.environ.get("GRANDPRIX_METRICS_INTERVAL", "30"))
+PREFIX = "grandprix_"
+
+# Upper bounds of the latency histogram buckets, in seconds (+Inf is implied)
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """A count that only goes up, e.g. bookings made."""
+
+    def __init__(self, name, help_text):
+        # Start at zero
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        # Add to the count
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Latencies counted into BUCKETS, with their total, count and maximum."""
+
+    def __init__(self, name, help_text):
+        # Start with every bucket empty
+        self.name = name
+        self.help = help_text
+        self.counts = [0] * (len(BUCKETS) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        # Count one latency
+        i = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+
+_counters = {}  # name -> Counter
+_histograms = {}  # name -> Histogram
+_registry_lock = threading.Lock()
+
+
+def counter(name, help_text=""):
+    # Return the counter with the given name, creating it the first time
+    with _registry_lock:
+        if name not in _counters:
+            _counters[name] = Counter(name, help_text)
+        return _counters[name]
+
+
+def histogram(name, help_text=""):
+    # Return the latency histogram with the given name, creating it the first time
+    with _registry_lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(name, help_text)
+        return _histograms[name]
+
+
+def count(name, amount=1, help_text=""):
+    # Add to a counter if metrics are enabled (otherwise this does nothing)
+    if ENABLED:
+        counter(name, help_text).inc(amount)
+
+
+def timed(name, help_text=""):
+    # Decorator that records how long each call takes in the histogram <name>_seconds and counts the
+    # calls that raise in <name>_errors_total. When metrics are disabled the function is returned
+    # as it is, so it costs nothing at all.
+    def decorate(function):
+        if not ENABLED:
+            return function
+        latencies = histogram(name + "_seconds", help_text or f"Time spent in {function.__qualname__}")
+        errors = counter(name + "_errors_total", f"Calls of {function.__qualname__} that raised")
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except BaseException:
+                errors.inc()
+                raise
+            finally:
+                latencies.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    # Return every metric as a JSON-ready dict (bucket counts are cumulative, as in Prometheus)
+    with _registry_lock:
+        counters, histograms = list(_counters.values()), list(_histograms.values())
+    result = {"time": time.time(), "pid": os.getpid(), "counters": {}, "histograms": {}}
+    for c in counters:
+        result["counters"][PREFIX + c.name] = c.value
+    for h in histograms:
+        with h._lock:
+            counts, total, calls, slowest = list(h.counts), h.sum, h.count, h.max
+        cumulative, buckets = 0, {}
+        for bound, n in zip(BUCKETS + (float("inf"),), counts):
+            cumulative += n
+            buckets["+Inf" if bound == float("inf") else repr(bound)] = cumulative
+        result["histograms"][PREFIX + h.name] = {
+            "count": calls, "sum": total, "max": slowest, "mean": total / calls if calls else 0.0,
+            "buckets": buckets,
+        }
+    return result
+
+
+def prometheus_text(data=None):
+    # Return a snapshot in the Prometheus text exposition format
+    data = data or snapshot()
+    lines = []
+    with _registry_lock:
+        helps = {PREFIX + m.name: m.help for m in list(_counters.values()) + list(_histograms.values())}
+    for name, value in sorted(data["counters"].items()):
+        lines += [f"# HELP {name} {helps.get(name, '')}", f"# TYPE {name} counter", f"{name} {value}"]
+    for name, h in sorted(data["histograms"].items()):
+        lines += [f"# HELP {name} {helps.get(name, '')}", f"# TYPE {name} histogram"]
+        lines += [f'{name}_bucket{{le="{bound}"}} {n}' for bound, n in h["buckets"].items()]
+        lines += [f"{name}_sum {h['sum']}", f"{name}_count {h['count']}"]
+    return "\n".join(lines) + "\n"
+
+
+def dump(path=None):
+    # Write every metric to a file (JSON if it ends in .json, otherwise Prometheus text), atomically
+    path = path or PATH
+    data = snapshot()
+    text = json.dumps(data, indent=1) if path.endswith(".json") else prometheus_text(data)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _dump_every(interval):
+    # Rewrite the metrics file every interval seconds (runs on a daemon thread)
+    while True:
+        time.sleep(interval)
+        try:
+            dump()
+        except OSError:
+            pass  # Try again next time; metrics must never stop the application
+
+
+if ENABLED:
+    atexit.register(dump)
+    if INTERVAL > 0:
+        threading.Thread(target=_dump_every, args=(INTERVAL,), daemon=True).start()
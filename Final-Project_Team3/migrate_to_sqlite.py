@@ -0,0 +1,28 @@
+import sys
+
+from ticket_system import TicketSystem
+from booking_journal import BookingJournal
+from sqlite_store import SQLiteStore
+
+
+def migrate(db_path='grandprix.db', journal=None):
+    # Copy every user, ticket and booking from the pickle files (and booking journal) into a SQLite database
+    system = TicketSystem(journal or BookingJournal())
+    system.load_saved_data()
+    users = system.get_users()
+    tickets = system.get_tickets()
+    bookings = [b.to_record() for b in system.view_all_bookings()]
+
+    store = SQLiteStore(db_path)
+    store.import_data(users, tickets, bookings)
+    store.close()
+    return len(users), len(tickets), len(bookings)
+
+
+# --- Migration ---
+if __name__ == "__main__":
+    # Usage: python migrate_to_sqlite.py [database file]
+    db_path = sys.argv[1] if len(sys.argv) > 1 else 'grandprix.db'
+    users, tickets, bookings = migrate(db_path)
+    print(f"Imported {users} users, {tickets} tickets and {bookings} bookings into {db_path}")
+    print(f"Set GRANDPRIX_DB={db_path} to run the GUIs on the database.")
@@ -0,0 +1,154 @@
+import json
+import os
+from bisect import bisect_right
+from datetime import datetime
+
+
+# The pricing used when no rules file is given: 10% off bookings of 5 or more tickets
+DEFAULT_RULES = {"quantity_tiers": [[5, 10]]}
+MAX_CACHED_QUOTES = 1024  # Quotes kept per ticket before its cache starts again
+MAX_CACHED_TICKETS = 256  # Tickets with cached quotes before the whole cache starts again
+
+
+class PricingEngine:
+    """Works out booking totals from pricing rules, compiled once into lookup tables.
+
+    Rules are plain data (see DEFAULT_RULES and load_rules()):
+      quantity_tiers      [[min quantity, % off], ...]
+      early_bird          [{"until": ISO date, "percent_off": n, "tickets": [ticket IDs] (optional)}, ...]
+      payment_surcharges  {payment method: % added}
+      promo_codes         {code: {"percent_off": n or "amount_off": AED, "tickets": [...] (optional),
+                                  "expires": ISO date (optional)}}
+    Quotes are cached per ticket, up to MAX_CACHED_QUOTES each; a ticket's cached quotes are dropped
+    as soon as its price changes. A quote with a quantity tier discount is a bulk discount booking.
+    """
+
+    def __init__(self, rules=None):
+        # Compile the rules into sorted tables, so a quote is a few lookups and a bisect
+        rules = DEFAULT_RULES if rules is None else rules
+        tiers = sorted(rules.get("quantity_tiers", []))
+        self._tier_quantities = [quantity for quantity, _ in tiers]
+        self._tier_percents = [percent for _, percent in tiers]
+        windows = sorted((datetime.fromisoformat(window["until"]), window["percent_off"],
+                          frozenset(window.get("tickets", ()))) for window in rules.get("early_bird", []))
+        self._early_bird_ends = [until for until, _, _ in windows]  # Sorted, for finding the windows still open
+        self._early_bird = windows
+        self._surcharges = dict(rules.get("payment_surcharges", {}))
+        self._promos = {code.upper(): (promo.get("percent_off", 0), promo.get("amount_off", 0),
+                                       frozenset(promo.get("tickets", ())),
+                                       datetime.fromisoformat(promo["expires"]) if "expires" in promo else None)
+                        for code, promo in rules.get("promo_codes", {}).items()}
+        self._cache = {}  # ticket_id -> (price the quotes were made at, {quote key: Quote})
+
+    @classmethod
+    def load_rules(cls, path):
+        # Return an engine for the JSON rules file at path, or the default rules if there is none
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def quote(self, ticket, quantity, payment_method=None, promo_code=None, when=None):
+        # Return the Quote for booking quantity of a ticket, failing on an unknown or expired promo code
+        when = when or datetime.now()
+        code = (promo_code or "").strip().upper() or None
+        if code is not None:
+            self._check_promo(code, when)
+        # Quotes only change when an early-bird window closes, so the open windows are part of the key
+        window = bisect_right(self._early_bird_ends, when)
+        key = (quantity, payment_method, code, window)
+        price, quotes = self._cache.get(ticket.get_ticket_id(), (None, None))
+        if price != ticket.get_price() or len(quotes) >= MAX_CACHED_QUOTES:
+            if price is None and len(self._cache) >= MAX_CACHED_TICKETS:
+                self._cache.clear()
+            quotes = {}
+            self._cache[ticket.get_ticket_id()] = (ticket.get_price(), quotes)
+        result = quotes.get(key)
+        if result is None:
+            result = quotes[key] = self._evaluate(ticket, quantity, payment_method, code, window)
+        return result
+
+    def is_bulk_discount(self, quantity):
+        # Return True if booking this many tickets gets a quantity tier discount
+        tier = bisect_right(self._tier_quantities, quantity) - 1
+        return tier >= 0 and bool(self._tier_percents[tier])
+
+    def _evaluate(self, ticket, quantity, payment_method, code, window):
+        # Apply the compiled rules in order: quantity tier, early bird, promo code, payment surcharge
+        subtotal = ticket.get_price() * quantity
+        total = subtotal
+        adjustments = []  # (description, amount added to the total)
+
+        tier = bisect_right(self._tier_quantities, quantity) - 1
+        bulk_discount = self.is_bulk_discount(quantity)
+        if bulk_discount:
+            amount = -total * self._tier_percents[tier] / 100
+            adjustments.append((f"{self._tier_percents[tier]:g}% off {self._tier_quantities[tier]}+ tickets", amount))
+            total += amount
+        for until, percent, tickets in self._early_bird[window:]:
+            if not tickets or ticket.get_ticket_id() in tickets:
+                amount = -total * percent / 100
+                adjustments.append((f"{percent:g}% early bird (until {until:%Y-%m-%d})", amount))
+                total += amount
+                break  # Only the earliest open window applies
+        if code is not None:
+            percent, amount_off, tickets, _ = self._promos[code]
+            if not tickets or ticket.get_ticket_id() in tickets:
+                amount = -min(total * percent / 100 + amount_off, total)
+                adjustments.append((f"Promo code {code}", amount))
+                total += amount
+        surcharge = self._surcharges.get(payment_method, 0)
+        if surcharge:
+            amount = total * surcharge / 100
+            adjustments.append((f"{surcharge:g}% {payment_method} surcharge", amount))
+            total += amount
+        return Quote(subtotal, adjustments, round(total, 2), bulk_discount)
+
+    def _check_promo(self, code, when):
+        # Fail if a promo code does not exist or has expired
+        if code not in self._promos:
+            raise ValueError("Invalid promo code.")
+        if self._promo_expired(code, when):
+            raise ValueError("This promo code has expired.")
+
+    def _promo_expired(self, code, when):
+        # Return True if a promo code has an expiry date that has passed
+        expires = self._promos[code][3]
+        return expires is not None and when > expires
+
+
+class Quote:
+    """The price of a booking: the subtotal, each discount or surcharge applied, and the total."""
+
+    __slots__ = ('_subtotal', '_adjustments', '_total', '_bulk_discount')
+
+    def __init__(self, subtotal, adjustments, total, bulk_discount=False):
+        # Initialize the quote
+        self._subtotal = subtotal
+        self._adjustments = adjustments
+        self._total = total
+        self._bulk_discount = bulk_discount
+
+    def get_subtotal(self):
+        # Return the ticket price times the quantity
+        return self._subtotal
+
+    def get_adjustments(self):
+        # Return [(description, amount)] for each discount (negative) or surcharge (positive) applied
+        return list(self._adjustments)
+
+    def get_total(self):
+        # Return the amount to pay
+        return self._total
+
+    def is_bulk_discount(self):
+        # Return True if a quantity tier discount was applied
+        return self._bulk_discount
+
+    def __str__(self):
+        # Return the total with the adjustments that led to it
+        lines = [f"{description}: AED {amount:+.2f}" for description, amount in self._adjustments]
+        return "\n".join(lines + [f"Total: AED {self._total:.2f}"])
+
+
+DEFAULT_PRICING = PricingEngine()  # For bookings priced or saved without a pricing engine
@@ -0,0 +1,108 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from functools import wraps
+
+
+def _option(flag, variable, default=None):
+    # Return a --flag=value (or bare --flag) command-line option, else the environment variable
+    for arg in sys.argv[1:]:
+        if arg == flag:
+            return default
+        if arg.startswith(flag + "="):
+            return arg[len(flag) + 1:]
+    return os.environ.get(variable)
+
+
+# Profiling is switched on by starting a GUI with --profile[=directory] or by setting GRANDPRIX_PROFILE
+# to a directory. Every callback slower than the threshold (--profile-threshold=ms or
+# GRANDPRIX_PROFILE_THRESHOLD, 250 ms by default) is written there as a .prof file, which pstats,
+# snakeviz, gprof2dot and the like can open, along with a .txt summary of its slowest functions
+# and the memory it allocated. Tracing allocations slows allocation-heavy code several times over;
+# --profile-memory=0 (or GRANDPRIX_PROFILE_MEMORY=0) leaves it off for truer timings.
+DIRECTORY = _option("--profile", "GRANDPRIX_PROFILE", "profiles")
+ENABLED = bool(DIRECTORY)
+THRESHOLD = float(_option("--profile-threshold", "GRANDPRIX_PROFILE_THRESHOLD") or 250) / 1000
+TRACE_MEMORY = (_option("--profile-memory", "GRANDPRIX_PROFILE_MEMORY") or "1") != "0"
+
+_active = threading.local()  # Set while a callback on this thread is being profiled
+
+
+def install():
+    # Profile every Tk callback registered from now on (buttons, key bindings, after() calls and so
+    # on) if profiling is switched on. Call before the window is created.
+    if not ENABLED:
+        return
+    import tkinter
+    register = tkinter.Misc._register
+    if getattr(register, "profiled", False):
+        return
+
+    @wraps(register)
+    def profiled_register(self, func, subst=None, needcleanup=1):
+        return register(self, profiled(func), subst, needcleanup)
+    profiled_register.profiled = True
+    tkinter.Misc._register = profiled_register
+    os.makedirs(DIRECTORY, exist_ok=True)
+    if TRACE_MEMORY:
+        tracemalloc.start()  # One frame per allocation: enough to report it by line, and the cheapest to trace
+    print(f"Profiling callbacks slower than {THRESHOLD * 1000:.0f} ms into {os.path.abspath(DIRECTORY)}")
+
+
+def profiled(function, name=None):
+    # Return function wrapped so each call is profiled and written out if it is slow (or function
+    # itself when profiling is off)
+    if not ENABLED:
+        return function
+    name = name or getattr(function, "__qualname__", None) or repr(function)
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if getattr(_active, "profiling", False):
+            return function(*args, **kwargs)  # Called from a callback already being profiled
+        _active.profiling = True
+        profile = cProfile.Profile()
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.clear_traces()  # Afterwards only what this call allocated is left
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            return profile.runcall(function, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            _active.profiling = False
+            if elapsed >= THRESHOLD:
+                memory = tracemalloc.get_traced_memory() if tracing else None
+                snapshot = tracemalloc.take_snapshot() if tracing else None
+                try:
+                    _write_profile(name, elapsed, profile, snapshot, memory)
+                except OSError as e:
+                    print(f"Could not write the profile of {name}: {e}", file=sys.stderr)
+    return wrapper
+
+
+def _write_profile(name, elapsed, profile, snapshot, memory):
+    # Write a slow call's profile (.prof) and a readable summary with its allocations (.txt)
+    safe_name = re.sub(r"[^\w.-]", "_", name)
+    stem = os.path.join(DIRECTORY, f"{safe_name}-{datetime.now():%Y%m%d-%H%M%S-%f}-{elapsed * 1000:.0f}ms")
+    profile.dump_stats(stem + ".prof")
+    out = io.StringIO()
+    out.write(f"{name} took {elapsed * 1000:.1f} ms\n")
+    if memory is not None:
+        current, peak = memory
+        out.write(f"Memory: {current / 1024:.1f} KiB still allocated, peak {peak / 1024:.1f} KiB during the call\n")
+        out.write("\nLargest allocations still held, by line:\n")
+        for stat in snapshot.statistics("lineno")[:15]:
+            out.write(f"  {stat}\n")
+    out.write("\nSlowest functions, by cumulative time:\n")
+    pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(30)
+    with open(stem + ".txt", "w") as f:
+        f.write(out.getvalue())
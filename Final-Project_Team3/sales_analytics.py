@@ -0,0 +1,197 @@
+from array import array
+from datetime import datetime, timedelta
+
+from booking import EPOCH
+
+
+HOUR = 3600 * 1_000_000  # Booking timestamps are in microseconds
+HOURS_PER_DAY = 24
+
+
+class SalesAnalytics:
+    """Sales rolled up into hourly and daily buckets, updated as bookings are made or cancelled.
+
+    The buckets are kept as columns (per ticket type, an array each of bookings, tickets sold and
+    revenue indexed by hour or day), so a query slices and sums arrays rather than reading bookings.
+    A booking only ever touches its own buckets, so finished hours and days are never recomputed.
+    """
+
+    def __init__(self):
+        # Initialize the hourly and daily columns and the whole-season tables
+        self._hours = _Columns()
+        self._days = _Columns()
+        self._by_type_and_payment = {}  # (ticket type, payment method) -> [bookings, tickets sold, revenue]
+        self._bulk = {}  # ticket type -> [bookings with the bulk discount, all bookings]
+
+    @classmethod
+    def rebuild(cls, bookings):
+        # Build the rollups from scratch: group the bookings by hour, ticket type, payment method and
+        # discount in one pass, then add each group's totals once, oldest hour first
+        groups = {}
+        for booking in bookings:
+            key = (booking.get_timestamp() // HOUR, booking.get_ticket_type(), booking.get_payment_method(),
+                   booking.is_bulk_discount())
+            totals = groups.get(key)
+            if totals is None:
+                totals = groups[key] = [0, 0, 0.0]
+            totals[0] += 1
+            totals[1] += booking.get_quantity()
+            totals[2] += booking.get_total_price()
+        analytics = cls()
+        for key in sorted(groups, key=lambda key: key[0]):
+            analytics.add_totals(*key, *groups[key])
+        return analytics
+
+    @classmethod
+    def from_dict(cls, data):
+        # Rebuild the rollups from the tables returned by to_dict()
+        analytics = cls()
+        analytics._hours = _Columns.from_dict(data["hours"])
+        analytics._days = _Columns.from_dict(data["days"])
+        analytics._by_type_and_payment = {(ticket_type, method): totals
+                                          for ticket_type, method, *totals in data["by_type_and_payment"]}
+        analytics._bulk = {key: list(totals) for key, totals in data["bulk"].items()}
+        return analytics
+
+    def to_dict(self):
+        # Return a copy of the rollups as plain lists and dicts (e.g. to send them as JSON)
+        return {"hours": self._hours.to_dict(), "days": self._days.to_dict(),
+                "by_type_and_payment": [[*key, *totals] for key, totals in self._by_type_and_payment.items()],
+                "bulk": {key: list(totals) for key, totals in self._bulk.items()}}
+
+    def add(self, booking):
+        # Count a new booking in its buckets
+        self._update(booking, 1)
+
+    def remove(self, booking):
+        # Take a cancelled booking back out of its buckets
+        self._update(booking, -1)
+
+    def _update(self, booking, sign):
+        # Apply one booking to the rollups
+        self.add_totals(booking.get_timestamp() // HOUR, booking.get_ticket_type(), booking.get_payment_method(),
+                        booking.is_bulk_discount(), sign, booking.get_quantity() * sign,
+                        booking.get_total_price() * sign)
+
+    def add_totals(self, hour, ticket_type, payment_method, bulk_discount, bookings, quantity, revenue):
+        # Add pre-aggregated totals for one hour to the rollups
+        self._hours.add(hour, ticket_type, bookings, quantity, revenue)
+        self._days.add(hour // HOURS_PER_DAY, ticket_type, bookings, quantity, revenue)
+        totals = self._by_type_and_payment.setdefault((ticket_type, payment_method), [0, 0, 0.0])
+        totals[0] += bookings
+        totals[1] += quantity
+        totals[2] += revenue
+        if totals[0] == 0:
+            del self._by_type_and_payment[(ticket_type, payment_method)]
+        bulk = self._bulk.setdefault(ticket_type, [0, 0])
+        bulk[0] += bookings if bulk_discount else 0
+        bulk[1] += bookings
+        if bulk[1] == 0:
+            del self._bulk[ticket_type]
+
+    def get_sales_by_hour(self, ticket_type=None):
+        # Return [(start of hour, tickets sold, revenue)] for every hour from the first sale to the
+        # last, oldest first (for one ticket type only, if given)
+        tickets, revenue = self._hours.totals(ticket_type)
+        start = EPOCH + timedelta(hours=self._hours.start)
+        return [(start + timedelta(hours=i), tickets[i], revenue[i]) for i in range(len(tickets))]
+
+    def get_sales_by_day(self, ticket_type=None):
+        # Return [(date, tickets sold, revenue)] for every day from the first sale to the last, oldest first
+        tickets, revenue = self._days.totals(ticket_type)
+        start = (EPOCH + timedelta(days=self._days.start)).date()
+        return [(start + timedelta(days=i), tickets[i], revenue[i]) for i in range(len(tickets))]
+
+    def get_velocity(self, hours=24, now=None):
+        # Return the average tickets sold per hour over the given number of hours up to now
+        last = int(((now or datetime.now()) - EPOCH).total_seconds()) // 3600 - self._hours.start
+        tickets = self._hours.totals()[0]
+        return sum(tickets[max(last - hours + 1, 0):max(last + 1, 0)]) / hours
+
+    def get_peak_hour(self):
+        # Return (start of hour, tickets sold) for the hour that sold the most tickets, or None
+        tickets = self._hours.totals()[0]
+        peak = max(range(len(tickets)), key=tickets.__getitem__, default=None)
+        if peak is None or tickets[peak] <= 0:
+            return None
+        return EPOCH + timedelta(hours=self._hours.start + peak), tickets[peak]
+
+    def get_revenue_by_ticket_type_and_payment(self):
+        # Return {(ticket type, payment method): revenue}
+        return {key: totals[2] for key, totals in self._by_type_and_payment.items()}
+
+    def get_bulk_uptake(self):
+        # Return {ticket type: share of bookings (0 to 1) that got the bulk discount}
+        return {ticket_type: bulk / bookings for ticket_type, (bulk, bookings) in self._bulk.items()}
+
+
+class _Columns:
+    """Bookings, tickets sold and revenue per ticket type (and for all types together, under None), in
+    arrays covering a run of consecutive buckets."""
+
+    def __init__(self):
+        # Start with no buckets
+        self.start = 0  # Bucket number (hours or days since EPOCH) of index 0
+        self.size = 0
+        self._columns = {}  # ticket type or None -> (bookings, tickets sold, revenue) arrays
+
+    @classmethod
+    def from_dict(cls, data):
+        # Rebuild the columns from to_dict(), adding up the all-types columns again
+        columns = cls()
+        columns.start = data["start"]
+        columns.size = data["size"]
+        for ticket_type, (bookings, tickets, revenue) in data["columns"].items():
+            columns._columns[ticket_type] = (array('q', bookings), array('q', tickets), array('d', revenue))
+        per_type = list(columns._columns.values())
+        if per_type:
+            columns._columns[None] = tuple(array(typecode, map(sum, zip(*(c[i] for c in per_type))))
+                                           for i, typecode in enumerate('qqd'))
+        return columns
+
+    def to_dict(self):
+        # Return the per-ticket-type columns as lists
+        return {"start": self.start, "size": self.size,
+                "columns": {ticket_type: [list(column) for column in columns]
+                            for ticket_type, columns in self._columns.items() if ticket_type is not None}}
+
+    def add(self, bucket, ticket_type, bookings, quantity, revenue):
+        # Add totals to one bucket, widening the arrays to reach it if needed
+        if not self.size:
+            self.start = bucket
+        if bucket < self.start:
+            self._widen(self.start - bucket, front=True)
+            self.start = bucket
+        elif bucket >= self.start + self.size:
+            self._widen(bucket - self.start - self.size + 1)
+        i = bucket - self.start
+        for key in (ticket_type, None):
+            columns = self._columns.get(key)
+            if columns is None:
+                columns = self._columns[key] = (_zeros('q', self.size), _zeros('q', self.size),
+                                                _zeros('d', self.size))
+            columns[0][i] += bookings
+            columns[1][i] += quantity
+            columns[2][i] += revenue
+
+    def totals(self, ticket_type=None):
+        # Return (tickets sold, revenue) arrays for one ticket type, or for every type together
+        columns = self._columns.get(ticket_type)
+        if columns is None:
+            return _zeros('q', self.size), _zeros('d', self.size)
+        return columns[1], columns[2]
+
+    def _widen(self, count, front=False):
+        # Add empty buckets after the last one (or before the first)
+        for columns in self._columns.values():
+            for column in columns:
+                if front:
+                    column[0:0] = _zeros(column.typecode, count)
+                else:
+                    column.extend(_zeros(column.typecode, count))
+        self.size += count
+
+
+def _zeros(typecode, count):
+    # Return an array of count zeros
+    return array(typecode, [0]) * count
@@ -0,0 +1,182 @@
+import argparse
+import csv
+import json
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from itertools import islice
+
+from booking import EPOCH, to_timestamp
+from storage import open_store, open_pricing
+from ticket_system import TicketSystem
+
+
+# Columns of an export, in order
+COLUMNS = ("booking_id", "fan_id", "ticket_id", "ticket_type", "quantity", "payment_method", "date", "total_price",
+           "bulk_discount")
+
+# Columnar files: MAGIC, a length-prefixed JSON header, then row groups of ROW_GROUP_SIZE rows (the
+# last may be shorter), each a row count followed by one length-prefixed, zlib-compressed block per
+# column, and finally a row count of 0
+MAGIC = b"GPXCOL\x00\x01"
+ROW_GROUP_SIZE = 65536
+LENGTH = struct.Struct('<I')
+ENCODINGS = {  # Column -> how its values are stored
+    "booking_id": "text", "fan_id": "text", "ticket_id": "dictionary", "ticket_type": "dictionary",
+    "quantity": "int32", "payment_method": "dictionary", "date": "timestamp", "total_price": "float64",
+    "bulk_discount": "bool",
+}
+
+
+def export_rows(system, ticket_type=None, since=None, until=None):
+    # Yield a row (in COLUMNS order) for every booking of a ticket type and/or dates (since <= date < until),
+    # streamed from the system's store one booking at a time
+    ticket_types = {ticket.get_ticket_id(): ticket.get_ticket_type() for ticket in system.get_tickets()}
+    for booking_id, fan_id, ticket_id, quantity, payment_method, date, total, bulk_discount in system.iter_bookings(
+            ticket_type, since, until):
+        yield (booking_id, fan_id, ticket_id, ticket_types.get(ticket_id, ""), quantity, payment_method, date, total,
+               bulk_discount)
+
+
+def export_csv(rows, path):
+    # Write rows to a CSV file with a header line and return the number of rows written
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow(row[:6] + (row[6].isoformat(sep=" "), f"{row[7]:.2f}", int(row[8])))
+            count += 1
+    return count
+
+
+def export_columnar(rows, path, row_group_size=ROW_GROUP_SIZE):
+    # Write rows to a columnar file (see MAGIC) and return the number of rows written. Only one row
+    # group is held in memory at a time.
+    if not 0 < row_group_size <= ROW_GROUP_SIZE:
+        raise ValueError(f"A row group holds 1 to {ROW_GROUP_SIZE} rows")
+    count = 0
+    header = json.dumps({"columns": [[name, ENCODINGS[name]] for name in COLUMNS]}).encode()
+    rows = iter(rows)
+    with open(path, "wb") as f:
+        f.write(MAGIC + LENGTH.pack(len(header)) + header)
+        while True:
+            group = list(islice(rows, row_group_size))
+            if not group:
+                break
+            blocks = [zlib.compress(_encode(ENCODINGS[name], values)) for name, values in zip(COLUMNS, zip(*group))]
+            f.write(LENGTH.pack(len(group)) + b"".join(LENGTH.pack(len(block)) + block for block in blocks))
+            count += len(group)
+        f.write(LENGTH.pack(0))
+    return count
+
+
+def read_columnar(path, columns=None):
+    # Yield each row group of a columnar file as a dict of column name -> list of values, decoding only
+    # the given columns (every column by default); the others are skipped without being read
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a columnar export")
+        header = json.loads(f.read(LENGTH.unpack(f.read(LENGTH.size))[0]))
+        while True:
+            rows = LENGTH.unpack(f.read(LENGTH.size))[0]
+            if rows == 0:
+                return
+            group = {}
+            for name, encoding in header["columns"]:
+                length = LENGTH.unpack(f.read(LENGTH.size))[0]
+                if columns is None or name in columns:
+                    group[name] = _decode(encoding, zlib.decompress(f.read(length)))
+                else:
+                    f.seek(length, 1)
+            yield group
+
+
+def read_columnar_rows(path):
+    # Yield every row of a columnar file as a tuple in COLUMNS order
+    for group in read_columnar(path):
+        yield from zip(*(group[name] for name in COLUMNS))
+
+
+def _encode(encoding, values):
+    # Return the bytes a column's values are stored as
+    if encoding == "text":
+        return "\x00".join(values).encode()
+    if encoding == "dictionary":
+        # The distinct values once, then a 16-bit code per row (a row group has at most 65536 rows)
+        codes = {}
+        numbers = array('H', (codes.setdefault(value, len(codes)) for value in values))
+        names = "\x00".join(codes).encode()
+        return LENGTH.pack(len(names)) + names + _little_endian(numbers)
+    if encoding == "int32":
+        return _little_endian(array('i', values))
+    if encoding == "bool":
+        return bytes(values)
+    if encoding == "timestamp":
+        # Microseconds since EPOCH, each stored as the difference from the one before: bookings are
+        # mostly in date order, so the differences are small and compress well
+        timestamps = array('q', (to_timestamp(date) for date in values))
+        for i in range(len(timestamps) - 1, 0, -1):
+            timestamps[i] -= timestamps[i - 1]
+        return _little_endian(timestamps)
+    if encoding == "float64":
+        return _little_endian(array('d', values))
+    raise ValueError(f"Unknown column encoding: {encoding}")
+
+
+def _decode(encoding, data):
+    # Return the list of values a column's bytes hold
+    if encoding == "text":
+        return data.decode().split("\x00")
+    if encoding == "dictionary":
+        length = LENGTH.unpack_from(data)[0]
+        names = data[LENGTH.size:LENGTH.size + length].decode().split("\x00")
+        return [names[code] for code in _from_little_endian('H', data[LENGTH.size + length:])]
+    if encoding == "int32":
+        return _from_little_endian('i', data).tolist()
+    if encoding == "bool":
+        return [bool(value) for value in data]
+    if encoding == "timestamp":
+        dates, timestamp = [], 0
+        for delta in _from_little_endian('q', data):
+            timestamp += delta
+            dates.append(EPOCH + timedelta(microseconds=timestamp))
+        return dates
+    if encoding == "float64":
+        return _from_little_endian('d', data).tolist()
+    raise ValueError(f"Unknown column encoding: {encoding}")
+
+
+def _little_endian(values):
+    # Return an array's bytes in little-endian order, whatever this machine uses
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode, data):
+    # Return an array read from little-endian bytes
+    values = array(typecode, data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+# --- Sales export ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export bookings as CSV or as a compact columnar file")
+    parser.add_argument("format", choices=("csv", "columnar"))
+    parser.add_argument("output", help="file to write")
+    parser.add_argument("--from", dest="since", type=datetime.fromisoformat, help="first date, e.g. 2025-03-01")
+    parser.add_argument("--to", dest="to", type=datetime.fromisoformat, help="last date (inclusive)")
+    parser.add_argument("--ticket-type", help='only this ticket type, e.g. "Weekend Package"')
+    args = parser.parse_args()
+
+    system = TicketSystem(open_store(), open_pricing())
+    system.load_saved_data(lazy=True)
+    until = args.to + timedelta(days=1) if args.to else None  # Every booking on the last day counts
+    rows = export_rows(system, args.ticket_type, args.since, until)
+    count = export_csv(rows, args.output) if args.format == "csv" else export_columnar(rows, args.output)
+    print(f"Exported {count:,} bookings to {args.output}")
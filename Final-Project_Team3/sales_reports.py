@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import chain
+
+from sales_summary import SalesSummary
+from sales_export import export_rows, export_columnar, read_columnar
+from storage import open_store, open_pricing
+from pricing import DEFAULT_PRICING
+from ticket_system import TicketSystem
+
+
+MANIFEST = "manifest.json"  # Lists a partitioned directory's files with their row counts and date ranges
+
+
+def partition_bookings(system, directory, rows_per_partition=1_000_000):
+    # Stream every booking into columnar files of rows_per_partition bookings each, in the order they
+    # were made (so each partition covers a stretch of dates), and write the manifest listing them.
+    # Returns the manifest's list of partitions.
+    os.makedirs(directory, exist_ok=True)
+    rows = iter(export_rows(system))
+    partitions = []
+    while True:
+        first = next(rows, None)
+        if first is None:
+            break
+        name = f"bookings-{len(partitions):05d}.col"
+        dates = [first[6], first[6]]  # Earliest and latest date in the partition
+        count = export_columnar(_tracking_dates(chain([first], rows), rows_per_partition, dates),
+                                os.path.join(directory, name))
+        partitions.append({"file": name, "rows": count,
+                           "first": dates[0].isoformat(), "last": dates[1].isoformat()})
+    _save_manifest(directory, partitions)
+    return partitions
+
+
+def run_report(directory, workers=None, ticket_type=None, since=None, until=None):
+    # Total the bookings of a partitioned directory (optionally only a ticket type and/or dates, with
+    # since <= date < until) across a pool of worker processes, each reading whole partitions, and
+    # return (SalesSummary, number of bookings). Partitions entirely outside the dates are skipped.
+    with open(os.path.join(directory, MANIFEST)) as f:
+        partitions = json.load(f)["partitions"]
+    paths = [os.path.join(directory, partition["file"]) for partition in partitions
+             if (since is None or datetime.fromisoformat(partition["last"]) >= since)
+             and (until is None or datetime.fromisoformat(partition["first"]) < until)]
+    totals = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        aggregate = partial(aggregate_partition, ticket_type=ticket_type, since=since, until=until)
+        for totals_part in pool.map(aggregate, paths):
+            for key, (bookings, quantity, revenue) in totals_part.items():
+                merged = totals.setdefault(key, [0, 0, 0.0])
+                merged[0] += bookings
+                merged[1] += quantity
+                merged[2] += revenue
+    summary = SalesSummary()
+    for (ticket, method, bulk), (bookings, quantity, revenue) in totals.items():
+        summary.add_totals(ticket, method, bulk, quantity, revenue)
+    return summary, sum(bookings for bookings, _, _ in totals.values())
+
+
+def aggregate_partition(path, ticket_type=None, since=None, until=None):
+    # Total one partition file's bookings (run in a worker process): returns
+    # {(ticket type, payment method, bulk discount): [bookings, tickets, revenue]}
+    columns = {"ticket_type", "payment_method", "quantity", "total_price", "bulk_discount"}
+    if since is not None or until is not None:
+        columns.add("date")  # Dates are only decoded when they are needed
+    totals = {}
+    for group in read_columnar(path, columns):
+        dates = group.get("date") or [None] * len(group["quantity"])
+        bulk_discounts = group.get("bulk_discount")
+        if bulk_discounts is None:
+            # Partitioned before bookings kept their bulk discount flag
+            bulk_discounts = [DEFAULT_PRICING.is_bulk_discount(quantity) for quantity in group["quantity"]]
+        for ticket, method, quantity, total, date, bulk_discount in zip(
+                group["ticket_type"], group["payment_method"], group["quantity"], group["total_price"], dates,
+                bulk_discounts):
+            if ticket_type is not None and ticket != ticket_type:
+                continue
+            if date is not None and ((since is not None and date < since) or (until is not None and date >= until)):
+                continue
+            key = (ticket, method, bulk_discount)
+            entry = totals.get(key)
+            if entry is None:
+                entry = totals[key] = [0, 0, 0.0]
+            entry[0] += 1
+            entry[1] += quantity
+            entry[2] += total
+    return totals
+
+
+def _tracking_dates(rows, limit, dates):
+    # Yield up to limit rows, widening dates ([earliest, latest]) to cover each one's date
+    for count, row in enumerate(rows, 1):
+        date = row[6]
+        if date < dates[0]:
+            dates[0] = date
+        elif date > dates[1]:
+            dates[1] = date
+        yield row
+        if count == limit:
+            return
+
+
+def _save_manifest(directory, partitions):
+    # Write the manifest atomically, then delete partition files left over from an earlier, larger run
+    tmp = os.path.join(directory, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"partitions": partitions}, f, indent=1)
+    os.replace(tmp, os.path.join(directory, MANIFEST))
+    names = {partition["file"] for partition in partitions}
+    for name in os.listdir(directory):
+        if name.startswith("bookings-") and name.endswith(".col") and name not in names:
+            os.remove(os.path.join(directory, name))
+
+
+# --- Sales reports ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partition the bookings and run sales reports over the partitions")
+    parser.add_argument("command", choices=("partition", "report"))
+    parser.add_argument("directory", help="directory holding the partition files")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="bookings per partition (partition)")
+    parser.add_argument("--workers", type=int, help="worker processes (report; default: one per core)")
+    parser.add_argument("--from", dest="since", type=datetime.fromisoformat, help="first date (report)")
+    parser.add_argument("--to", dest="to", type=datetime.fromisoformat, help="last date, inclusive (report)")
+    parser.add_argument("--ticket-type", help="only this ticket type (report)")
+    parser.add_argument("--check", action="store_true", help="compare the report with the store's running totals")
+    args = parser.parse_args()
+
+    if args.command == "partition":
+        system = TicketSystem(open_store(), open_pricing())
+        system.load_saved_data(lazy=True)
+        partitions = partition_bookings(system, args.directory, args.rows)
+        print(f"Wrote {sum(p['rows'] for p in partitions):,} bookings in {len(partitions)} partitions "
+              f"to {args.directory}")
+    else:
+        until = args.to + timedelta(days=1) if args.to else None  # Every booking on the last day counts
+        summary, count = run_report(args.directory, args.workers, args.ticket_type, args.since, until)
+        print(f"{count:,} bookings, revenue {summary.get_total_revenue():,.2f}")
+        for ticket, sold in sorted(summary.get_quantity_by_ticket_type().items()):
+            print(f"  {ticket}: {sold:,} tickets sold")
+        if args.check:
+            system = TicketSystem(open_store(), open_pricing())
+            system.load_saved_data(lazy=True)
+            matches = summary.matches(system.view_sales_summary())
+            print("Matches the running totals" if matches else "Does NOT match the running totals "
+                  "(partition again if bookings were made since)")
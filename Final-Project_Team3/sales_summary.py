@@ -0,0 +1,89 @@
+BULK_DISCOUNT = "Bulk discount"
+FULL_PRICE = "Full price"
+
+
+class SalesSummary:
+    """Running ticket sales and revenue totals, updated as bookings are made or cancelled."""
+
+    def __init__(self):
+        # Each table maps a key to [tickets sold, revenue]
+        self._by_ticket_type = {}
+        self._by_payment_method = {}
+        self._by_pricing = {}  # BULK_DISCOUNT or FULL_PRICE
+
+    @classmethod
+    def rebuild(cls, bookings):
+        # Build a summary from scratch by walking every booking
+        summary = cls()
+        for booking in bookings:
+            summary.add(booking)
+        return summary
+
+    @classmethod
+    def from_dict(cls, data):
+        # Rebuild a summary from the tables returned by to_dict()
+        summary = cls()
+        summary._by_ticket_type = {key: list(totals) for key, totals in data["by_ticket_type"].items()}
+        summary._by_payment_method = {key: list(totals) for key, totals in data["by_payment_method"].items()}
+        summary._by_pricing = {key: list(totals) for key, totals in data["by_pricing"].items()}
+        return summary
+
+    def to_dict(self):
+        # Return a copy of every table as {key: [tickets sold, revenue]} (e.g. to send the summary as JSON)
+        return {name: {key: list(totals) for key, totals in table.items()}
+                for name, table in (("by_ticket_type", self._by_ticket_type),
+                                    ("by_payment_method", self._by_payment_method),
+                                    ("by_pricing", self._by_pricing))}
+
+    def add(self, booking):
+        # Count a new booking in every table
+        self._update(booking, 1)
+
+    def remove(self, booking):
+        # Take a cancelled booking back out of every table
+        self._update(booking, -1)
+
+    def _update(self, booking, sign):
+        # Apply a booking's quantity and total to each table
+        self.add_totals(booking.get_ticket_type(), booking.get_payment_method(), booking.is_bulk_discount(),
+                        booking.get_quantity() * sign, booking.get_total_price() * sign)
+
+    def add_totals(self, ticket_type, payment_method, bulk_discount, quantity, revenue):
+        # Add pre-aggregated totals to each table, dropping keys that fall back to zero
+        pricing = BULK_DISCOUNT if bulk_discount else FULL_PRICE
+        for table, key in ((self._by_ticket_type, ticket_type),
+                           (self._by_payment_method, payment_method),
+                           (self._by_pricing, pricing)):
+            totals = table.setdefault(key, [0, 0.0])
+            totals[0] += quantity
+            totals[1] += revenue
+            if totals[0] == 0:
+                del table[key]
+
+    def get_quantity_by_ticket_type(self):
+        # Return {ticket type: tickets sold}
+        return {key: totals[0] for key, totals in self._by_ticket_type.items()}
+
+    def get_revenue_by_ticket_type(self):
+        # Return {ticket type: revenue}
+        return {key: totals[1] for key, totals in self._by_ticket_type.items()}
+
+    def get_by_payment_method(self):
+        # Return {payment method: (tickets sold, revenue)}
+        return {key: tuple(totals) for key, totals in self._by_payment_method.items()}
+
+    def get_by_pricing(self):
+        # Return {BULK_DISCOUNT/FULL_PRICE: (tickets sold, revenue)}
+        return {key: tuple(totals) for key, totals in self._by_pricing.items()}
+
+    def get_total_revenue(self):
+        # Return the revenue across all ticket types
+        return sum(totals[1] for totals in self._by_ticket_type.values())
+
+    def matches(self, other):
+        # Return True if both summaries agree (revenue compared to two decimal places)
+        def rounded(table):
+            return {key: (totals[0], round(totals[1], 2)) for key, totals in table.items()}
+        return (rounded(self._by_ticket_type) == rounded(other._by_ticket_type)
+                and rounded(self._by_payment_method) == rounded(other._by_payment_method)
+                and rounded(self._by_pricing) == rounded(other._by_pricing))
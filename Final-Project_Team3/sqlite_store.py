@@ -0,0 +1,444 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from urllib.request import pathname2url
+
+from user import ROLES, CLASSES
+from ticket import Ticket
+from sales_summary import SalesSummary
+from sales_analytics import SalesAnalytics
+from pricing import DEFAULT_PRICING
+import metrics
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    role TEXT NOT NULL,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket_id TEXT PRIMARY KEY,
+    ticket_type TEXT NOT NULL,
+    price REAL NOT NULL,
+    capacity INTEGER  -- NULL for no limit
+);
+CREATE TABLE IF NOT EXISTS bookings (
+    booking_id TEXT PRIMARY KEY,
+    fan_id TEXT NOT NULL,
+    ticket_id TEXT NOT NULL REFERENCES tickets (ticket_id),
+    quantity INTEGER NOT NULL,
+    payment_method TEXT NOT NULL,
+    date TEXT NOT NULL,
+    total_price REAL NOT NULL,
+    bulk_discount INTEGER NOT NULL DEFAULT 0  -- Priced with a quantity tier discount
+);
+CREATE INDEX IF NOT EXISTS bookings_by_fan ON bookings (fan_id);
+CREATE INDEX IF NOT EXISTS bookings_by_ticket ON bookings (ticket_id);
+CREATE INDEX IF NOT EXISTS bookings_by_payment_method ON bookings (payment_method, date);
+CREATE INDEX IF NOT EXISTS bookings_by_date ON bookings (date);
+
+-- The next booking number no process has reserved yet (a single row)
+CREATE TABLE IF NOT EXISTS booking_ids (
+    next_number INTEGER NOT NULL
+);
+
+-- Running sales totals kept by triggers, so opening the database never scans the bookings
+CREATE TABLE IF NOT EXISTS sales_totals (
+    ticket_id TEXT NOT NULL,
+    payment_method TEXT NOT NULL,
+    bulk_discount INTEGER NOT NULL,
+    bookings INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    revenue REAL NOT NULL,
+    PRIMARY KEY (ticket_id, payment_method, bulk_discount)
+);
+CREATE TRIGGER IF NOT EXISTS sales_totals_insert AFTER INSERT ON bookings BEGIN
+    INSERT INTO sales_totals VALUES (NEW.ticket_id, NEW.payment_method, NEW.bulk_discount, 1,
+                                     NEW.quantity, NEW.total_price)
+    ON CONFLICT (ticket_id, payment_method, bulk_discount) DO UPDATE SET
+        bookings = bookings + 1, quantity = quantity + excluded.quantity, revenue = revenue + excluded.revenue;
+END;
+CREATE TRIGGER IF NOT EXISTS sales_totals_delete AFTER DELETE ON bookings BEGIN
+    UPDATE sales_totals SET bookings = bookings - 1, quantity = quantity - OLD.quantity,
+                            revenue = revenue - OLD.total_price
+    WHERE ticket_id = OLD.ticket_id AND payment_method = OLD.payment_method
+      AND bulk_discount = OLD.bulk_discount;
+END;
+
+-- The same totals per hour (since 1970-01-01), for the sales analytics
+CREATE TABLE IF NOT EXISTS sales_by_hour (
+    hour INTEGER NOT NULL,
+    ticket_id TEXT NOT NULL,
+    payment_method TEXT NOT NULL,
+    bulk_discount INTEGER NOT NULL,
+    bookings INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    revenue REAL NOT NULL,
+    PRIMARY KEY (hour, ticket_id, payment_method, bulk_discount)
+);
+CREATE TRIGGER IF NOT EXISTS sales_by_hour_insert AFTER INSERT ON bookings BEGIN
+    INSERT INTO sales_by_hour VALUES (CAST(strftime('%s', NEW.date) AS INTEGER) / 3600, NEW.ticket_id,
+                                      NEW.payment_method, NEW.bulk_discount, 1, NEW.quantity, NEW.total_price)
+    ON CONFLICT (hour, ticket_id, payment_method, bulk_discount) DO UPDATE SET
+        bookings = bookings + 1, quantity = quantity + excluded.quantity, revenue = revenue + excluded.revenue;
+END;
+CREATE TRIGGER IF NOT EXISTS sales_by_hour_delete AFTER DELETE ON bookings BEGIN
+    UPDATE sales_by_hour SET bookings = bookings - 1, quantity = quantity - OLD.quantity,
+                             revenue = revenue - OLD.total_price
+    WHERE hour = CAST(strftime('%s', OLD.date) AS INTEGER) / 3600 AND ticket_id = OLD.ticket_id
+      AND payment_method = OLD.payment_method AND bulk_discount = OLD.bulk_discount;
+END;
+"""
+
+# Substring search over users' names and emails: an FTS5 trigram index kept in step with the users
+# table by triggers (REPLACE fires the delete trigger because recursive_triggers is on)
+USER_SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS users_search USING fts5(name, email, content='users', tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS users_search_insert AFTER INSERT ON users BEGIN
+    INSERT INTO users_search (rowid, name, email) VALUES (NEW.rowid, NEW.name, NEW.email);
+END;
+CREATE TRIGGER IF NOT EXISTS users_search_delete AFTER DELETE ON users BEGIN
+    INSERT INTO users_search (users_search, rowid, name, email) VALUES ('delete', OLD.rowid, OLD.name, OLD.email);
+END;
+CREATE TRIGGER IF NOT EXISTS users_search_update AFTER UPDATE ON users BEGIN
+    INSERT INTO users_search (users_search, rowid, name, email) VALUES ('delete', OLD.rowid, OLD.name, OLD.email);
+    INSERT INTO users_search (rowid, name, email) VALUES (NEW.rowid, NEW.name, NEW.email);
+END;
+"""
+
+BOOKING_COLUMNS = "booking_id, fan_id, ticket_id, quantity, payment_method, date, total_price, bulk_discount"
+BOOKING_TRIGGERS = ("sales_totals_insert", "sales_totals_delete", "sales_by_hour_insert", "sales_by_hour_delete")
+
+
+def _serialized(method):
+    # Decorator: run a store method holding its thread lock, so its statements never run inside
+    # another thread's transaction on the shared connection
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._thread_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class SQLiteStore:
+    """Store for TicketSystem backed by a SQLite database in WAL mode; records are read on demand.
+
+    Several processes can share the database: each change is made in its own transaction, and
+    TicketSystem holds a write transaction (lock()) while it checks and saves a booking.
+    """
+
+    def __init__(self, path='grandprix.db'):
+        # Open (or create) the database and make sure the tables and indexes exist
+        # (autocommit mode: every statement outside lock() commits on its own)
+        self._path = path
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._thread_lock = threading.RLock()  # One thread at a time on this connection, held through a transaction
+        self._conn.execute("PRAGMA journal_mode=WAL")  # Readers never block the writer
+        self._conn.execute("PRAGMA recursive_triggers=ON")
+        tables = {row[0] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "bookings" in tables and "bulk_discount" not in self._columns("bookings"):
+            # Databases created before bookings kept their bulk discount flag: the bookings get the one
+            # the default pricing rules give, and the totals' triggers are made again to use the column
+            self._conn.create_function("is_bulk_discount", 1, DEFAULT_PRICING.is_bulk_discount, deterministic=True)
+            with self._transaction():
+                if "bulk_discount" not in self._columns("bookings"):  # Unless another process just did it
+                    self._conn.execute("ALTER TABLE bookings ADD COLUMN bulk_discount INTEGER NOT NULL DEFAULT 0")
+                    self._conn.execute("UPDATE bookings SET bulk_discount = is_bulk_discount(quantity)")
+                    for trigger in BOOKING_TRIGGERS:
+                        self._conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        self._conn.executescript(SCHEMA)
+        if "bookings" in tables and "sales_by_hour" not in tables:
+            # Databases created before the hourly totals existed
+            self._conn.execute("""INSERT INTO sales_by_hour
+                SELECT CAST(strftime('%s', date) AS INTEGER) / 3600, ticket_id, payment_method, bulk_discount,
+                       COUNT(*), SUM(quantity), SUM(total_price)
+                FROM bookings GROUP BY 1, 2, 3, 4""")
+        if "capacity" not in self._columns("tickets"):
+            # Databases created before ticket capacities existed
+            self._conn.execute("ALTER TABLE tickets ADD COLUMN capacity INTEGER")
+        try:
+            self._conn.executescript(USER_SEARCH_SCHEMA)
+            self._user_search = True
+            if "users_search" not in tables:
+                # Databases created before the search index existed
+                self._conn.execute("INSERT INTO users_search (users_search) VALUES ('rebuild')")
+        except sqlite3.OperationalError:
+            self._user_search = False  # SQLite built without FTS5: searches scan the users table
+        self._data_version = None  # Changes whenever another connection commits
+        self._system = None  # The TicketSystem this store was loaded into
+
+    def _columns(self, table):
+        # Return the names of a table's columns
+        return [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+
+    def load(self, system, lazy=False):
+        # Load the tickets and sales totals; users and bookings are fetched when first needed
+        # (so a lazy load is no different)
+        self._system = system
+        self._data_version = None
+        self.sync()
+
+    def load_bookings(self, system):
+        # Bookings are fetched when first needed, so there is nothing more to load
+        pass
+
+    @contextmanager
+    def lock(self):
+        # Hold a write transaction with the sales totals brought up to date; other processes
+        # wait (up to the 30 second timeout) until it commits
+        with self._thread_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.sync()
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    @metrics.timed("sqlite_sync")
+    @_serialized
+    def sync(self):
+        # Reload the sales totals, tickets sold and any new tickets if another process has committed
+        # since the last sync
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version or self._system is None:
+            return
+        self._data_version = data_version
+        tickets = [Ticket(*row) for row in
+                   self._conn.execute("SELECT ticket_id, ticket_type, price, capacity FROM tickets")]
+        ticket_types = {t.get_ticket_id(): t.get_ticket_type() for t in tickets}
+        summary = SalesSummary()
+        count = 0
+        sold = {}  # ticket_id -> tickets sold
+        for ticket_id, payment_method, bulk_discount, bookings, quantity, revenue in self._conn.execute(
+                "SELECT * FROM sales_totals WHERE bookings > 0"):
+            summary.add_totals(ticket_types[ticket_id], payment_method, bulk_discount, quantity, revenue)
+            count += bookings
+            sold[ticket_id] = sold.get(ticket_id, 0) + quantity
+        new_tickets = [t for t in tickets if self._system.get_ticket(t.get_ticket_id()) is None]
+        self._system.load([], new_tickets, [], summary=summary, booking_count=count)
+        for ticket in tickets:
+            current = self._system.get_ticket(ticket.get_ticket_id())
+            current.set_capacity(ticket.get_capacity())
+            current.set_sold(sold.get(ticket.get_ticket_id(), 0))
+
+    @_serialized
+    def load_sales_analytics(self):
+        # Return the sales analytics built from the hourly totals the triggers keep
+        ticket_types = dict(self._conn.execute("SELECT ticket_id, ticket_type FROM tickets"))
+        analytics = SalesAnalytics()
+        for hour, ticket_id, payment_method, bulk_discount, bookings, quantity, revenue in self._conn.execute(
+                "SELECT * FROM sales_by_hour WHERE bookings > 0"):
+            analytics.add_totals(hour, ticket_types[ticket_id], payment_method, bulk_discount, bookings, quantity,
+                                 revenue)
+        return analytics
+
+    @metrics.timed("sqlite_find_user")
+    @_serialized
+    def find_user(self, user_id):
+        # Return the user with the given ID, or None if not found
+        row = self._conn.execute("SELECT role, user_id, name, email FROM users WHERE user_id = ?",
+                                 (user_id,)).fetchone()
+        return CLASSES[row[0]].from_record(row[1:]) if row else None
+
+    @metrics.timed("sqlite_find_users")
+    @_serialized
+    def find_users(self, query, limit=50):
+        # Return up to limit users whose name or email contains the query (for 1 or 2 characters:
+        # has a word starting with it), matching the in-memory UserSearchIndex
+        query = query.strip()
+        if not query:
+            return []
+        if len(query) < 3:
+            words = "' ' || name || ' ' || replace(replace(email, '.', ' '), '@', ' ')"
+            rows = self._conn.execute(f"SELECT role, user_id, name, email FROM users WHERE {words} LIKE ? "
+                                      "ESCAPE '\\' LIMIT ?", ("% " + _like_escape(query) + "%", limit))
+        elif self._user_search:
+            rows = self._conn.execute("SELECT role, user_id, name, email FROM users WHERE rowid IN "
+                                      "(SELECT rowid FROM users_search WHERE users_search MATCH ?) LIMIT ?",
+                                      ('"' + query.replace('"', '""') + '"', limit))
+        else:
+            pattern = "%" + _like_escape(query) + "%"
+            rows = self._conn.execute("SELECT role, user_id, name, email FROM users WHERE name LIKE ? ESCAPE '\\' "
+                                      "OR email LIKE ? ESCAPE '\\' LIMIT ?", (pattern, pattern, limit))
+        return [CLASSES[row[0]].from_record(row[1:]) for row in rows]
+
+    @_serialized
+    def find_booking(self, booking_id):
+        # Return the record of the booking with the given ID, or None if not found
+        row = self._conn.execute(f"SELECT {BOOKING_COLUMNS} FROM bookings WHERE booking_id = ?",
+                                 (booking_id,)).fetchone()
+        return _booking_record(row) if row else None
+
+    @_serialized
+    def find_bookings_for_fan(self, user_id):
+        # Return the records of a fan's bookings in the order they were made
+        rows = self._conn.execute(f"SELECT {BOOKING_COLUMNS} FROM bookings WHERE fan_id = ? ORDER BY rowid",
+                                  (user_id,))
+        return [_booking_record(row) for row in rows]
+
+    @_serialized
+    def find_bookings_for_fan_page(self, user_id, offset, limit):
+        # Return the records of one page of a fan's bookings, newest first, and the fan's total bookings
+        rows = self._conn.execute(f"SELECT {BOOKING_COLUMNS} FROM bookings WHERE fan_id = ? "
+                                  "ORDER BY rowid DESC LIMIT ? OFFSET ?", (user_id, limit, offset))
+        records = [_booking_record(row) for row in rows]
+        total = self._conn.execute("SELECT COUNT(*) FROM bookings WHERE fan_id = ?", (user_id,)).fetchone()[0]
+        return records, total
+
+    @_serialized
+    def find_bookings(self, ticket_type=None, payment_method=None, fan_id=None, since=None, until=None):
+        # Return the records of the bookings matching every criterion given (since <= date < until),
+        # in the order they were made; SQLite picks the index to use
+        conditions, params = [], []
+        if ticket_type is not None:
+            conditions.append("ticket_id IN (SELECT ticket_id FROM tickets WHERE ticket_type = ?)")
+            params.append(ticket_type)
+        if payment_method is not None:
+            conditions.append("payment_method = ?")
+            params.append(payment_method)
+        if fan_id is not None:
+            conditions.append("fan_id = ?")
+            params.append(fan_id)
+        if since is not None:
+            conditions.append("date >= ?")
+            params.append(since.isoformat())
+        if until is not None:
+            conditions.append("date < ?")
+            params.append(until.isoformat())
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        rows = self._conn.execute(f"SELECT {BOOKING_COLUMNS} FROM bookings {where}ORDER BY date, rowid", params)
+        return [_booking_record(row) for row in rows]
+
+    def find_all_bookings(self):
+        # Yield the record of every booking in the order they were made
+        return self.iter_bookings()
+
+    def iter_bookings(self, ticket_type=None, since=None, until=None):
+        # Yield the records of the bookings of a ticket type and/or dates (since <= date < until) in the
+        # order they were made, straight from the cursor rather than as one list (e.g. for an export).
+        # The rows are read on a connection of their own, so a long read neither holds up the other
+        # threads using this store nor sees a booking another thread has not committed yet.
+        conditions, params = [], []
+        if ticket_type is not None:
+            conditions.append("ticket_id IN (SELECT ticket_id FROM tickets WHERE ticket_type = ?)")
+            params.append(ticket_type)
+        if since is not None:
+            conditions.append("date >= ?")
+            params.append(since.isoformat())
+        if until is not None:
+            conditions.append("date < ?")
+            params.append(until.isoformat())
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        reader = sqlite3.connect(f"file:{pathname2url(os.path.abspath(self._path))}?mode=ro", uri=True,
+                                 timeout=30, check_same_thread=False)
+        try:
+            for row in reader.execute(f"SELECT {BOOKING_COLUMNS} FROM bookings {where}ORDER BY rowid", params):
+                yield _booking_record(row)
+        finally:
+            reader.close()
+
+    def save_user(self, user):
+        # Insert or update one user
+        self._conn.execute("INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?)", _user_row(user))
+
+    def save_users(self, users):
+        # Insert or update a batch of users (committed together by the transaction TicketSystem holds)
+        self._conn.executemany("INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?)", map(_user_row, users))
+
+    def delete_user(self, user_id):
+        # Delete one user (their bookings are kept)
+        self._conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+
+    def save_ticket(self, ticket):
+        # Insert or update one ticket
+        self._conn.execute("INSERT OR REPLACE INTO tickets VALUES (?, ?, ?, ?)", ticket.to_record())
+
+    def append(self, booking):
+        # Insert one new booking
+        self._conn.execute(f"INSERT INTO bookings ({BOOKING_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           _booking_row(booking.to_record()))
+
+    def append_many(self, bookings):
+        # Insert a batch of new bookings (committed together by the transaction TicketSystem holds)
+        self._conn.executemany(f"INSERT INTO bookings ({BOOKING_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               [_booking_row(booking.to_record()) for booking in bookings])
+
+    def append_cancel(self, booking):
+        # Delete a cancelled booking, failing if another process has already cancelled it
+        cursor = self._conn.execute("DELETE FROM bookings WHERE booking_id = ?", (booking.get_booking_id(),))
+        if cursor.rowcount == 0:
+            raise ValueError("Invalid Booking ID")
+
+    @metrics.timed("sqlite_reserve_booking_ids")
+    def reserve_booking_ids(self, count):
+        # Reserve count booking numbers and return the first. This commits on its own, so the
+        # numbers stay reserved even if the booking they were reserved for is not made.
+        with self._transaction():
+            row = self._conn.execute("SELECT next_number FROM booking_ids").fetchone()
+            if row is None:
+                # Data saved before the counter existed: start after the highest booking ID in use
+                first = self._conn.execute("SELECT COALESCE(MAX(CAST(SUBSTR(booking_id, 2) AS INTEGER)), 0) + 1 "
+                                           "FROM bookings WHERE booking_id GLOB 'B[0-9]*'").fetchone()[0]
+                self._conn.execute("INSERT INTO booking_ids VALUES (?)", (first + count,))
+            else:
+                first = row[0]
+                self._conn.execute("UPDATE booking_ids SET next_number = ?", (first + count,))
+        return first
+
+    def import_data(self, users, tickets, bookings):
+        # Insert many users, tickets and booking records in a single transaction (used for migration)
+        with self._transaction():
+            self._conn.executemany("INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?)", map(_user_row, users))
+            self._conn.executemany("INSERT OR REPLACE INTO tickets VALUES (?, ?, ?, ?)",
+                                   (t.to_record() for t in tickets))
+            # Bookings already in the database are skipped, so a migration can safely be run twice
+            self._conn.executemany(f"INSERT OR IGNORE INTO bookings ({BOOKING_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   map(_booking_row, bookings))
+
+    @contextmanager
+    def _transaction(self):
+        # Run the statements inside the block as one write transaction
+        with self._thread_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def close(self):
+        # Close the database connection
+        self._conn.close()
+
+
+def _user_row(user):
+    # Convert a user to a users table row
+    return (user.get_user_id(), ROLES[type(user)], user.get_name(), user.get_email())
+
+
+def _like_escape(text):
+    # Escape the LIKE wildcards in text
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _booking_row(record):
+    # Convert a booking record to a bookings table row (dates are stored as ISO text)
+    return record[:5] + (record[5].isoformat(), record[6], _bulk_discount(record))
+
+
+def _booking_record(row):
+    # Convert a bookings table row back to a booking record
+    return tuple(row[:5]) + (datetime.fromisoformat(row[5]), row[6], bool(row[7]))
+
+
+def _bulk_discount(record):
+    # Return a booking record's bulk discount flag, or the default pricing rules' if it has none
+    return record[7] if len(record) > 7 else DEFAULT_PRICING.is_bulk_discount(record[3])
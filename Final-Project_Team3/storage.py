@@ -0,0 +1,35 @@
+import os
+
+from booking_journal import BookingJournal
+from sqlite_store import SQLiteStore
+from ticket_system import TicketSystem
+from pricing import PricingEngine
+from booking_client import BookingClient, RemoteTicketSystem
+
+
+def open_store():
+    # Return the store the GUIs save to: the SQLite database named by GRANDPRIX_DB if set,
+    # otherwise the pickle files and booking journal in the current directory
+    db_path = os.environ.get('GRANDPRIX_DB')
+    if db_path:
+        return SQLiteStore(db_path)
+    return BookingJournal()
+
+
+def open_pricing():
+    # Return the pricing engine for the rules file named by GRANDPRIX_PRICING (pricing.json by
+    # default), or the standard 10% off 5+ tickets if there is no such file
+    return PricingEngine.load_rules(os.environ.get('GRANDPRIX_PRICING', 'pricing.json'))
+
+
+def open_system(lazy=False):
+    # Return the ticket system the GUIs use: a client of the booking server at GRANDPRIX_SERVER
+    # (host:port or unix:/path) if set, otherwise a TicketSystem loaded from open_store().
+    # With lazy=True the data is loaded when first needed (see TicketSystem.load_saved_data).
+    address = os.environ.get('GRANDPRIX_SERVER')
+    if address:
+        system = RemoteTicketSystem(BookingClient(address))
+    else:
+        system = TicketSystem(open_store(), open_pricing())
+    system.load_saved_data(lazy)
+    return system
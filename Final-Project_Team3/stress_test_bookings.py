@@ -0,0 +1,207 @@
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+from threading import Thread
+
+from user import Fan
+from ticket import Ticket
+from ticket_system import TicketSystem
+from booking_journal import BookingJournal
+from sqlite_store import SQLiteStore
+
+
+PAYMENT_METHODS = ["Credit Card", "Debit Card", "Digital Wallet"]
+TICKET_IDS = ["T001", "T002", "T003", "T004"]
+
+
+def open_system(kind, directory, compact_every):
+    # Open a ticket system on a journal or SQLite store kept in the given directory
+    if kind == "sqlite":
+        store = SQLiteStore(os.path.join(directory, 'grandprix.db'))
+    else:
+        store = BookingJournal(os.path.join(directory, 'bookings.journal'), os.path.join(directory, 'bookings.pkl'),
+                               os.path.join(directory, 'users.pkl'), os.path.join(directory, 'tickets.pkl'),
+                               compact_every=compact_every, fsync=False)
+    system = TicketSystem(store)
+    system.load_saved_data()
+    return system
+
+
+def worker(args):
+    # Act as one GUI process: register a fan, book tickets and cancel every fifth booking.
+    # Returns the IDs of the bookings this process made and kept.
+    kind, directory, worker_id, num_bookings, compact_every = args
+    system = open_system(kind, directory, compact_every)
+    fan = Fan(f"W{worker_id}", f"Worker {worker_id}", f"worker{worker_id}@example.com")
+    system.register_user(fan)
+    kept = []
+    for i in range(num_bookings):
+        booking = system.book_ticket(fan, TICKET_IDS[i % 4], 1 + i % 6, PAYMENT_METHODS[i % 3])
+        if i % 5 == 4:
+            system.cancel_booking(booking.get_booking_id())
+        else:
+            kept.append(booking.get_booking_id())
+    return kept
+
+
+def id_worker(args):
+    # Act as a booking worker that is restarted halfway through: book (cancelling every third
+    # booking), close the store, open it again and book some more. Returns every booking ID issued.
+    kind, directory, worker_id, num_bookings = args
+    issued = []
+    for run in range(2):
+        system = open_system(kind, directory, 1000)
+        fan = system.get_fan(f"I{worker_id}")
+        if fan is None:
+            fan = Fan(f"I{worker_id}", f"Worker {worker_id}", f"worker{worker_id}@example.com")
+            system.register_user(fan)
+        for i in range(num_bookings // 2):
+            booking = system.book_ticket(fan, TICKET_IDS[i % 4], 1, PAYMENT_METHODS[i % 3])
+            issued.append(booking.get_booking_id())
+            if i % 3 == 2:
+                system.cancel_booking(booking.get_booking_id())
+        system._store.close()
+    return issued
+
+
+def capacity_worker(args):
+    # Act as one server process with several threads all buying the same limited ticket until it is
+    # sold out. Returns the number of tickets each of this process's bookings took.
+    kind, directory, worker_id, threads = args
+    system = open_system(kind, directory, 1000)
+    taken = []
+
+    def buy(thread_id):
+        fan = Fan(f"W{worker_id}-{thread_id}", "Buyer", "buyer@example.com")
+        system.register_user(fan)
+        i = 0
+        while True:
+            quantity = 3 - i % 3
+            try:
+                taken.append(system.book_ticket(fan, "T005", quantity, PAYMENT_METHODS[i % 3]).get_quantity())
+            except ValueError as e:
+                if "sold out" in str(e):
+                    return
+            i += 1
+
+    pool = [Thread(target=buy, args=(t,)) for t in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return taken
+
+
+def run_capacity(kind, processes=4, threads=8, capacity=2000):
+    # Race many processes and threads for one limited ticket, then check it sold exactly its capacity
+    with tempfile.TemporaryDirectory() as tmp:
+        system = open_system(kind, tmp, 1000)
+        system.add_ticket(Ticket("T005", "Grandstand Seat", 500, capacity))
+        system._store.close()
+
+        start = time.perf_counter()
+        with Pool(processes) as pool:
+            results = pool.map(capacity_worker, [(kind, tmp, w, threads) for w in range(processes)])
+        elapsed = time.perf_counter() - start
+
+        system = open_system(kind, tmp, 1000)
+        confirmed = sum(sum(taken) for taken in results)
+        saved = sum(b.get_quantity() for b in system.view_all_bookings() if b.get_ticket_id() == "T005")
+        ticket = system.get_ticket("T005")
+        problems = []
+        if saved != capacity or confirmed != capacity:
+            problems.append(f"{saved} tickets saved and {confirmed} confirmed, capacity {capacity}")
+        if not ticket.is_sold_out() or ticket.get_remaining() != 0:
+            problems.append(f"ticket reports {ticket.get_remaining()} left after reloading")
+        system._store.close()
+
+    bookings = sum(len(taken) for taken in results)
+    print(f"{kind:>7}: {processes}x{threads} buyers, {bookings} bookings for {capacity} seats in {elapsed:.2f}s "
+          f"- {'; '.join(problems) or 'OK'}")
+    return not problems
+
+
+def run_ids(kind, processes=8, num_bookings=400):
+    # Issue booking IDs from several restarting processes at once, then check that no ID was issued
+    # twice (cancelled ones included), that each process's IDs only went up, and that a new process
+    # carries on after all of them
+    with tempfile.TemporaryDirectory() as tmp:
+        system = open_system(kind, tmp, 1000)
+        for ticket_id in TICKET_IDS:
+            system.add_ticket(Ticket(ticket_id, "Race Pass", 350))
+        system._store.close()
+
+        start = time.perf_counter()
+        with Pool(processes) as pool:
+            results = pool.map(id_worker, [(kind, tmp, w, num_bookings) for w in range(processes)])
+        elapsed = time.perf_counter() - start
+
+        system = open_system(kind, tmp, 1000)
+        issued = [booking_id for ids in results for booking_id in ids]
+        problems = []
+        if len(set(issued)) != len(issued):
+            problems.append(f"{len(issued) - len(set(issued))} booking IDs were given out twice")
+        for w, ids in enumerate(results):
+            numbers = [int(booking_id[1:]) for booking_id in ids]
+            if numbers != sorted(set(numbers)):
+                problems.append(f"process {w} issued IDs out of order")
+        fan = system.get_fan("I0")
+        next_id = system.book_ticket(fan, "T001", 1, "Credit Card").get_booking_id()
+        if int(next_id[1:]) <= max(int(booking_id[1:]) for booking_id in issued):
+            problems.append(f"{next_id} was issued after a restart, below IDs already used")
+        system._store.close()
+
+    print(f"{kind:>7}: {processes} processes, {len(issued)} booking IDs in {elapsed:.2f}s "
+          f"- {'; '.join(problems) or 'OK'}")
+    return not problems
+
+
+def run(kind, processes=8, num_bookings=200, compact_every=50):
+    # Book from several processes at once, then reopen the store and check nothing was lost
+    with tempfile.TemporaryDirectory() as tmp:
+        system = open_system(kind, tmp, compact_every)
+        system.add_ticket(Ticket("T001", "Single Race Pass", 350))
+        system.add_ticket(Ticket("T002", "Weekend Package", 900))
+        system.add_ticket(Ticket("T003", "Season Membership", 3000))
+        system.add_ticket(Ticket("T004", "Group Discount (5+)", 320))
+        system._store.close()
+
+        start = time.perf_counter()
+        with Pool(processes) as pool:
+            results = pool.map(worker, [(kind, tmp, w, num_bookings, compact_every) for w in range(processes)])
+        elapsed = time.perf_counter() - start
+
+        system = open_system(kind, tmp, compact_every)
+        expected = [booking_id for kept in results for booking_id in kept]
+        saved = {b.get_booking_id() for b in system.view_all_bookings()}
+        problems = []
+        if len(set(expected)) != len(expected):
+            problems.append("the same booking ID was given out twice")
+        if saved != set(expected):
+            problems.append(f"{len(set(expected) - saved)} bookings lost, {len(saved - set(expected))} unexpected")
+        if any(system.get_fan(f"W{w}") is None for w in range(processes)):
+            problems.append("a registration was lost")
+        if not system.check_sales_summary():
+            problems.append("sales totals do not match the bookings")
+        for w in range(processes):
+            fan = system.get_fan(f"W{w}")
+            if fan is not None and len(fan.get_booking_history()) != len(results[w]):
+                problems.append(f"fan W{w} has {len(fan.get_booking_history())} bookings, "
+                                f"expected {len(results[w])}")
+        system._store.close()
+
+    bookings = processes * num_bookings
+    print(f"{kind:>7}: {processes} processes, {bookings} bookings in {elapsed:.2f}s "
+          f"({bookings / elapsed:.0f}/s) - {'; '.join(problems) or 'OK'}")
+    return not problems
+
+
+# --- Stress test ---
+if __name__ == "__main__":
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    ok = run("journal", processes) & run("sqlite", processes)
+    ok &= run_capacity("journal", processes) & run_capacity("sqlite", processes)
+    ok &= run_ids("journal", processes) & run_ids("sqlite", processes)
+    sys.exit(0 if ok else 1)
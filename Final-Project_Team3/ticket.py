@@ -1,11 +1,40 @@
+import sys
+import threading
+
+
 class Ticket:
     """Represents a ticket type for the Grand Prix."""
 
-    def __init__(self, ticket_id, ticket_type, price):
+    __slots__ = ('_ticket_id', '_ticket_type', '_price', '_capacity', '_sold', '_reserved', '_lock')
+
+    def __init__(self, ticket_id, ticket_type, price, capacity=None):
         # Initialize ticket attributes
         self._ticket_id = ticket_id
-        self._ticket_type = ticket_type
+        self._ticket_type = sys.intern(ticket_type)
         self._price = price
+        self._capacity = capacity  # Number of tickets on sale, or None for no limit
+        self._sold = 0  # Tickets taken by saved bookings (counted again from the bookings on load)
+        self._reserved = 0  # Tickets held by bookings in progress in this process
+        self._lock = threading.Lock()  # Guards the counts of this ticket only
+
+    def to_record(self):
+        # Return the (ticket_id, ticket_type, price, capacity) record used to save this ticket
+        return (self._ticket_id, self._ticket_type, self._price, self._capacity)
+
+    def __getstate__(self):
+        # Pickle the ticket without its lock or sales counts, which are rebuilt from the bookings
+        return {'_ticket_id': self._ticket_id, '_ticket_type': self._ticket_type,
+                '_price': self._price, '_capacity': self._capacity}
+
+    def __setstate__(self, state):
+        # Restore a pickled ticket (tickets saved before capacities existed have no limit)
+        self._ticket_id = state['_ticket_id']
+        self._ticket_type = sys.intern(state['_ticket_type'])
+        self._price = state['_price']
+        self._capacity = state.get('_capacity')
+        self._sold = 0
+        self._reserved = 0
+        self._lock = threading.Lock()
 
     def get_ticket_id(self):
         # Return the unique ID of the ticket
@@ -23,6 +52,61 @@ class Ticket:
         # Update the price of the ticket
         self._price = price
 
+    def get_capacity(self):
+        # Return the number of tickets on sale, or None if there is no limit
+        return self._capacity
+
+    def set_capacity(self, capacity):
+        # Update the number of tickets on sale (None for no limit)
+        self._capacity = capacity
+
+    def get_remaining(self):
+        # Return the number of tickets still available, or None if there is no limit
+        if self._capacity is None:
+            return None
+        return max(self._capacity - self._sold - self._reserved, 0)
+
+    def is_sold_out(self):
+        # Return True if no tickets are left
+        return self._capacity is not None and self._sold + self._reserved >= self._capacity
+
+    def reserve(self, quantity):
+        # Hold tickets for a booking in progress, failing at once if there are not enough left
+        if quantity < 1:
+            raise ValueError("Quantity must be at least 1.")
+        with self._lock:
+            if self._capacity is not None and self._sold + self._reserved + quantity > self._capacity:
+                raise ValueError(self._not_enough_message(self._sold + self._reserved))
+            self._reserved += quantity
+
+    def release(self, quantity):
+        # Give back tickets held by reserve() for a booking that was not made
+        with self._lock:
+            self._reserved -= quantity
+
+    def check_available(self, quantity):
+        # Fail if saved bookings leave fewer than the given number of tickets. Called with the store
+        # locked and up to date, so it catches tickets another process sold after reserve().
+        if self._capacity is not None and self._sold + quantity > self._capacity:
+            raise ValueError(self._not_enough_message(self._sold))
+
+    def add_sold(self, quantity):
+        # Count tickets taken by a saved booking (negative for a cancelled booking)
+        with self._lock:
+            self._sold += quantity
+
+    def set_sold(self, sold):
+        # Set the number of tickets taken by saved bookings (used by stores that keep running totals)
+        with self._lock:
+            self._sold = sold
+
+    def _not_enough_message(self, taken):
+        # Return the error shown when a booking asks for more tickets than are left
+        left = self._capacity - taken
+        if left <= 0:
+            return f"{self._ticket_type} is sold out."
+        return f"Only {left} {self._ticket_type} ticket(s) left."
+
     def __str__(self):
         # Return a string representation of the Ticket object
         return f"Ticket[{self._ticket_id}] {self._ticket_type} - AED {self._price}"
@@ -1,50 +1,24 @@
 # ---------- Imports ----------
 import tkinter as tk  # GUI framework
 from tkinter import messagebox  # For pop-up error/info dialogs
-import pickle  # For saving/loading data
-import os  # For file existence checking
 
 
 # Import user and system-related classes
-from user import Fan
 from ticket import Ticket
-from ticket_system import TicketSystem
-
-
-
-
-# ---------- Utility Functions ----------
-# Save data to a file using pickle
-def save_data(filename, data):
-  with open(filename, 'wb') as f:
-      pickle.dump(data, f)
-
-
-# Load data from a file if it exists, otherwise return an empty list
-def load_data(filename):
-  if os.path.exists(filename):
-      with open(filename, 'rb') as f:
-          return pickle.load(f)
-  return []
-
-
-
-
-# ---------- Load Existing Data ----------
-# Load users, tickets, and bookings data from files
-users = load_data('users.pkl')
-tickets = load_data('tickets.pkl')
-bookings = load_data('bookings.pkl')
+from storage import open_system  # Local files/SQLite, or the booking server when GRANDPRIX_SERVER is set
+import metrics  # Latency histograms of the screens, written out when GRANDPRIX_METRICS is set
+import profiling  # Profiles of slow callbacks, with --profile or GRANDPRIX_PROFILE
+from booking_writer import BookingWriter  # Saves bookings on a background thread
 
 
 
 
 # ---------- Setup Ticket System ----------
-# Create an instance of the TicketSystem and assign the loaded data
-system = TicketSystem()
-system._users = users
-system._tickets = tickets
-system._bookings = bookings
+# Create the TicketSystem on the configured store (or connect to the booking server). Nothing is read yet:
+# the window shows straight away, the login reads only the users, and the bookings load in the background.
+system = open_system(lazy=True)
+# Bookings are saved by a background thread, in one write per burst, so the window never waits for the disk
+writer = BookingWriter(system)
 
 
 
@@ -57,9 +31,12 @@ class TicketGUI(tk.Tk):
       self.geometry("600x650")  # Set window size
       self.current_fan = None  # Currently logged in Fan
       self.init_login_screen()  # Start with the login screen
+      self.after(100, system.load_in_background)  # Load the bookings once the window is up
+      self.protocol("WM_DELETE_WINDOW", self.close)  # Save any bookings still queued before closing
 
 
   # Login screen to enter Fan ID
+  @metrics.timed("ticket_gui_init_login_screen")
   def init_login_screen(self):
       self.clear_widgets()  # Clear any existing widgets
       tk.Label(self, text="Enter your Fan ID to Book Tickets", font=("Arial", 14)).pack(pady=10)
@@ -69,10 +46,11 @@ class TicketGUI(tk.Tk):
 
 
   # Load fan details based on entered ID
+  @metrics.timed("ticket_gui_load_fan")
   def load_fan(self):
       uid = self.fan_id_entry.get()
-      # Search for a matching Fan object in the users list
-      matched = next((u for u in users if isinstance(u, Fan) and u.get_user_id() == uid), None)
+      # Look up the Fan object in the system's user index
+      matched = system.get_fan(uid)
       if matched:
           self.current_fan = matched  # Save the fan object
           self.init_ticket_booking_screen()  # Proceed to ticket booking
@@ -81,12 +59,14 @@ class TicketGUI(tk.Tk):
 
 
   # Show screen with available tickets and booking form
+  @metrics.timed("ticket_gui_init_ticket_booking_screen")
   def init_ticket_booking_screen(self):
       self.clear_widgets()
       tk.Label(self, text="Available Tickets", font=("Arial", 14)).pack(pady=10)
 
 
       self.ticket_var = tk.StringVar()  # Variable to hold selected ticket ID
+      tickets = system.get_tickets()
 
 
       if not tickets:
@@ -101,6 +81,8 @@ class TicketGUI(tk.Tk):
               f"Validity: {'Single day' if 'Single' in ticket.get_ticket_type() else '3 days' if 'Weekend' in ticket.get_ticket_type() else 'All season'}\n"
               f"Features: {'Access to main event' if 'Single' in ticket.get_ticket_type() else 'All races + Pit access' if 'Weekend' in ticket.get_ticket_type() else 'All-season VIP access'}"
           )
+          if ticket.get_capacity() is not None:
+              desc += "\nSOLD OUT" if ticket.is_sold_out() else f"\nTickets left: {ticket.get_remaining()}"
           tk.Radiobutton(
               self,
               text=desc,
@@ -108,7 +90,8 @@ class TicketGUI(tk.Tk):
               value=ticket.get_ticket_id(),
               justify="left",
               anchor="w",
-              wraplength=500
+              wraplength=500,
+              state="disabled" if ticket.is_sold_out() else "normal"
           ).pack(anchor="w", padx=10, pady=5)
 
 
@@ -125,12 +108,29 @@ class TicketGUI(tk.Tk):
       self.payment_dropdown.pack()
 
 
+      # Promo code input
+      tk.Label(self, text="Promo Code (optional):").pack(pady=(10, 0))
+      self.promo_entry = tk.Entry(self)
+      self.promo_entry.pack()
+
+
+      # Live total, worked out again whenever the ticket, quantity, payment method or promo code changes
+      self.total_label = tk.Label(self, text="", justify="left")
+      self.total_label.pack(pady=(10, 0))
+      self.quantity_entry.bind("<KeyRelease>", lambda event: self.update_total())
+      self.promo_entry.bind("<KeyRelease>", lambda event: self.update_total())
+      self.ticket_var.trace_add("write", lambda *args: self.update_total())
+      self.payment_var.trace_add("write", lambda *args: self.update_total())
+
+
       # Book and back buttons
-      tk.Button(self, text="Book Ticket", command=self.book_ticket).pack(pady=10)
+      self.book_button = tk.Button(self, text="Book Ticket", command=self.book_ticket)
+      self.book_button.pack(pady=10)
       tk.Button(self, text="Back", command=self.init_login_screen).pack()
 
 
   # Process ticket booking
+  @metrics.timed("ticket_gui_book_ticket")
   def book_ticket(self):
       ticket_id = self.ticket_var.get()
       try:
@@ -139,16 +139,44 @@ class TicketGUI(tk.Tk):
           if not payment_method:
               messagebox.showerror("Error", "Please select a payment method.")
               return
-          # Book ticket through the system
-          booking = system.book_ticket(self.current_fan, ticket_id, quantity, payment_method)
-          bookings.append(booking)  # Add booking to list
-          save_data('bookings.pkl', bookings)  # Save bookings
-          save_data('users.pkl', users)  # Update users with booking info
-          self.show_confirmation(booking)  # Show confirmation screen
+          # Queue the booking for the writer thread; the confirmation shows once it is saved
+          future = writer.submit(self.current_fan, ticket_id, quantity, payment_method, self.promo_entry.get())
+          self.book_button.config(state="disabled")  # One booking at a time
+          self.after(50, self.wait_for_booking, future)
       except ValueError as e:
           messagebox.showerror("Error", str(e))  # Catch invalid input errors
 
 
+  # Check back until the writer has saved the booking, then confirm it (or show why it failed). Polled
+  # from the Tk thread: a callback from the writer thread would wait for the Tk loop, which close() blocks.
+  def wait_for_booking(self, future):
+      if not future.done():
+          self.after(50, self.wait_for_booking, future)
+          return
+      try:
+          booking = future.result()
+      except Exception as e:  # Whatever went wrong, the form must be usable again
+          if self.book_button.winfo_exists():
+              self.book_button.config(state="normal")
+          messagebox.showerror("Error", str(e))
+          return
+      self.show_confirmation(booking)  # Show confirmation screen
+
+
+  # Show the price of the booking as it is filled in (quotes are cached, so this is cheap per keystroke)
+  def update_total(self):
+      quantity = self.quantity_entry.get().strip()
+      if not self.ticket_var.get() or not quantity.isdigit():
+          self.total_label.config(text="")  # Not filled in yet
+          return
+      try:
+          quote = system.quote(self.ticket_var.get(), int(quantity), self.payment_var.get() or None,
+                               self.promo_entry.get())
+          self.total_label.config(text=str(quote))
+      except ValueError as e:
+          self.total_label.config(text=str(e))  # e.g. an unknown or expired promo code
+
+
   # Show confirmation after booking
   def show_confirmation(self, booking):
       self.clear_widgets()
@@ -158,6 +186,12 @@ class TicketGUI(tk.Tk):
       tk.Button(self, text="Back to Start", command=self.init_login_screen).pack(pady=5)
 
 
+  # Save the bookings still queued, then close the window
+  def close(self):
+      writer.close()
+      self.destroy()
+
+
   # Utility function to remove all widgets from current screen
   def clear_widgets(self):
       for widget in self.winfo_children():
@@ -168,5 +202,6 @@ class TicketGUI(tk.Tk):
 
 # ---------- Run the Application ----------
 if __name__ == "__main__":
+  profiling.install()  # Profile slow callbacks when started with --profile (or GRANDPRIX_PROFILE set)
   app = TicketGUI()  # Create an instance of the TicketGUI
   app.mainloop()  # Start the Tkinter main event loop
@@ -1,46 +1,714 @@
+import threading
+
 from user import Fan, Admin
 from ticket import Ticket
-from booking import Booking
+from booking import Booking, to_timestamp
+from sales_summary import SalesSummary
+from sales_analytics import SalesAnalytics
+from booking_index import BookingIndex
+from user_search import UserSearchIndex
+from id_allocator import IdAllocator, next_booking_number
+from pricing import PricingEngine
+import metrics
+
 
 class TicketSystem:
     """Manages users, tickets, and bookings."""
 
-    def __init__(self):
-        # Initialize lists for users, tickets, and bookings
-        self._users = []
-        self._tickets = []
-        self._bookings = []
+    def __init__(self, store=None, pricing=None):
+        # Initialize indexes for users and tickets, and the list of bookings
+        self._users = {}  # user_id -> User
+        self._tickets = {}  # ticket_id -> Ticket
+        self._bookings_by_id = {}  # booking_id -> Booking held in memory, in the order they were added
+        self._bookings_by_fan = _BookingsByFan(self._find_fan_bookings)  # user_id -> list shared with each Fan
+        self._booking_count = 0  # Total bookings, including any the store has not loaded into memory
+        self._sales = SalesSummary()  # Running totals, kept up to date on every booking/cancellation
+        self._analytics = None  # Hourly/daily rollups (SalesAnalytics), built when first asked for
+        self._index = None  # Bookings by ticket type, payment method, fan and date, built when first queried
+        self._search = None  # Users by the words of their names and emails, built when first searched
+        self._store = store  # Optional BookingJournal or SQLiteStore that saves every change
+        self._pricing = pricing or PricingEngine()  # Works out booking totals and which get the bulk discount
+        self._lock = threading.RLock()  # Serializes changes when there is no store (whose lock does this)
+        self._ids = IdAllocator(self._reserve_booking_ids)  # Issues booking IDs from blocks the store reserves
+        self._next_number = None  # Next unreserved booking number, when there is no store to keep it
+        self._users_pending = False  # Users and tickets are still to be loaded (lazy load_saved_data)
+        self._bookings_pending = False  # Bookings are still to be loaded (lazy load_saved_data)
+        self._load_lock = threading.RLock()  # Held while the store loads what was left for later
+        self._loading = False
+
+    @metrics.timed("load_saved_data")
+    def load_saved_data(self, lazy=False):
+        # Load users, tickets and bookings (or as much as the store needs up front) from the store.
+        # With lazy=True nothing is read yet: users and tickets are loaded the first time they are
+        # needed (e.g. by a login), and bookings the first time they are needed or by load_in_background().
+        if lazy:
+            self._users_pending = self._bookings_pending = True
+        else:
+            self._store.load(self)
+
+    def load_in_background(self):
+        # Finish a lazy load on a background thread, so a window can show before the data is read
+        thread = threading.Thread(target=self._finish_loading, args=(True,), daemon=True)
+        thread.start()
+        return thread
+
+    def refresh(self):
+        # Pick up changes other processes (e.g. another GUI) have saved to the store since it was loaded
+        self._finish_loading(bookings=True)
+        if self._store:
+            self._store.sync()
+
+    def clear(self):
+        # Forget everything held in memory, ready for the store to load it again
+        self.__init__(self._store, self._pricing)
+
+    def load(self, users, tickets, bookings, summary=None, booking_count=None):
+        # Fill the system with previously saved users, tickets and bookings.
+        # A store that loads bookings on demand passes its sales summary and total booking count instead.
+        in_memory = set()  # Fans whose booking history was already built in memory
+        for user in users:
+            self._users[user.get_user_id()] = user
+            user.watch(self._user_changed)
+            if isinstance(user, Fan) and not user.attach_history(self._bookings_by_fan):
+                in_memory.add(user.get_user_id())
+        for ticket in tickets:
+            self._tickets[ticket.get_ticket_id()] = ticket
+        for booking in bookings:
+            if booking.get_booking_id() in self._bookings_by_id:
+                continue  # Older saves could list the same booking twice
+            self._bookings_by_id[booking.get_booking_id()] = booking
+            if summary is None and booking.get_ticket_id() in self._tickets:
+                self._tickets[booking.get_ticket_id()].add_sold(booking.get_quantity())
+            if booking.get_fan_id() not in in_memory:
+                # Loaded fans read their history from this index the first time it is needed
+                self._bookings_by_fan.setdefault(booking.get_fan_id(), []).append(booking)
+        self._booking_count = len(self._bookings_by_id) if booking_count is None else booking_count
+        self._bookings_by_fan.on_demand = booking_count is not None
+        self._sales = SalesSummary.rebuild(self._bookings_by_id.values()) if summary is None else summary
+        self._analytics = None  # Built again when next asked for
+        self._index = None
+        self._search = None
+        if not self._store:
+            # Number new bookings after the ones just loaded
+            self._ids = IdAllocator(self._reserve_booking_ids)
+            self._next_number = None
 
+    @metrics.timed("register_user")
     def register_user(self, user):
-        # Add a user to the system
-        self._users.append(user)
+        # Add a user to the system, rejecting a user ID that is already taken
+        self._finish_loading()
+        with self._locked():
+            if self.get_user(user.get_user_id()) is not None:
+                raise ValueError("User ID already exists.")
+            self._cache_user(user)
+            if self._store:
+                self._store.save_user(user)
+
+    def delete_user(self, user_id):
+        # Remove a user from the system and return it (None if no such user)
+        self._finish_loading()
+        with self._locked():
+            user = self.get_user(user_id)
+            if user is not None:
+                del self._users[user_id]
+                if self._search is not None:
+                    self._search.remove(user_id)
+                if self._store:
+                    self._store.delete_user(user_id)
+        return user
+
+    @metrics.timed("get_user")
+    def get_user(self, user_id):
+        # Return the user with the given ID, or None if not found
+        self._finish_loading()
+        user = self._users.get(user_id)
+        if user is None and self._store:
+            # Users the store did not load up front are fetched (and kept) on first lookup. A journal
+            # store instead catches up with registrations made by other processes (without loading
+            # the bookings, if a lazy load has not loaded them yet).
+            user = self._store.find_user(user_id)
+            if user is not None:
+                self._cache_user(user)
+            else:
+                user = self._users.get(user_id)
+        return user
+
+    def get_fan(self, user_id):
+        # Return the fan with the given ID, or None if not found
+        user = self.get_user(user_id)
+        return user if isinstance(user, Fan) else None
+
+    def get_admin(self, user_id):
+        # Return the admin with the given ID, or None if not found
+        user = self.get_user(user_id)
+        return user if isinstance(user, Admin) else None
+
+    def get_users(self):
+        # Return a list of the users held in memory (every user unless the store loads them on demand)
+        self._finish_loading()
+        return list(self._users.values())
+
+    @metrics.timed("search_users")
+    def search_users(self, query, limit=50):
+        # Return up to limit users whose name or email contains the query, for search-as-you-type
+        # (a query of 1 or 2 characters matches the start of a word in the name or email)
+        self._finish_loading()
+        if self._store:
+            found = self._store.find_users(query, limit)
+            if found is not None:
+                # The store loads users on demand and searches them itself; keep the ones found
+                return [self._users.get(user.get_user_id()) or self._cache_user(user) for user in found]
+        if self._search is None:
+            with self._locked():  # So no user registered meanwhile on another thread is left out
+                if self._search is None:
+                    self._search = UserSearchIndex.rebuild(self._users.values())
+        return self._search.search(query, limit)
 
     def add_ticket(self, ticket):
         # Add a ticket to the system
-        self._tickets.append(ticket)
+        self._finish_loading(bookings=True)
+        with self._locked():
+            self._tickets[ticket.get_ticket_id()] = ticket
+            if self._store:
+                self._store.save_ticket(ticket)
+
+    def get_ticket(self, ticket_id):
+        # Return the ticket with the given ID, or None if not found
+        self._finish_loading(bookings=True)  # The tickets left depend on the bookings
+        return self._tickets.get(ticket_id)
+
+    def get_tickets(self):
+        # Return a list of all available tickets
+        self._finish_loading(bookings=True)  # The tickets left depend on the bookings
+        return list(self._tickets.values())
 
-    def book_ticket(self, fan, ticket_id, quantity, payment_method):
+    def get_booking(self, booking_id):
+        # Return the booking with the given ID, or None if not found
+        self._finish_loading(bookings=True)
+        booking = self._bookings_by_id.get(booking_id)
+        if booking is None and self._store:
+            record = self._store.find_booking(booking_id)
+            if record is not None:
+                booking = self._booking_from_record(record)
+        return booking
+
+    def get_booking_history_page(self, fan, offset, limit):
+        # Return one page of a fan's bookings, newest first, and the number of bookings the fan has in all
+        user_id = fan.get_user_id()
+        self._finish_loading(bookings=True)
+        if self._bookings_by_fan.on_demand and user_id not in self._bookings_by_fan:
+            # The fan's history has not been fetched, so fetch just this page from the store
+            records, total = self._store.find_bookings_for_fan_page(user_id, offset, limit)
+            return [self._bookings_by_id.get(record[0]) or self._booking_from_record(record)
+                    for record in records], total
+        history = fan.get_booking_history()
+        total = len(history)
+        page = history[max(total - offset - limit, 0):max(total - offset, 0)]
+        page.reverse()
+        return page, total
+
+    @metrics.timed("quote")
+    def quote(self, ticket_id, quantity, payment_method=None, promo_code=None):
+        # Return the pricing engine's Quote for a booking, without making it
+        ticket = self.get_ticket(ticket_id)
+        if not ticket:
+            raise ValueError("Invalid Ticket ID")
+        if quantity < 1:
+            raise ValueError("Quantity must be at least 1.")
+        return self._pricing.quote(ticket, quantity, payment_method, promo_code)
+
+    @metrics.timed("book_ticket")
+    def book_ticket(self, fan, ticket_id, quantity, payment_method, promo_code=None):
         # Find the ticket by ID and create a booking if it exists
-        ticket = next((t for t in self._tickets if t.get_ticket_id() == ticket_id), None)
-        if ticket:
-            # Generate a unique booking ID
-            booking_id = f"B{len(self._bookings) + 1}"
-            # Create a new booking and add it to the bookings list
-            booking = Booking(booking_id, fan, ticket, quantity, payment_method)
-            self._bookings.append(booking)
-            return booking
-        else:
+        self._finish_loading(bookings=True)
+        ticket = self._tickets.get(ticket_id)
+        if not ticket:
             # Raise an error if the ticket ID is invalid
             raise ValueError("Invalid Ticket ID")
+        quote = self._pricing.quote(ticket, quantity, payment_method, promo_code)
+        # Hold the tickets first: once a ticket is sold out, buyers are turned away
+        # by its own counter without queueing for the store's lock
+        ticket.reserve(quantity)
+        try:
+            # Take a unique booking ID from this process's block of reserved numbers
+            booking_id = self._ids.next_id()
+            # The store stays locked until the booking is saved, so no other process
+            # can take the last tickets
+            with self._locked():
+                ticket.check_available(quantity)
+                # Create a new booking and add it to the bookings list
+                booking = Booking(booking_id, fan, ticket, quantity, payment_method, quote)
+                self._add_booking(booking)
+                if self._store:
+                    # Save only the new booking instead of re-saving every booking
+                    self._store.append(booking)
+                return booking
+        finally:
+            ticket.release(quantity)  # Now counted as sold (or not booked at all)
+
+    @metrics.timed("book_many")
+    def book_many(self, requests):
+        # Book a batch of (fan, ticket_id, quantity, payment_method) requests all at once: either every
+        # booking is made and saved in a single write, or none is and BatchBookingError lists what was wrong
+        self._finish_loading(bookings=True)
+        requests = list(requests)
+        errors = []
+        for index, (fan, ticket_id, quantity, payment_method) in enumerate(requests):
+            if fan is None:
+                errors.append((index, "Fan not found."))
+            elif ticket_id not in self._tickets:
+                errors.append((index, "Invalid Ticket ID"))
+            elif not payment_method:
+                errors.append((index, "Please select a payment method."))
+        if errors:
+            raise BatchBookingError(errors)
+
+        reserved = []  # (ticket, quantity) held so far
+        try:
+            # Hold the tickets item by item, so a shortage is reported against the request that hit it
+            for index, (fan, ticket_id, quantity, payment_method) in enumerate(requests):
+                ticket = self._tickets[ticket_id]
+                try:
+                    ticket.reserve(quantity)
+                    reserved.append((ticket, quantity))
+                except ValueError as e:
+                    errors.append((index, str(e)))
+            if errors:
+                raise BatchBookingError(errors)
+
+            booking_ids = self._ids.next_ids(len(requests))
+            with self._locked():
+                # Check the whole batch against tickets other processes have sold since
+                totals = {}
+                for fan, ticket_id, quantity, payment_method in requests:
+                    totals[ticket_id] = totals.get(ticket_id, 0) + quantity
+                for index, (fan, ticket_id, quantity, payment_method) in enumerate(requests):
+                    try:
+                        self._tickets[ticket_id].check_available(totals.pop(ticket_id, 0))
+                    except ValueError as e:
+                        errors.append((index, str(e)))
+                if errors:
+                    raise BatchBookingError(errors)
+
+                bookings = []
+                try:
+                    for booking_id, (fan, ticket_id, quantity, payment_method) in zip(booking_ids, requests):
+                        ticket = self._tickets[ticket_id]
+                        quote = self._pricing.quote(ticket, quantity, payment_method)
+                        booking = Booking(booking_id, fan, ticket, quantity, payment_method, quote)
+                        self._add_booking(booking)
+                        bookings.append(booking)
+                    if self._store:
+                        # One write (and one sync to disk) for the whole batch
+                        self._store.append_many(bookings)
+                except BaseException:
+                    # The batch could not be saved, so take its bookings back out of memory
+                    for booking in bookings:
+                        self._remove_booking(booking)
+                    raise
+                return bookings
+        finally:
+            for ticket, quantity in reserved:
+                ticket.release(quantity)
+
+    def import_users(self, users):
+        # Add a batch of users (e.g. from a bulk import) with a single write, skipping any whose user ID
+        # is already taken. Returns (users added, indexes of the ones skipped as duplicates).
+        self._finish_loading(bookings=True)
+        with self._locked():
+            added, duplicates = [], []
+            seen = set()
+            for index, user in enumerate(users):
+                user_id = user.get_user_id()
+                if user_id in seen or self.get_user(user_id) is not None:
+                    duplicates.append(index)
+                else:
+                    seen.add(user_id)
+                    added.append(user)
+            try:
+                for user in added:
+                    self._cache_user(user)
+                if self._store and added:
+                    self._store.save_users(added)
+            except BaseException:
+                # The batch could not be saved, so take its users back out of memory
+                for user in added:
+                    self._users.pop(user.get_user_id(), None)
+                    if self._search is not None:
+                        self._search.remove(user.get_user_id())
+                raise
+        return added, duplicates
+
+    def import_bookings(self, records):
+        # Add a batch of bookings made elsewhere (booking records, e.g. from a bulk import) with a single
+        # write, keeping their IDs, dates and totals (and bulk discount flags, or the pricing engine's if a
+        # record has none). Records whose booking ID is already in use are skipped; BatchBookingError lists
+        # any that refer to an unknown ticket or fan, and then none is added. Returns (bookings added,
+        # indexes of the records skipped as duplicates). A store that loads bookings on demand keeps the
+        # bookings instead of memory, so importing any number of them only adds to the running totals.
+        self._finish_loading(bookings=True)
+        records = list(records)
+        on_demand = self._bookings_by_fan.on_demand
+        with self._locked():
+            errors, duplicates, new = [], [], []
+            seen = set()
+            for index, record in enumerate(records):
+                booking_id, fan_id, ticket_id, quantity = record[:4]
+                if booking_id in seen or (booking_id in self._bookings_by_id or
+                                          (self._store and self._store.find_booking(booking_id) is not None)):
+                    duplicates.append(index)
+                elif ticket_id not in self._tickets:
+                    errors.append((index, "Invalid Ticket ID"))
+                elif self.get_fan(fan_id) is None:
+                    errors.append((index, "Fan not found."))
+                elif quantity < 1:
+                    errors.append((index, "Quantity must be at least 1."))
+                else:
+                    seen.add(booking_id)
+                    if len(record) < 8:
+                        record = (*record[:7], self._pricing.is_bulk_discount(quantity))
+                    new.append(record)
+            if errors:
+                raise BatchBookingError(errors)
+
+            bookings = []
+            try:
+                for record in new:
+                    fan = self.get_fan(record[1])
+                    booking = Booking.from_record(record, fan, self._tickets[record[2]])
+                    if on_demand:
+                        self._count_booking(booking)  # Kept in memory only in a history already fetched
+                    else:
+                        self._add_booking(booking)
+                    fan.add_booking(booking)
+                    bookings.append(booking)
+                if self._store and bookings:
+                    self._store.append_many(bookings)
+            except BaseException:
+                for booking in bookings:
+                    self._remove_booking(booking)
+                raise
+        # Imported IDs in this system's own "B<number>" form must never be issued again
+        highest = next_booking_number(booking.get_booking_id() for booking in bookings) - 1
+        if highest:
+            self._skip_booking_ids(highest)
+        return bookings, duplicates
+
+    @metrics.timed("book_group")
+    def book_group(self, requests):
+        # Book a group of independent (fan, ticket_id, quantity, payment_method, promo_code) requests,
+        # e.g. a burst queued by a BookingWriter, saving every booking made with a single write (one
+        # group commit). Unlike book_many, a request that cannot be booked does not stop the others:
+        # returns a list with each request's Booking, or the ValueError it failed with.
+        self._finish_loading(bookings=True)
+        requests = list(requests)
+        results = [None] * len(requests)
+        reserved = []  # (index, fan, ticket, quantity, payment_method, quote) of the requests holding tickets
+        try:
+            for index, (fan, ticket_id, quantity, payment_method, promo_code) in enumerate(requests):
+                ticket = self._tickets.get(ticket_id)
+                try:
+                    if fan is None:
+                        raise ValueError("Fan not found.")
+                    if not ticket:
+                        raise ValueError("Invalid Ticket ID")
+                    if not payment_method:
+                        raise ValueError("Please select a payment method.")
+                    quote = self._pricing.quote(ticket, quantity, payment_method, promo_code)
+                    ticket.reserve(quantity)
+                except ValueError as e:
+                    results[index] = e
+                    continue
+                reserved.append((index, fan, ticket, quantity, payment_method, quote))
+
+            booking_ids = self._ids.next_ids(len(reserved)) if reserved else []
+            with self._locked():
+                bookings = []
+                try:
+                    for booking_id, (index, fan, ticket, quantity, payment_method, quote) in zip(booking_ids, reserved):
+                        try:
+                            # Counted as sold by the bookings made so far in the group too
+                            ticket.check_available(quantity)
+                        except ValueError as e:
+                            results[index] = e
+                            continue
+                        booking = Booking(booking_id, fan, ticket, quantity, payment_method, quote)
+                        self._add_booking(booking)
+                        bookings.append(booking)
+                        results[index] = booking
+                    if self._store and bookings:
+                        self._store.append_many(bookings)
+                except BaseException:
+                    # The group could not be saved, so take its bookings back out of memory
+                    for booking in bookings:
+                        self._remove_booking(booking)
+                    raise
+            return results
+        finally:
+            for index, fan, ticket, quantity, payment_method, quote in reserved:
+                ticket.release(quantity)
+
+    @metrics.timed("cancel_booking")
+    def cancel_booking(self, booking_id):
+        # Cancel a booking, removing it from the system and the fan's history
+        self._finish_loading(bookings=True)
+        with self._locked():
+            booking = self.get_booking(booking_id)
+            if booking is None:
+                raise ValueError("Invalid Booking ID")
+            if self._store:
+                self._store.append_cancel(booking)
+            self._remove_booking(booking)
+        return booking
+
+    def apply_booking(self, record):
+        # Add a booking another process saved to the store (called by the store while it catches up)
+        if record[0] in self._bookings_by_id or record[2] not in self._tickets:
+            return
+        fan = self.get_user(record[1]) or Fan(record[1], "", "")  # The fan may have deleted the account
+        booking = Booking.from_record(record, fan, self._tickets[record[2]])
+        self._add_booking(booking)
+        fan.add_booking(booking)
+
+    def apply_cancel(self, booking_id):
+        # Remove a booking another process cancelled (called by the store while it catches up)
+        booking = self._bookings_by_id.get(booking_id)
+        if booking is not None:
+            self._remove_booking(booking)
+
+    def apply_user(self, user):
+        # Add a user another process registered (called by the store while it catches up)
+        if user.get_user_id() not in self._users:
+            self._cache_user(user)
+
+    def apply_user_deleted(self, user_id):
+        # Forget a user another process deleted (called by the store while it catches up)
+        if self._users.pop(user_id, None) is not None and self._search is not None:
+            self._search.remove(user_id)
+
+    def apply_ticket(self, ticket):
+        # Add a ticket another process saved (called by the store while it catches up)
+        existing = self._tickets.get(ticket.get_ticket_id())
+        if existing is None:
+            self._tickets[ticket.get_ticket_id()] = ticket
+        else:
+            existing.set_price(ticket.get_price())
+            existing.set_capacity(ticket.get_capacity())
 
     def view_all_bookings(self):
-        # Return the list of all bookings
-        return self._bookings
+        # Return a list of all bookings, in the order they were made
+        self._finish_loading(bookings=True)
+        if self._booking_count != len(self._bookings_by_id):
+            # The store loads bookings on demand, so fetch the ones not yet in memory
+            for record in self._store.find_all_bookings():
+                if record[0] not in self._bookings_by_id:
+                    self._booking_from_record(record)
+        return list(self._bookings_by_id.values())
 
     def view_ticket_sales(self):
-        # Calculate total tickets sold for each ticket type
-        sales = {}
-        for b in self._bookings:
-            ticket_type = b.get_ticket_type()
-            sales[ticket_type] = sales.get(ticket_type, 0) + b.get_quantity()
-        return sales
+        # Return total tickets sold for each ticket type
+        self._finish_loading(bookings=True)
+        return self._sales.get_quantity_by_ticket_type()
+
+    def view_sales_summary(self):
+        # Return the running sales and revenue totals
+        self._finish_loading(bookings=True)
+        return self._sales
+
+    def export_sales_summary(self):
+        # Return a copy of the running totals as plain tables (e.g. to send as JSON), taken holding the
+        # lock so no booking made on another thread changes them while they are copied
+        summary = self.view_sales_summary()
+        with self._locked():
+            return summary.to_dict()
+
+    def export_sales_analytics(self):
+        # Return a copy of the sales rollups as plain tables, taken holding the lock like export_sales_summary()
+        analytics = self.view_sales_analytics()
+        with self._locked():
+            return analytics.to_dict()
+
+    @metrics.timed("view_sales_analytics")
+    def view_sales_analytics(self):
+        # Return the hourly and daily sales rollups, building them the first time they are asked for
+        self._finish_loading(bookings=True)
+        if self._analytics is None:
+            with self._locked():  # So no booking made meanwhile on another thread is left out
+                if self._analytics is None:
+                    if self._booking_count != len(self._bookings_by_id):
+                        # The store loads bookings on demand, and keeps the rollups itself
+                        self._analytics = self._store.load_sales_analytics()
+                    else:
+                        self._analytics = SalesAnalytics.rebuild(self._bookings_by_id.values())
+        return self._analytics
+
+    @metrics.timed("find_bookings")
+    def find_bookings(self, ticket_type=None, payment_method=None, fan_id=None, since=None, until=None):
+        # Return the bookings matching every criterion given (since <= date < until), oldest first,
+        # e.g. find_bookings(ticket_type="Weekend Package", payment_method="Credit Card", since=saturday,
+        # until=sunday). Only the most selective index is scanned, never every booking.
+        self._finish_loading(bookings=True)
+        if self._booking_count != len(self._bookings_by_id):
+            # The store loads bookings on demand, so it runs the query on its own indexes
+            return [self._bookings_by_id.get(record[0]) or self._booking_from_record(record)
+                    for record in self._store.find_bookings(ticket_type, payment_method, fan_id, since, until)]
+        if self._index is None:
+            with self._locked():  # So no booking made meanwhile on another thread is left out
+                if self._index is None:
+                    self._index = BookingIndex.rebuild(self._bookings_by_id.values())
+        return self._index.find(ticket_type, payment_method, fan_id, since, until)
+
+    def iter_bookings(self, ticket_type=None, since=None, until=None):
+        # Yield the records of the bookings of a ticket type and/or dates (since <= date < until) in the
+        # order they were made, one at a time: bookings the store has not loaded are streamed from it
+        # without being kept in memory
+        self._finish_loading(bookings=True)
+        if self._booking_count != len(self._bookings_by_id):
+            yield from self._store.iter_bookings(ticket_type, since, until)
+            return
+        low = to_timestamp(since) if since is not None else None
+        high = to_timestamp(until) if until is not None else None
+        for booking in list(self._bookings_by_id.values()):  # Bookings may be made meanwhile
+            if ticket_type is not None and booking.get_ticket_type() != ticket_type:
+                continue
+            timestamp = booking.get_timestamp()
+            if (low is None or timestamp >= low) and (high is None or timestamp < high):
+                yield booking.to_record()
+
+    def check_sales_summary(self):
+        # Recalculate the totals from every booking and return True if the running totals match
+        return self._sales.matches(SalesSummary.rebuild(self.view_all_bookings()))
+
+    def _finish_loading(self, bookings=False):
+        # Load what a lazy load_saved_data() left for later: users and tickets, and the bookings too
+        # if they are needed. Called before taking the store's lock, which brings in every change.
+        if self._users_pending or (bookings and self._bookings_pending):
+            with self._load_lock:
+                if self._loading:
+                    return  # The store is calling back into the system while it loads
+                self._loading = True
+                try:
+                    if self._users_pending:
+                        self._store.load(self, lazy=True)
+                        self._users_pending = False
+                    if bookings and self._bookings_pending:
+                        self._store.load_bookings(self)
+                        self._bookings_pending = False
+                finally:
+                    self._loading = False
+
+    def _reserve_booking_ids(self, count):
+        # Reserve a block of booking numbers for the ID allocator and return the first
+        if self._store:
+            return self._store.reserve_booking_ids(count)
+        with self._lock:
+            if self._next_number is None:
+                self._next_number = next_booking_number(self._bookings_by_id)
+            first = self._next_number
+            self._next_number += count
+            return first
+
+    def _skip_booking_ids(self, number):
+        # Make sure no booking number up to the given one is issued from now on, dropping the rest of
+        # this process's block in case it overlaps
+        first = self._reserve_booking_ids(1)
+        if first < number:
+            self._reserve_booking_ids(number - first)
+        self._ids = IdAllocator(self._reserve_booking_ids)
+
+    def _locked(self):
+        # Return a context manager that holds the store's lock (with the system brought up to date)
+        return self._store.lock() if self._store else self._lock
+
+    def _add_booking(self, booking):
+        # Keep a new booking in the booking indexes and the running totals
+        self._bookings_by_id[booking.get_booking_id()] = booking
+        self._count_booking(booking)
+
+    def _count_booking(self, booking):
+        # Add a new booking to the running totals without keeping it by ID (a store that loads bookings
+        # on demand fetches it again when it is needed)
+        self._booking_count += 1
+        self._sales.add(booking)
+        if self._analytics is not None:
+            self._analytics.add(booking)
+        if self._index is not None:
+            self._index.add(booking)
+        self._tickets[booking.get_ticket_id()].add_sold(booking.get_quantity())
+
+    def _remove_booking(self, booking):
+        # Take a cancelled booking out of the indexes, the fan's history and the running totals
+        self._bookings_by_id.pop(booking.get_booking_id(), None)  # Not there if it was only counted
+        self._booking_count -= 1
+        booking.get_fan().remove_booking(booking)
+        self._sales.remove(booking)
+        if self._analytics is not None:
+            self._analytics.remove(booking)
+        if self._index is not None:
+            self._index.remove(booking)
+        if booking.get_ticket_id() in self._tickets:
+            self._tickets[booking.get_ticket_id()].add_sold(-booking.get_quantity())
+
+    def _cache_user(self, user):
+        # Keep a user in the user indexes and link a fan to the bookings-by-fan index; returns the user
+        self._users[user.get_user_id()] = user
+        user.watch(self._user_changed)
+        if self._search is not None:
+            self._search.add(user)
+        if isinstance(user, Fan):
+            user.attach_history(self._bookings_by_fan)
+        return user
+
+    def _user_changed(self, user):
+        # Index a user again after its name or email changed
+        if self._search is not None:
+            self._search.update(user)
+
+    def _booking_from_record(self, record):
+        # Build a booking fetched from the store and keep it in the booking indexes
+        fan = self.get_user(record[1]) or Fan(record[1], "", "")  # The fan may have deleted the account
+        booking = Booking.from_record(record, fan, self._tickets[record[2]])
+        self._bookings_by_id[booking.get_booking_id()] = booking
+        return booking
+
+    def _find_fan_bookings(self, user_id):
+        # Fetch a fan's bookings from the store the first time their history is needed
+        self._finish_loading(bookings=True)
+        if user_id in self._bookings_by_fan:
+            return self._bookings_by_fan[user_id]  # Filed while the bookings were loading
+        if not self._store:
+            return []
+        return [self._bookings_by_id.get(record[0]) or self._booking_from_record(record)
+                for record in self._store.find_bookings_for_fan(user_id)]
+
+
+class BatchBookingError(ValueError):
+    """Raised by book_many when any request in a batch cannot be booked; nothing in the batch is booked."""
+
+    def __init__(self, errors):
+        # Keep the (request index, error message) pairs and build a readable message from them
+        super().__init__("; ".join(f"Request {index + 1}: {message}" for index, message in errors))
+        self.errors = errors
+
+
+class _BookingsByFan(dict):
+    """Bookings-by-fan index that asks the system for a fan's bookings the first time they are needed."""
+
+    def __init__(self, loader):
+        # Initialize the index with the function used to fetch a missing fan's bookings
+        super().__init__()
+        self._loader = loader
+        self.on_demand = False  # True when the store holds bookings that are not in memory
+
+    def __missing__(self, user_id):
+        # Fetch and keep the bookings of a fan not yet in the index
+        bookings = self[user_id] = self._loader(user_id)
+        return bookings
+
+    def add_booking(self, user_id, booking):
+        # File a new booking for a fan whose history has not been loaded yet
+        if user_id in self:
+            self[user_id].append(booking)
+        elif not self.on_demand:
+            self[user_id] = [booking]
+        # Otherwise the store returns it with the rest of the fan's bookings once it is saved
@@ -1,11 +1,38 @@
 class User:
     """Base class for all users in the system."""
 
+    __slots__ = ('_user_id', '_name', '_email', '_watcher')
+
     def __init__(self, user_id, name, email):
         # Initialize user attributes
         self._user_id = user_id
         self._name = name
         self._email = email
+        self._watcher = None  # Called with the user after its name or email changes (see watch())
+
+    @classmethod
+    def from_record(cls, record):
+        # Rebuild a saved user from its (user_id, name, email) record
+        return cls(*record)
+
+    def to_record(self):
+        # Return the (user_id, name, email) record used to save this user
+        return (self._user_id, self._name, self._email)
+
+    def __getstate__(self):
+        # Pickle the user's attributes as a dict (users have __slots__ rather than a __dict__)
+        return {name: getattr(self, name) for cls in type(self).__mro__
+                for name in getattr(cls, '__slots__', ()) if hasattr(self, name) and name != '_watcher'}
+
+    def __setstate__(self, state):
+        # Restore a pickled user, including one saved when users still had a __dict__
+        self._watcher = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def watch(self, watcher):
+        # Have watcher(user) called whenever the name or email changes (e.g. to keep a search index up to date)
+        self._watcher = watcher
 
     def get_user_id(self):
         # Return the user ID
@@ -18,6 +45,8 @@ class User:
     def set_name(self, name):
         # Set a new name for the user
         self._name = name
+        if self._watcher is not None:
+            self._watcher(self)
 
     def get_email(self):
         # Return the email address of the user
@@ -26,6 +55,8 @@ class User:
     def set_email(self, email):
         # Set a new email address for the user
         self._email = email
+        if self._watcher is not None:
+            self._watcher(self)
 
     def __str__(self):
         # Return a string representation of the User object
@@ -35,31 +66,85 @@ class User:
 class Fan(User):
     """A fan who can purchase tickets and manage bookings."""
 
+    __slots__ = ('_booking_history', '_history_index')
+
     def __init__(self, user_id, name, email):
         # Initialize fan attributes, including booking history
         super().__init__(user_id, name, email)
         self._booking_history = []  # Stores the booking history for the fan
+        self._history_index = None  # A system's bookings-by-fan index, used when history is loaded lazily
+
+    def __getstate__(self):
+        # Pickle the fan without its bookings; they are saved once, in the bookings file
+        state = super().__getstate__()
+        state['_booking_history'] = None
+        state['_history_index'] = None
+        return state
+
+    def __setstate__(self, state):
+        # Restore a pickled fan; its history is rebuilt from the bookings on first use
+        super().__setstate__(state)
+        self._booking_history = None
+        self._history_index = None
+
+    @classmethod
+    def from_record(cls, record):
+        # Rebuild a saved fan; its booking history is loaded from the system on first use
+        fan = super().from_record(record)
+        fan._booking_history = None
+        return fan
+
+    def attach_history(self, index):
+        # Link the fan to a system's bookings-by-fan index (user_id -> list of bookings, loading missing keys).
+        # Returns False if the fan already holds its history in memory, which then becomes the index entry.
+        if self._booking_history is None:
+            self._history_index = index
+            return True
+        index[self._user_id] = self._booking_history
+        return False
 
     def add_booking(self, booking):
         # Add a booking to the fan's booking history
-        self._booking_history.append(booking)
+        if self._booking_history is None and self._history_index is not None:
+            # History not loaded yet: let the index file the booking without loading the rest
+            self._history_index.add_booking(self._user_id, booking)
+        else:
+            self.get_booking_history().append(booking)
+
+    def remove_booking(self, booking):
+        # Remove a cancelled booking from the fan's booking history
+        history = self.get_booking_history()
+        if booking in history:
+            history.remove(booking)
 
     def get_booking_history(self):
-        # Return the fan's booking history as a list
+        # Return the fan's booking history as a list, taking it from the index the first time
+        if self._booking_history is None:
+            if self._history_index is None:
+                self._booking_history = []
+            else:
+                self._booking_history = self._history_index[self._user_id]
         return self._booking_history
 
     def view_account_details(self):
         # Return a summary of the fan's account details
-        return f"Fan Account - Name: {self._name}, Email: {self._email}, Bookings: {len(self._booking_history)}"
+        return self.account_details(len(self.get_booking_history()))
+
+    def account_details(self, booking_count):
+        # Return the account summary for a booking count already known (e.g. the total of a page of
+        # the booking history), without loading the whole history to count it
+        return f"Fan Account - Name: {self._name}, Email: {self._email}, Bookings: {booking_count}"
 
     def __str__(self):
         # Return a string representation of the Fan object, including booking count
-        return f"Fan: {super().__str__()} | Bookings: {len(self._booking_history)}"
+        return f"Fan: {super().__str__()} | Bookings: {len(self.get_booking_history())}"
 
 
 class Admin(User):
     """Admin user who can view ticket sales."""
 
+    __slots__ = ()
+
     def __init__(self, user_id, name, email):
         # Initialize admin attributes
         super().__init__(user_id, name, email)
@@ -67,3 +152,8 @@ class Admin(User):
     def __str__(self):
         # Return a string representation of the Admin object
         return f"Admin: {super().__str__()}"
+
+
+# Role saved for each user class, and the class rebuilt for each role
+ROLES = {Fan: "fan", Admin: "admin", User: "user"}
+CLASSES = {role: cls for cls, role in ROLES.items()}
@@ -0,0 +1,157 @@
+import re
+from array import array
+
+
+WORD = re.compile(r"\w+")  # Names and emails are split into words at spaces, dots, @ and so on
+
+
+class UserSearchIndex:
+    """Word and n-gram index over users' names and emails, for search-as-you-type.
+
+    Every user gets a slot number, and each word of the lower-cased name and email maps to the array
+    of slots whose text has it. The words themselves (far fewer than users: names repeat) are indexed
+    by their 3-character grams and by their first and last 1 and 2 characters. A query is split into
+    words the same way; each one must be a whole word, the start or end of a word, or (for a query
+    that is a single word) any part of one, depending on where it sits in the query. The query word
+    whose matching words hold the fewest users is the one looked up, and each of those users is
+    checked against the whole query, stopping once there are enough.
+
+    A query of 1 or 2 characters matches the start of a word rather than anywhere in one.
+    Removing a user only frees its slot; a user whose name or email changed moves to a new slot.
+    The index is rebuilt once most of the slots it points to are free.
+    """
+
+    def __init__(self):
+        # Start with no users
+        self._users = []  # slot -> User, or None once the slot is freed
+        self._slots = {}  # user_id -> slot
+        self._words = {}  # word -> array of slots, in increasing order
+        self._grams = {}  # gram, '^' + first 1-2 characters or '$' + last 1-2 characters -> [words]
+        self._free = 0  # Number of freed slots
+
+    @classmethod
+    def rebuild(cls, users):
+        # Build the index for the given users
+        index = cls()
+        for user in users:
+            index.add(user)
+        return index
+
+    def __len__(self):
+        # Return the number of users in the index
+        return len(self._slots)
+
+    def add(self, user):
+        # Index a new user (or one whose name or email changed)
+        if user.get_user_id() in self._slots:
+            self._free_slot(user.get_user_id())
+        slot = len(self._users)
+        self._users.append(user)
+        self._slots[user.get_user_id()] = slot
+        words = self._words
+        for word in set(WORD.findall(_text(user))):
+            slots = words.get(word)
+            if slots is None:
+                slots = words[word] = array('i')
+                self._add_word(word)
+            slots.append(slot)
+
+    def update(self, user):
+        # Index a user again after set_name() or set_email()
+        if user.get_user_id() in self._slots:
+            self.add(user)
+
+    def remove(self, user_id):
+        # Take a deleted user out of the index
+        if user_id in self._slots:
+            self._free_slot(user_id)
+            if self._free > max(len(self._slots), 1000):
+                self._compact()
+
+    def search(self, query, limit=50):
+        # Return up to limit users whose name or email contains the query (for 1 or 2 characters:
+        # has a word starting with it)
+        query = query.strip().lower()
+        tokens = list(WORD.finditer(query))
+        if not tokens:
+            return []
+        if len(query) < 3:
+            matches = lambda text: any(word.startswith(query) for word in WORD.findall(text))
+            words = self._matching_words(query, True, False)
+        else:
+            matches = lambda text: query in text
+            words = self._most_selective([self._matching_words(token.group(), token.start() > 0,
+                                                               token.end() < len(query)) for token in tokens])
+        found = []
+        seen = set()
+        users = self._users
+        for word in words:
+            for slot in self._words[word]:
+                user = users[slot]
+                if user is not None and slot not in seen:
+                    seen.add(slot)
+                    if matches(_text(user)):
+                        found.append(user)
+                        if len(found) == limit:
+                            return found
+        return found
+
+    def _most_selective(self, candidates):
+        # Return the list of words (one per query word) that points to the fewest users, counting
+        # each list only until it is known to point to more than the best one so far
+        best, best_count = None, None
+        for words in sorted(candidates, key=len):
+            if best_count is not None and len(words) >= best_count:
+                break  # Every word points to at least one user, so this list and the rest cannot win
+            count = 0
+            for word in words:
+                count += len(self._words[word])
+                if best_count is not None and count >= best_count:
+                    break
+            else:
+                best, best_count = words, count
+        return best
+
+    def _matching_words(self, token, starts_word, ends_word):
+        # Return the indexed words a query word can be part of: the word itself if the query has
+        # something either side of it, a word it starts or ends, or any word containing it
+        if starts_word and ends_word:
+            return [token] if token in self._words else []
+        if len(token) < 3:
+            return self._grams.get(("^" if starts_word or not ends_word else "$") + token, [])
+        candidates = min((self._grams.get(token[i:i + 3], []) for i in range(len(token) - 2)), key=len)
+        if starts_word:
+            return [word for word in candidates if word.startswith(token)]
+        if ends_word:
+            return [word for word in candidates if word.endswith(token)]
+        return [word for word in candidates if token in word]
+
+    def _add_word(self, word):
+        # Index a word seen for the first time by its grams, start and end
+        grams = self._grams
+        keys = {word[i:i + 3] for i in range(len(word) - 2)}
+        keys.update(("^" + word[:1], "^" + word[:2], "$" + word[-1:], "$" + word[-2:]))
+        for key in keys:
+            words = grams.get(key)
+            if words is None:
+                grams[key] = [word]
+            else:
+                words.append(word)
+
+    def _free_slot(self, user_id):
+        # Free a user's slot; the word arrays still point at it until the index is rebuilt
+        slot = self._slots.pop(user_id)
+        self._users[slot] = None
+        self._free += 1
+
+    def _compact(self):
+        # Rebuild the index with only the slots still in use
+        users = [user for user in self._users if user is not None]
+        self.__init__()
+        for user in users:
+            self.add(user)
+
+
+def _text(user):
+    # Return the lower-cased name and email a user is searched by
+    return f"{user.get_name()}\n{user.get_email()}".lower()
@@ -0,0 +1,175 @@
+import os
+import pickle
+import struct
+import zlib
+
+from user import ROLES, CLASSES
+
+
+HEADER = struct.Struct('<II')  # Length and CRC-32 of the record that follows
+
+
+class UserStore:
+    """Users saved as one record each in an append-only segment file, indexed by user ID.
+
+    Changes are collected in memory (put() and delete() only mark a user dirty) and flush() appends
+    just the dirty users' records in a single write, however many users there are. Every record
+    carries its length and checksum, so a crash mid-write can only tear the last records written;
+    those are dropped when the file is next opened and every other user reads back intact. Once
+    most records are out of date the live ones are copied to a new file, which replaces the old
+    one atomically.
+    """
+
+    def __init__(self, filename, fsync=True):
+        # Initialize the store and index the records already in the file
+        self._filename = filename
+        self._fsync = fsync
+        self._index = {}  # user_id -> (offset, length) of its latest record
+        self._dead = 0  # Records replaced by a later record for the same user
+        self._dirty = {}  # user_id -> User, or None if deleted, not written yet
+        self._stat = None  # (inode, size) of the file as last indexed
+        self._scan()
+
+    def exists(self):
+        # Return True if the segment file has been created
+        return os.path.exists(self._filename)
+
+    def load_all(self):
+        # Return every user in the file, as saved (changes not flushed yet are not included)
+        users = []
+        if not self._index:
+            return users
+        with open(self._filename, 'rb') as f:
+            for offset, length in sorted(self._index.values()):
+                f.seek(offset)
+                users.append(_user_from_payload(f.read(length)))
+        return users
+
+    def get(self, user_id):
+        # Return the user with the given ID, reading only its record, or None if there is none
+        if user_id in self._dirty:
+            return self._dirty[user_id]
+        position = self._index.get(user_id)
+        if position is None:
+            return None
+        with open(self._filename, 'rb') as f:
+            f.seek(position[0])
+            return _user_from_payload(f.read(position[1]))
+
+    def put(self, user):
+        # Mark a new or changed user to be written by the next flush()
+        self._dirty[user.get_user_id()] = user
+
+    def delete(self, user_id):
+        # Mark a user to be deleted by the next flush()
+        self._dirty[user_id] = None
+
+    def is_dirty(self):
+        # Return True if there are changes not written yet
+        return bool(self._dirty)
+
+    def clear_dirty(self):
+        # Forget the unwritten changes (e.g. another process has already written the same ones)
+        self._dirty.clear()
+
+    def flush(self):
+        # Append a record for each dirty user with a single write, then compact the file if
+        # most of it is out of date. The caller must keep other processes from writing meanwhile.
+        if not self._dirty:
+            return
+        if self._stat != _stat(self._filename):
+            self._scan()  # Another process has written to the file since it was indexed
+        records = []
+        for user_id, user in self._dirty.items():
+            if user is None and user_id not in self._index:
+                continue  # Never saved, so there is nothing to delete
+            payload = pickle.dumps(_payload(user_id, user), pickle.HIGHEST_PROTOCOL)
+            records.append((user_id, user, payload))
+        with open(self._filename, 'ab') as f:
+            offset = f.tell()
+            f.write(b"".join(HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+                             for _, _, payload in records))
+            f.flush()
+            if self._fsync:
+                os.fsync(f.fileno())
+        for user_id, user, payload in records:
+            offset += HEADER.size
+            if user_id in self._index:
+                self._dead += 1
+            if user is None:
+                del self._index[user_id]
+                self._dead += 1  # The deletion record itself
+            else:
+                self._index[user_id] = (offset, len(payload))
+            offset += len(payload)
+        self._dirty.clear()
+        self._stat = _stat(self._filename)
+        if self._dead > max(len(self._index), 1000):
+            self.compact()
+
+    def compact(self):
+        # Copy the latest record of every user to a new file and swap it in atomically
+        tmp = self._filename + '.tmp'
+        index = {}
+        with open(self._filename, 'rb') as old, open(tmp, 'wb') as new:
+            for user_id, (offset, length) in sorted(self._index.items(), key=lambda item: item[1]):
+                old.seek(offset - HEADER.size)
+                new.write(old.read(HEADER.size + length))
+                index[user_id] = (new.tell() - length, length)
+            new.flush()
+            os.fsync(new.fileno())
+        os.replace(tmp, self._filename)
+        self._index = index
+        self._dead = 0
+        self._stat = _stat(self._filename)
+
+    def _scan(self):
+        # Index the latest record of every user, cutting off a torn record left by a crash
+        self._index = {}
+        self._dead = 0
+        if not os.path.exists(self._filename):
+            self._stat = None
+            return
+        with open(self._filename, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset + HEADER.size <= len(data):
+            length, crc = HEADER.unpack_from(data, offset)
+            payload = data[offset + HEADER.size:offset + HEADER.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            user_id, role = pickle.loads(payload)[:2]
+            if user_id in self._index:
+                self._dead += 1
+            if role is None:
+                self._index.pop(user_id, None)
+                self._dead += 1
+            else:
+                self._index[user_id] = (offset + HEADER.size, length)
+            offset += HEADER.size + length
+        if offset < len(data):
+            with open(self._filename, 'r+b') as f:
+                f.truncate(offset)
+        self._stat = _stat(self._filename)
+
+
+def _payload(user_id, user):
+    # Return the (user_id, role, name, email) record saved for a user, or (user_id, None) for a deletion
+    if user is None:
+        return (user_id, None)
+    return (user_id, ROLES[type(user)]) + user.to_record()[1:]
+
+
+def _user_from_payload(payload):
+    # Rebuild a user from a saved record
+    user_id, role, *fields = pickle.loads(payload)
+    return CLASSES[role].from_record((user_id, *fields))
+
+
+def _stat(filename):
+    # Return (inode, size) of a file, or None if it does not exist
+    try:
+        st = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size
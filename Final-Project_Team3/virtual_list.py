@@ -0,0 +1,92 @@
+import tkinter as tk
+
+
+class VirtualList(tk.Frame):
+    """Scrolling list that only creates widgets for the rows on screen.
+
+    Rows are fetched a page at a time with fetch_page(offset, limit), which returns (rows, total),
+    and the same few labels are reused as the list scrolls, so scrolling through any number of
+    rows costs the same as showing one screenful.
+    """
+
+    MAX_PAGES = 20  # Pages kept in memory before the cache starts again
+
+    def __init__(self, master, fetch_page, visible_rows=6, page_size=50, row_lines=3, wraplength=480):
+        # Build the labels for one screenful of rows and show the first rows
+        super().__init__(master)
+        self._fetch_page = fetch_page
+        self._page_size = page_size
+        self._pages = {}  # page number -> rows
+        self._first = 0  # Index of the row at the top of the list
+        self._total = 0
+        self._fetch(0)
+        self._visible = max(min(visible_rows, self._total), 1)
+
+        self._scrollbar = tk.Scrollbar(self, command=self.yview)
+        self._scrollbar.pack(side="right", fill="y")
+        self._labels = []
+        for _ in range(self._visible):
+            label = tk.Label(self, height=row_lines, wraplength=wraplength, justify="left", anchor="nw")
+            label.pack(fill="x", anchor="w", padx=15, pady=2)
+            self._labels.append(label)
+        for widget in [self] + self._labels:
+            widget.bind("<MouseWheel>", self._on_wheel)  # Windows and macOS
+            widget.bind("<Button-4>", lambda event: self.yview("scroll", -1, "units"))  # X11
+            widget.bind("<Button-5>", lambda event: self.yview("scroll", 1, "units"))
+        self._render()
+
+    def get_total(self):
+        # Return the number of rows in the list
+        return self._total
+
+    def refresh(self):
+        # Fetch the rows again (e.g. after a booking was made or cancelled) and redraw
+        self._pages.clear()
+        self._fetch(self._first // self._page_size)
+        self._first = max(min(self._first, self._total - self._visible), 0)
+        self._render()
+
+    def yview(self, *args):
+        # Scroll as the scrollbar asks: ("moveto", fraction) or ("scroll", count, "units" or "pages")
+        if args[0] == "moveto":
+            first = int(float(args[1]) * self._total)
+        elif args[2] == "pages":
+            first = self._first + int(args[1]) * self._visible
+        else:
+            first = self._first + int(args[1])
+        first = max(min(first, self._total - self._visible), 0)
+        if first != self._first:
+            self._first = first
+            self._render()
+
+    def _on_wheel(self, event):
+        # Scroll three rows per mouse wheel notch
+        self.yview("scroll", -3 if event.delta > 0 else 3, "units")
+
+    def _render(self):
+        # Show the rows from the top row down, fetching any page not in the cache
+        for i, label in enumerate(self._labels):
+            row = self._row(self._first + i)
+            label.config(text=str(row) if row is not None else "")
+        if self._total:
+            self._scrollbar.set(self._first / self._total, (self._first + self._visible) / self._total)
+        else:
+            self._scrollbar.set(0, 1)
+
+    def _row(self, index):
+        # Return the row at the given index, or None past the end of the list
+        if index >= self._total:
+            return None
+        rows = self._pages.get(index // self._page_size)
+        if rows is None:
+            rows = self._fetch(index // self._page_size)
+        offset = index % self._page_size
+        return rows[offset] if offset < len(rows) else None
+
+    def _fetch(self, page):
+        # Fetch one page of rows and keep it in the cache, updating the total
+        if len(self._pages) >= self.MAX_PAGES:
+            self._pages.clear()
+        rows, self._total = self._fetch_page(page * self._page_size, self._page_size)
+        self._pages[page] = rows
+        return rows